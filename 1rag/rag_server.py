@@ -13,6 +13,8 @@ import logging
 current_dir = Path(__file__).parent
 sys.path.append(str(current_dir))
 
+from utils.tracing import tracer, new_request_id
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -66,76 +68,95 @@ def initialize_rag():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'rag_initialized': rag_manager is not None
-    })
+    """Health check endpoint (RAGBridge gọi trước mỗi query khi circuit breaker half-open)"""
+    # Span ngoài trace: chỉ vào histogram health_check của /rag/metrics, không ghi một dòng sink cho mỗi lần kiểm tra
+    with tracer.span("health_check"):
+        response = jsonify({
+            'status': 'healthy',
+            'rag_initialized': rag_manager is not None
+        })
+    request_id = request.headers.get('X-Request-ID')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
 
 @app.route('/rag/query', methods=['POST'])
 def rag_query():
     """RAG query endpoint"""
+    # Request ID do RAGBridge gửi sang, hoặc tự sinh nếu gọi trực tiếp
+    request_id = request.headers.get('X-Request-ID') or new_request_id()
+    
+    with tracer.trace(request_id):
+        payload, status_code = process_rag_query(request_id)
+        with tracer.span("serialization"):
+            payload['request_id'] = request_id
+            response = jsonify(payload)
+    
+    response.status_code = status_code
+    response.headers['X-Request-ID'] = request_id
+    return response
+
+def process_rag_query(request_id: str):
+    """Xử lý RAG query, trả về (payload, status_code)"""
     try:
-        data = request.json
-        logger.info(f"📥 /rag/query received request: {data}")
+        data = request.get_json(silent=True)
+        logger.info(f"📥 [{request_id}] /rag/query received request: {data}")
         
         if not data or 'query' not in data:
-            logger.warning("❌ Missing query parameter in request")
-            return jsonify({
+            logger.warning(f"❌ [{request_id}] Missing query parameter in request")
+            return {
                 'error': 'Missing query parameter'
-            }), 400
+            }, 400
         
         query = data['query']
-        logger.info(f"🔍 Processing RAG query: {query}")
         
         if not rag_manager:
-            logger.warning("⚠️ RAG manager not available, returning fallback")
+            logger.warning(f"⚠️ [{request_id}] RAG manager not available, returning fallback")
             # Return error if no RAG system available
-            return jsonify({
+            return {
                 'error': 'RAG system not available',
                 'response': get_fallback_response(query),
                 'source': 'fallback',
                 'status': 'partial_success'
-            }), 503
+            }, 503
         
         # Process with RAG system
         try:
             # Check if it's advanced RAG manager
             if hasattr(rag_manager, 'generate_response'):
-                logger.info("🤖 Using Advanced RAG manager")
                 response = rag_manager.generate_response(query)
                 source = 'advanced_rag'
             else:
                 # Simple RAG manager
-                logger.info("📄 Using Simple RAG manager")
-                context = rag_manager.get_relevant_context(query)
+                with tracer.span("keyword_search"):
+                    context = rag_manager.get_relevant_context(query)
                 response = generate_simple_response(query, context)
                 source = 'simple_rag'
             
-            logger.info(f"✅ RAG response generated successfully (source: {source})")
-            return jsonify({
+            logger.info(f"✅ [{request_id}] RAG response generated successfully (source: {source})")
+            return {
                 'response': response,
                 'source': source,
                 'status': 'success'
-            })
+            }, 200
             
         except Exception as e:
-            logger.error(f"❌ Error in RAG processing: {e}")
+            logger.error(f"❌ [{request_id}] Error in RAG processing: {e}")
             # Fallback to simple response
             fallback_response = get_fallback_response(query)
-            return jsonify({
+            return {
                 'response': fallback_response,
                 'source': 'fallback',
                 'status': 'partial_success',
                 'error': f"RAG error: {str(e)}"
-            })
+            }, 200
         
     except Exception as e:
-        logger.error(f"❌ Error processing RAG query: {e}")
-        return jsonify({
+        logger.error(f"❌ [{request_id}] Error processing RAG query: {e}")
+        return {
             'error': str(e),
             'status': 'error'
-        }), 500
+        }, 500
 
 def generate_simple_response(query: str, context: str) -> str:
     """Generate response using simple template with context"""
@@ -261,6 +282,11 @@ def rag_status():
             'error': 'RAG manager not available'
         })
 
+@app.route('/rag/metrics', methods=['GET'])
+def rag_metrics():
+    """Histogram độ trễ theo từng span (health check, embedding, FAISS, LLM...)"""
+    return jsonify(tracer.get_metrics())
+
 @app.route('/rag/rebuild', methods=['POST'])
 def rebuild_knowledge_base():
     """Rebuild knowledge base index"""
@@ -351,6 +377,7 @@ if __name__ == '__main__':
     print("🔍 Health check: http://localhost:5001/health")
     print("❓ RAG query: POST http://localhost:5001/rag/query")
     print("📊 RAG status: http://localhost:5001/rag/status")
+    print("⏱️ RAG metrics: http://localhost:5001/rag/metrics")
     print("🔄 Rebuild index: POST http://localhost:5001/rag/rebuild")
     print("🔍 Check changes: GET http://localhost:5001/rag/check")
     
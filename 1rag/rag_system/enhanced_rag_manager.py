@@ -12,6 +12,8 @@ import json
 import time
 from dotenv import load_dotenv
 
+from utils.tracing import tracer
+
 # Load environment variables from parent directory
 load_dotenv(Path(__file__).parent.parent / '.env')
 
@@ -470,14 +472,18 @@ try:
                     logger.error("Vector store not initialized")
                     return []
                 
-                logger.info(f"Searching for: '{query}' (top_k={top_k})")
-                docs = self.vector_store.similarity_search(query, k=top_k)
+                logger.debug(f"Searching for: '{query}' (top_k={top_k})")
+                with tracer.span("embedding"):
+                    query_embedding = self.embeddings.embed_query(query)
+                with tracer.span("faiss_search", top_k=top_k):
+                    docs = self.vector_store.similarity_search_by_vector(query_embedding, k=top_k)
                 
-                logger.info(f"Found {len(docs)} documents")
-                for i, doc in enumerate(docs):
-                    metadata = doc.metadata
-                    preview = doc.page_content[:100].replace('\n', ' ')
-                    logger.info(f"  Doc {i+1}: {metadata.get('filename', 'unknown')} - {preview}...")
+                logger.debug(f"Found {len(docs)} documents")
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, doc in enumerate(docs):
+                        metadata = doc.metadata
+                        preview = doc.page_content[:100].replace('\n', ' ')
+                        logger.debug(f"  Doc {i+1}: {metadata.get('filename', 'unknown')} - {preview}...")
                 
                 return docs
                 
@@ -495,22 +501,18 @@ try:
                     logger.warning(f"No relevant docs found for query: {query}")
                     return "Tôi không tìm thấy thông tin về vấn đề này trong cơ sở dữ liệu."
                 
-                # Prepare context with more content
-                context_parts = []
-                for i, doc in enumerate(relevant_docs[:3]):
-                    doc_content = doc.page_content[:600]  
-                    context_parts.append(f"[Tài liệu {i+1}]: {doc_content}")
-                
-                context = "\n\n".join(context_parts)
-                
-                # Log for debugging
-                logger.info(f"Found {len(relevant_docs)} relevant docs for query: '{query}'")
-                logger.info(f"Context length: {len(context)} characters")
-                logger.debug(f"Context preview: {context[:200]}...")
-                
-                # Create improved prompt template
-                prompt_template = PromptTemplate(
-                    template="""Bạn là chatbot tư vấn của Trường Đại học Cần Thơ với kiến thức về quy định, chính sách và thông tin của trường. 
+                with tracer.span("context_build"):
+                    # Prepare context with more content
+                    context_parts = []
+                    for i, doc in enumerate(relevant_docs[:3]):
+                        doc_content = doc.page_content[:600]  
+                        context_parts.append(f"[Tài liệu {i+1}]: {doc_content}")
+                    
+                    context = "\n\n".join(context_parts)
+                    
+                    # Create improved prompt template
+                    prompt_template = PromptTemplate(
+                        template="""Bạn là chatbot tư vấn của Trường Đại học Cần Thơ với kiến thức về quy định, chính sách và thông tin của trường. 
 {context}
 
 Sinh viên hỏi: {query}
@@ -522,12 +524,18 @@ Hãy trả lời một cách tự nhiên. Không đề cập đến việc "dự
 - Trả lời ngắn gọn nhưng đầy đủ thông tin
 
 """,
-                    input_variables=["context", "query"]
-                )
+                        input_variables=["context", "query"]
+                    )
+                    prompt = prompt_template.format(context=context, query=query)
+                
+                # Log for debugging
+                logger.debug(f"Found {len(relevant_docs)} relevant docs for query: '{query}'")
+                logger.debug(f"Context length: {len(context)} characters")
+                logger.debug(f"Context preview: {context[:200]}...")
                 
                 # Generate response
-                prompt = prompt_template.format(context=context, query=query)
-                response = self.llm.invoke(prompt)
+                with tracer.span("llm_call"):
+                    response = self.llm.invoke(prompt)
                 
                 return response.content
                 
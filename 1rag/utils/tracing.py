@@ -0,0 +1,169 @@
+"""
+Tracing nhẹ cho từng request RAG: span theo request ID, sink JSON-lines và histogram độ trễ
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Biên các bucket histogram (ms)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("rag_current_trace", default=None)
+
+
+def new_request_id() -> str:
+    """Sinh request ID mới"""
+    return uuid.uuid4().hex
+
+
+class LatencyHistogram:
+    """Histogram độ trễ với bucket cố định"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        self.bucket_counts[bisect_left(self.buckets, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, q: float) -> float:
+        """Ước lượng percentile bằng cận trên của bucket chứa nó"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{b}": c for b, c in zip(self.buckets, self.bucket_counts)}
+        buckets["le_inf"] = self.bucket_counts[-1]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": buckets,
+        }
+
+
+class Trace:
+    """Các span của một request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+
+class Tracer:
+    """Ghi span ra file JSON-lines và tổng hợp histogram theo tên span"""
+
+    def __init__(self, sink_path: Optional[str] = None):
+        self.sink_path = Path(sink_path or os.getenv("RAG_TRACE_FILE", "data/traces.jsonl"))
+        self.enabled = os.getenv("RAG_TRACING", "1") != "0"
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.lock = threading.Lock()
+        self._sink = None
+
+    @contextmanager
+    def trace(self, request_id: Optional[str] = None):
+        """Mở trace cho một request; các span bên trong được gắn vào request ID này"""
+        trace = Trace(request_id or new_request_id())
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self._record(trace, trace.elapsed_ms())
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Đo thời gian một đoạn xử lý"""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            trace = _current_trace.get()
+            if trace is not None:
+                span = {"name": name, "duration_ms": round(duration_ms, 3)}
+                if attributes:
+                    span["attributes"] = attributes
+                if error:
+                    span["error"] = error
+                trace.spans.append(span)
+            else:
+                with self.lock:
+                    self._observe(name, duration_ms)
+
+    def current_request_id(self) -> Optional[str]:
+        trace = _current_trace.get()
+        return trace.request_id if trace else None
+
+    def _observe(self, name: str, duration_ms: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.observe(duration_ms)
+
+    def _record(self, trace: Trace, total_ms: float):
+        with self.lock:
+            for span in trace.spans:
+                self._observe(span["name"], span["duration_ms"])
+            self._observe("total", total_ms)
+
+            if not self.enabled:
+                return
+            record = {
+                "request_id": trace.request_id,
+                "timestamp": trace.started_at,
+                "total_ms": round(total_ms, 3),
+                "spans": trace.spans,
+            }
+            try:
+                if self._sink is None:
+                    self.sink_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._sink = open(self.sink_path, "a", encoding="utf-8", buffering=1)
+                self._sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                self.enabled = False
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Histogram độ trễ theo từng span"""
+        with self.lock:
+            return {
+                "sink": str(self.sink_path),
+                "spans": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+
+# Global tracer instance
+tracer = Tracer()
@@ -0,0 +1,146 @@
+"""
+Lịch học kỳ / tuần học dùng chung cho backend và chatbot (chỉ dùng thư viện chuẩn)
+Bảng (nam_hoc, hoc_ky) -> tuần -> khoảng ngày được tính một lần rồi cache,
+tra ngày -> tuần là O(1) qua dict theo ngày thứ Hai của tuần
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Tăng khi quy tắc chia tuần thay đổi để client bỏ cache cũ
+CALENDAR_VERSION = 1
+
+# Tuần ISO của từng học kỳ
+WEEK_RANGES = {
+    "HK1": range(37, 52),  # tuần 37–51
+    "HK2": range(1, 18),   # tuần 1–17
+    "HK3": range(20, 35),  # tuần 20–34
+}
+
+DAY_NAMES = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "CN"]
+PERIODS = ["Sáng", "Chiều", "Tối"]
+# Giờ bắt đầu/kết thúc của từng ca (xuất lịch, xác định tiết học tiếp theo)
+PERIOD_START_TIMES = {"Sáng": time(7, 0), "Chiều": time(13, 0), "Tối": time(18, 0)}
+PERIOD_END_TIMES = {"Sáng": time(11, 30), "Chiều": time(17, 0), "Tối": time(21, 0)}
+
+# Giá trị cho thứ/ca không nằm trong danh sách chuẩn, xếp sau cùng
+UNKNOWN_SLOT_INDEX = 9
+
+
+class WeekInfo(NamedTuple):
+    week: int          # số tuần ISO, khớp cột schedule_items.week
+    hoc_ky_week: int   # tuần thứ mấy trong học kỳ
+    start_date: date
+    end_date: date
+
+    def to_dict(self) -> Dict:
+        return {
+            "week": self.week,
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat(),
+            "hoc_ky_week": self.hoc_ky_week,
+        }
+
+
+def term_year(hoc_ky: str, nam_hoc: int) -> int:
+    """Năm dương lịch chứa các tuần của học kỳ (HK1 thuộc nam_hoc, HK2/HK3 thuộc năm sau)"""
+    return nam_hoc if hoc_ky == "HK1" else nam_hoc + 1
+
+
+def get_start_date_of_week(year: int, week: int) -> date:
+    # Theo chuẩn ISO: tuần 1 chứa ngày 4/1
+    return date.fromisocalendar(year, week, 1)
+
+
+def day_name(d: date) -> str:
+    return DAY_NAMES[d.weekday()]
+
+
+@lru_cache(maxsize=None)
+def get_term_weeks(nam_hoc: int, hoc_ky: str) -> Tuple[WeekInfo, ...]:
+    """Danh sách tuần của học kỳ; rỗng nếu học kỳ không hợp lệ"""
+    if hoc_ky not in WEEK_RANGES:
+        return ()
+    year = term_year(hoc_ky, nam_hoc)
+    weeks = []
+    for i, week in enumerate(WEEK_RANGES[hoc_ky]):
+        start = get_start_date_of_week(year, week)
+        weeks.append(WeekInfo(week, i + 1, start, start + timedelta(days=6)))
+    return tuple(weeks)
+
+
+@lru_cache(maxsize=None)
+def _weeks_by_monday(nam_hoc: int, hoc_ky: str) -> Dict[date, WeekInfo]:
+    return {info.start_date: info for info in get_term_weeks(nam_hoc, hoc_ky)}
+
+
+def weeks_payload(nam_hoc: int, hoc_ky: str) -> List[Dict]:
+    """Dữ liệu trả về của GET /weeks/"""
+    return [info.to_dict() for info in get_term_weeks(nam_hoc, hoc_ky)]
+
+
+def week_for_date(d: date, hoc_ky: str, nam_hoc: int) -> Optional[WeekInfo]:
+    """Tuần học chứa ngày d trong học kỳ, None nếu ngày nằm ngoài học kỳ"""
+    return _weeks_by_monday(nam_hoc, hoc_ky).get(d - timedelta(days=d.weekday()))
+
+
+def current_semester(d: Optional[date] = None) -> Tuple[str, int]:
+    """Học kỳ và năm học theo tháng: 9-1 là HK1, 2-6 là HK2, 7-8 là HK3 (học hè)"""
+    d = d or date.today()
+    if d.month >= 9:
+        return "HK1", d.year
+    if d.month == 1:
+        return "HK1", d.year - 1
+    if d.month <= 6:
+        return "HK2", d.year - 1
+    return "HK3", d.year - 1
+
+
+def lookup(d: date) -> Optional[Dict]:
+    """Học kỳ, năm học và tuần chứa ngày d; None nếu ngày rơi vào tuần nghỉ giữa các học kỳ"""
+    iso_year = d.isocalendar()[0]
+    # Ngày thuộc năm học iso_year (HK1) hoặc iso_year - 1 (HK2, HK3)
+    for hoc_ky, nam_hoc in (("HK1", iso_year), ("HK2", iso_year - 1), ("HK3", iso_year - 1)):
+        info = week_for_date(d, hoc_ky, nam_hoc)
+        if info is not None:
+            return {
+                "date": d.isoformat(),
+                "day": day_name(d),
+                "hoc_ky": hoc_ky,
+                "nam_hoc": nam_hoc,
+                **info.to_dict(),
+            }
+    return None
+
+
+def slot_key(week: int, day: str, period: str) -> int:
+    """Khóa sắp xếp của một tiết trong học kỳ: tuần * 100 + thứ * 10 + ca"""
+    day_idx = DAY_NAMES.index(day) if day in DAY_NAMES else UNKNOWN_SLOT_INDEX
+    period_idx = PERIODS.index(period) if period in PERIODS else UNKNOWN_SLOT_INDEX
+    return week * 100 + day_idx * 10 + period_idx
+
+
+def current_slot_key(hoc_ky: str, nam_hoc: int, now: Optional[datetime] = None) -> Optional[int]:
+    """
+    Slot key nhỏ nhất còn "sắp tới" tại thời điểm now trong học kỳ
+    Ca chưa kết thúc vẫn tính là sắp tới; None nếu học kỳ đã qua
+    """
+    now = now or datetime.now()
+    iso_year, iso_week, _ = now.isocalendar()
+    year = term_year(hoc_ky, nam_hoc)
+    if iso_year > year:
+        return None
+    if iso_year < year:
+        return 0
+    period_idx = next(
+        (i for i, p in enumerate(PERIODS) if now.time() < PERIOD_END_TIMES[p]),
+        len(PERIODS)  # Đã hết các ca trong ngày: nhỏ hơn mọi slot của ngày hôm sau
+    )
+    return iso_week * 100 + now.weekday() * 10 + period_idx
+
+
+def date_of_slot(hoc_ky: str, nam_hoc: int, week: int, day: str) -> Optional[date]:
+    """Ngày dương lịch của (tuần, thứ) trong học kỳ"""
+    if day not in DAY_NAMES:
+        return None
+    return get_start_date_of_week(term_year(hoc_ky, nam_hoc), week) + timedelta(days=DAY_NAMES.index(day))
@@ -1,19 +1,17 @@
 # Enhanced Analytics and Performance Monitoring Backend
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, text
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any
-import asyncio
+from sqlalchemy import func
+from typing import Dict, List, Any
 import json
 import logging
-from collections import defaultdict
 
-from ..database import get_db
-from ..auth import get_current_user
-from ..models import *
-from ..core.response_handler import success_response, error_response
+from database import get_db
+from auth import get_current_user
+from models import Class, CoSoLienKet, Room, ScheduleItem, Student, Teacher, TrainingProgram, User
+from core.response_handler import ResponseHandler
+from core.optimization import cached
+import academic_calendar
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,55 +19,60 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
+# Thống kê dashboard được cache 5 phút; hết hạn thì vẫn trả bản cũ thêm 2 phút trong khi một tác vụ nền tính lại,
+# nên các request đồng thời không cùng chạy lại toàn bộ truy vấn
+DASHBOARD_STATS_TTL = 300
+DASHBOARD_STATS_STALE_TTL = 120
+DASHBOARD_STATS_TAG = "analytics:dashboard"
+
+# Số ca học mỗi tuần của một phòng (3 ca x 6 ngày), dùng để tính tỷ lệ sử dụng phòng trong học kỳ
+SLOTS_PER_WEEK = len(academic_calendar.PERIODS) * 6
+
+# Hàm đồng bộ: FastAPI chạy route sync trong threadpool nên truy vấn SQLAlchemy không chặn event loop
+@cached(ttl=DASHBOARD_STATS_TTL, key_prefix="analytics", stale_ttl=DASHBOARD_STATS_STALE_TTL,
+        tags=(DASHBOARD_STATS_TAG,))
+def cached_dashboard_stats(db: Session, user_role: str, period: str) -> Dict[str, Any]:
+    return AnalyticsService(db).compute_dashboard_stats(user_role, period)
+
 class AnalyticsService:
     def __init__(self, db: Session):
         self.db = db
-        self.cache = {}
-        self.cache_timeout = 300  # 5 minutes
 
-    async def get_dashboard_stats(self, user_role: str, period: str = "month") -> Dict[str, Any]:
+    def get_dashboard_stats(self, user_role: str, period: str = "month") -> Dict[str, Any]:
+        """Get dashboard statistics (cached, xem cached_dashboard_stats)"""
+        return cached_dashboard_stats(self.db, user_role, period)
+
+    def compute_dashboard_stats(self, user_role: str, period: str = "month") -> Dict[str, Any]:
         """Get comprehensive dashboard statistics based on user role and period"""
         try:
-            # Calculate date range
-            end_date = datetime.now()
-            if period == "month":
-                start_date = end_date - timedelta(days=30)
-            elif period == "quarter":
-                start_date = end_date - timedelta(days=90)
-            elif period == "year":
-                start_date = end_date - timedelta(days=365)
-            else:
-                start_date = end_date - timedelta(days=30)
-
-            stats = {}
+            hoc_ky, nam_hoc = academic_calendar.current_semester()
+
+            stats = {'period': period, 'hocKy': hoc_ky, 'namHoc': nam_hoc}
 
             # Base statistics
             stats['totalStudents'] = self.db.query(Student).count()
             stats['totalPrograms'] = self.db.query(TrainingProgram).count()
-            stats['totalFacilities'] = self.db.query(Facility).count()
+            stats['totalFacilities'] = self.db.query(CoSoLienKet).count()
             stats['totalTeachers'] = self.db.query(Teacher).count()
             stats['totalRooms'] = self.db.query(Room).count()
 
             # Role-specific statistics
             if user_role == "admin":
-                stats.update(await self._get_admin_stats(start_date, end_date))
+                stats.update(self._get_admin_stats())
             elif user_role == "manager":
-                stats.update(await self._get_manager_stats(start_date, end_date))
+                stats.update(self._get_manager_stats(hoc_ky, nam_hoc))
             elif user_role == "teacher":
-                stats.update(await self._get_teacher_stats(start_date, end_date))
+                stats.update(self._get_teacher_stats())
             elif user_role == "student":
-                stats.update(await self._get_student_stats(start_date, end_date))
-
-            # Trend calculations
-            stats['trends'] = await self._calculate_trends(start_date, end_date, period)
+                stats.update(self._get_student_stats())
 
             # Chart data
-            stats['enrollmentTrend'] = await self._get_enrollment_trend(start_date, end_date)
-            stats['courseCompletion'] = await self._get_course_completion_stats()
-            stats['facilityUtilization'] = await self._get_facility_utilization()
+            stats['enrollmentTrend'] = self._get_enrollment_trend()
+            stats['courseCompletion'] = self._get_course_completion_stats()
+            stats['facilityUtilization'] = self._get_facility_utilization(hoc_ky, nam_hoc)
 
             # Recent activities
-            stats['recentActivities'] = await self._get_recent_activities(limit=10)
+            stats['recentActivities'] = self._get_recent_activities(limit=10)
 
             return stats
 
@@ -77,28 +80,24 @@ class AnalyticsService:
             logger.error(f"Error getting dashboard stats: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to fetch dashboard statistics")
 
-    async def _get_admin_stats(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def _get_admin_stats(self) -> Dict[str, Any]:
         """Get admin-specific statistics"""
         return {
             'totalUsers': self.db.query(User).count(),
-            'activeUsers': self.db.query(User).filter(
-                User.last_login >= start_date
-            ).count(),
-            'systemLoad': await self._calculate_system_load(),
-            'errorRate': await self._calculate_error_rate(start_date, end_date),
+            'activeUsers': self.db.query(User).filter(User.status == "active").count(),
+            'systemLoad': self._calculate_system_load(),
+            'errorRate': self._calculate_error_rate(),
         }
 
-    async def _get_manager_stats(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
-        """Get manager-specific statistics"""
+    def _get_manager_stats(self, hoc_ky: str, nam_hoc: int) -> Dict[str, Any]:
+        """Get manager-specific statistics (học kỳ hiện tại)"""
         return {
-            'scheduledClasses': self.db.query(Schedule).filter(
-                and_(Schedule.date >= start_date, Schedule.date <= end_date)
-            ).count(),
-            'roomUtilization': await self._calculate_room_utilization(start_date, end_date),
-            'teacherWorkload': await self._calculate_teacher_workload(),
+            'scheduledClasses': self._term_schedule(hoc_ky, nam_hoc).count(),
+            'roomUtilization': self._calculate_room_utilization(hoc_ky, nam_hoc),
+            'teacherWorkload': self._calculate_teacher_workload(hoc_ky, nam_hoc),
         }
 
-    async def _get_teacher_stats(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def _get_teacher_stats(self) -> Dict[str, Any]:
         """Get teacher-specific statistics"""
         # This would need the current teacher's ID
         return {
@@ -107,7 +106,7 @@ class AnalyticsService:
             'averageGrade': 0,  # Placeholder
         }
 
-    async def _get_student_stats(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def _get_student_stats(self) -> Dict[str, Any]:
         """Get student-specific statistics"""
         # This would need the current student's ID
         return {
@@ -116,50 +115,24 @@ class AnalyticsService:
             'averageGrade': 0,  # Placeholder
         }
 
-    async def _calculate_trends(self, start_date: datetime, end_date: datetime, period: str) -> Dict[str, float]:
-        """Calculate trends for various metrics"""
-        # Compare with previous period
-        period_length = end_date - start_date
-        prev_start = start_date - period_length
-        prev_end = start_date
-
-        current_students = self.db.query(Student).filter(
-            Student.created_at.between(start_date, end_date)
-        ).count()
-        
-        prev_students = self.db.query(Student).filter(
-            Student.created_at.between(prev_start, prev_end)
-        ).count()
-
-        return {
-            'students': self._calculate_percentage_change(prev_students, current_students),
-            'programs': 0,  # Placeholder
-            'facilities': 0,  # Placeholder
-            'teachers': 0,  # Placeholder
-        }
-
-    def _calculate_percentage_change(self, old_value: int, new_value: int) -> float:
-        """Calculate percentage change between two values"""
-        if old_value == 0:
-            return 100.0 if new_value > 0 else 0.0
-        return round(((new_value - old_value) / old_value) * 100, 1)
+    def _term_schedule(self, hoc_ky: str, nam_hoc: int):
+        return self.db.query(ScheduleItem).filter(ScheduleItem.hoc_ky == hoc_ky, ScheduleItem.nam_hoc == nam_hoc)
 
-    async def _get_enrollment_trend(self, start_date: datetime, end_date: datetime) -> Dict[str, List]:
-        """Get enrollment trend data for charts"""
-        # Group by week
-        result = self.db.query(
-            func.date_trunc('week', Student.created_at).label('week'),
-            func.count(Student.id).label('count')
-        ).filter(
-            Student.created_at.between(start_date, end_date)
-        ).group_by('week').order_by('week').all()
+    def _term_slots(self, hoc_ky: str, nam_hoc: int) -> int:
+        """Số ca có thể xếp cho một phòng trong học kỳ"""
+        return SLOTS_PER_WEEK * len(academic_calendar.get_term_weeks(nam_hoc, hoc_ky))
 
-        labels = [row.week.strftime('%Y-%m-%d') for row in result]
-        data = [row.count for row in result]
+    def _get_enrollment_trend(self) -> Dict[str, List]:
+        """Số sinh viên theo khóa (chưa lưu ngày nhập học nên không chia theo tuần)"""
+        result = self.db.query(Class.khoa, func.count(Student.id).label('count')) \
+            .join(Student, Student.class_id == Class.id) \
+            .group_by(Class.khoa) \
+            .order_by(Class.khoa) \
+            .all()
 
-        return {'labels': labels, 'data': data}
+        return {'labels': [row.khoa for row in result], 'data': [row.count for row in result]}
 
-    async def _get_course_completion_stats(self) -> Dict[str, int]:
+    def _get_course_completion_stats(self) -> Dict[str, int]:
         """Get course completion statistics"""
         # This would need proper enrollment and completion tracking
         return {
@@ -168,28 +141,35 @@ class AnalyticsService:
             'dropped': 50,
         }
 
-    async def _get_facility_utilization(self) -> List[Dict[str, Any]]:
-        """Get facility utilization data"""
-        facilities = self.db.query(Facility).all()
+    def _get_facility_utilization(self, hoc_ky: str, nam_hoc: int) -> List[Dict[str, Any]]:
+        """Tỷ lệ ca đã xếp trên tổng số ca của các phòng thuộc từng cơ sở, một câu GROUP BY cho mọi cơ sở"""
+        rooms = self.db.query(Room.facility_id, func.count(Room.id).label('rooms')) \
+            .group_by(Room.facility_id) \
+            .subquery()
+        used = self.db.query(Room.facility_id, func.count(ScheduleItem.id).label('used')) \
+            .join(ScheduleItem, ScheduleItem.room_id == Room.id) \
+            .filter(ScheduleItem.hoc_ky == hoc_ky, ScheduleItem.nam_hoc == nam_hoc) \
+            .group_by(Room.facility_id) \
+            .subquery()
+        result = self.db.query(CoSoLienKet.name, rooms.c.rooms, used.c.used) \
+            .outerjoin(rooms, rooms.c.facility_id == CoSoLienKet.id) \
+            .outerjoin(used, used.c.facility_id == CoSoLienKet.id) \
+            .order_by(CoSoLienKet.id) \
+            .all()
+
+        term_slots = self._term_slots(hoc_ky, nam_hoc)
         utilization_data = []
-
-        for facility in facilities:
-            # Calculate utilization based on scheduled classes
-            total_capacity = facility.total_rooms * 8 * 5  # 8 hours/day, 5 days/week
-            used_hours = self.db.query(Schedule).join(Room).filter(
-                Room.facility_id == facility.id
-            ).count()
-            
-            utilization = (used_hours / total_capacity * 100) if total_capacity > 0 else 0
-            
+        for row in result:
+            total_capacity = (row.rooms or 0) * term_slots
+            utilization = ((row.used or 0) / total_capacity * 100) if total_capacity > 0 else 0
             utilization_data.append({
-                'name': facility.name,
+                'name': row.name,
                 'utilization': round(utilization, 1)
             })
 
         return utilization_data
 
-    async def _get_recent_activities(self, limit: int = 10) -> List[Dict[str, Any]]:
+    def _get_recent_activities(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent system activities"""
         # This would come from an activity log table
         activities = [
@@ -217,45 +197,35 @@ class AnalyticsService:
         ]
         return activities[:limit]
 
-    async def _calculate_system_load(self) -> float:
+    def _calculate_system_load(self) -> float:
         """Calculate current system load"""
         # This would include CPU, memory, database connections, etc.
         return 65.5  # Placeholder
 
-    async def _calculate_error_rate(self, start_date: datetime, end_date: datetime) -> float:
+    def _calculate_error_rate(self) -> float:
         """Calculate error rate for the given period"""
         # This would come from error logs
         return 2.1  # Placeholder
 
-    async def _calculate_room_utilization(self, start_date: datetime, end_date: datetime) -> float:
+    def _calculate_room_utilization(self, hoc_ky: str, nam_hoc: int) -> float:
         """Calculate room utilization percentage"""
         total_rooms = self.db.query(Room).count()
-        scheduled_slots = self.db.query(Schedule).filter(
-            Schedule.date.between(start_date, end_date)
-        ).count()
-        
-        # Assuming 8 hours per day, 5 days per week
-        total_possible_slots = total_rooms * 8 * 5 * ((end_date - start_date).days // 7)
-        
-        return (scheduled_slots / total_possible_slots * 100) if total_possible_slots > 0 else 0
+        scheduled_slots = self._term_schedule(hoc_ky, nam_hoc).filter(ScheduleItem.room_id.isnot(None)).count()
+
+        total_possible_slots = total_rooms * self._term_slots(hoc_ky, nam_hoc)
 
-    async def _calculate_teacher_workload(self) -> float:
-        """Calculate average teacher workload"""
-        teachers = self.db.query(Teacher).all()
+        return round(scheduled_slots / total_possible_slots * 100, 1) if total_possible_slots > 0 else 0
+
+    def _calculate_teacher_workload(self, hoc_ky: str, nam_hoc: int) -> float:
+        """Số tiết trung bình mỗi giáo viên trong học kỳ (hai câu COUNT thay vì một câu cho từng giáo viên)"""
+        teachers = self.db.query(Teacher).count()
         if not teachers:
             return 0
 
-        total_workload = 0
-        for teacher in teachers:
-            classes = self.db.query(Schedule).filter(
-                Schedule.teacher_id == teacher.id
-            ).count()
-            total_workload += classes
-
-        return total_workload / len(teachers)
+        return round(self._term_schedule(hoc_ky, nam_hoc).count() / teachers, 1)
 
 @router.get("/dashboard")
-async def get_dashboard_analytics(
+def get_dashboard_analytics(
     period: str = "month",
     role: str = "student",
     current_user = Depends(get_current_user),
@@ -264,17 +234,17 @@ async def get_dashboard_analytics(
     """Get dashboard analytics based on user role and time period"""
     try:
         analytics_service = AnalyticsService(db)
-        stats = await analytics_service.get_dashboard_stats(role, period)
+        stats = analytics_service.get_dashboard_stats(role, period)
         
-        return success_response(
+        return ResponseHandler.success(
             data=stats,
             message="Dashboard analytics retrieved successfully"
         )
     except Exception as e:
         logger.error(f"Dashboard analytics error: {str(e)}")
-        return error_response(
+        return ResponseHandler.error(
             message="Failed to retrieve dashboard analytics",
-            details=str(e)
+            errors={"details": str(e)}
         )
 
 @router.post("/performance")
@@ -288,12 +258,12 @@ async def record_performance_metrics(
         # Process performance data in background
         background_tasks.add_task(process_performance_data, performance_data, db)
         
-        return success_response(
+        return ResponseHandler.success(
             message="Performance metrics recorded successfully"
         )
     except Exception as e:
         logger.error(f"Performance metrics error: {str(e)}")
-        return error_response(
+        return ResponseHandler.error(
             message="Failed to record performance metrics"
         )
 
@@ -338,13 +308,13 @@ async def get_performance_summary(
             ]
         }
         
-        return success_response(
+        return ResponseHandler.success(
             data=summary,
             message="Performance summary retrieved successfully"
         )
     except Exception as e:
         logger.error(f"Performance summary error: {str(e)}")
-        return error_response(
+        return ResponseHandler.error(
             message="Failed to retrieve performance summary"
         )
 
@@ -380,12 +350,12 @@ async def get_user_behavior_analytics(
             }
         }
         
-        return success_response(
+        return ResponseHandler.success(
             data=behavior_data,
             message="User behavior analytics retrieved successfully"
         )
     except Exception as e:
         logger.error(f"User behavior analytics error: {str(e)}")
-        return error_response(
+        return ResponseHandler.error(
             message="Failed to retrieve user behavior analytics"
         )
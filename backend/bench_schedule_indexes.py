@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Benchmark index của schedule_items / students / teachers / manager_profiles
+Tạo database SQLite tạm với N tiết học (mặc định 1k -> 1M), đo thời gian các truy vấn nóng của các route
+khi có và khi không có index, in kế hoạch thực thi (EXPLAIN QUERY PLAN) để thấy index được dùng
+
+    python bench_schedule_indexes.py
+    python bench_schedule_indexes.py --sizes 1000 100000 --repeat 50
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+
+import academic_calendar
+import models
+from database import Base
+
+TERMS = [(hoc_ky, nam_hoc) for nam_hoc in (2023, 2024, 2025) for hoc_ky in ("1", "2", "3")]
+WEEKS = 15
+INSERT_BATCH = 50000
+STUDENTS_PER_CLASS = 40
+
+# Index phục vụ các truy vấn bên dưới; bản "no index" xóa hết để so sánh
+BENCH_INDEXES = {
+    "schedule_items": [
+        "ix_schedule_items_class_term_week_day_period",
+        "ix_schedule_items_class_term_slot",
+        "ix_schedule_items_teacher_term_slot",
+        "ix_schedule_items_room_term_slot",
+    ],
+    "students": ["ix_students_class_id"],
+    "teachers": ["ix_teachers_user_id"],
+    "manager_profiles": ["ix_manager_profiles_user_id"],
+}
+
+
+def dataset_shape(size: int):
+    """Mỗi lớp khoảng 150 tiết mỗi học kỳ (15 tuần x 10 tiết), số giáo viên/phòng tăng theo quy mô"""
+    classes = max(1, size // (WEEKS * 10 * len(TERMS)))
+    teachers = max(5, size // 1500)
+    rooms = max(5, size // 3000)
+    return classes, teachers, rooms
+
+
+def populate(engine, size: int, seed: int = 42):
+    rng = random.Random(seed)
+    classes, teachers, rooms = dataset_shape(size)
+    slots = [(day, period) for day in academic_calendar.DAY_NAMES[:5] for period in academic_calendar.PERIODS]
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": i, "username": f"gv{i}", "password": "x", "role": "teacher", "status": "active"}
+            for i in range(1, teachers + 1)
+        ])
+        conn.execute(insert(models.Teacher), [
+            {"id": i, "name": f"GV {i}", "code": f"GV{i:05d}", "email": f"gv{i}@ctu.edu.vn", "user_id": i}
+            for i in range(1, teachers + 1)
+        ])
+        conn.execute(insert(models.ManagerProfile), [
+            {"id": i, "full_name": f"QL {i}", "user_id": teachers + i, "facility_id": 1}
+            for i in range(1, max(2, classes // 10) + 1)
+        ])
+        conn.execute(insert(models.Class), [
+            {"id": i, "khoa": "K50", "ma_lop": f"L{i:05d}", "facility_id": 1, "major_id": 1, "he_dao_tao": "vhvl"}
+            for i in range(1, classes + 1)
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i, "room_number": f"{100 + i}", "capacity": 50, "facility_id": 1}
+            for i in range(1, rooms + 1)
+        ])
+        dob = datetime(2000, 1, 1)
+        students = [
+            {"name": f"SV {c}-{n}", "dob": dob, "gender": "Nam", "student_code": f"SV{c:05d}{n:03d}", "class_id": c}
+            for c in range(1, classes + 1) for n in range(STUDENTS_PER_CLASS)
+        ]
+        for i in range(0, len(students), INSERT_BATCH):
+            conn.execute(insert(models.Student), students[i:i + INSERT_BATCH])
+
+        batch = []
+        for n in range(size):
+            class_id = n % classes + 1
+            hoc_ky, nam_hoc = TERMS[(n // classes) % len(TERMS)]
+            week = rng.randint(1, WEEKS)
+            day, period = rng.choice(slots)
+            batch.append({
+                "class_id": class_id, "hoc_ky": hoc_ky, "nam_hoc": nam_hoc,
+                "week": week, "day": day, "period": period,
+                "subject_id": f"HP{rng.randint(1, 200):03d}",
+                "teacher_id": rng.randint(1, teachers),
+                "hinh_thuc": "truc_tiep",
+                "room_id": rng.randint(1, rooms),
+                "slot_key": academic_calendar.slot_key(week, day, period),
+            })
+            if len(batch) >= INSERT_BATCH:
+                conn.execute(insert(models.ScheduleItem), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.ScheduleItem), batch)
+        conn.exec_driver_sql("ANALYZE")
+
+
+def build_database(path: str, size: int, indexed: bool):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    if not indexed:
+        with engine.begin() as conn:
+            for names in BENCH_INDEXES.values():
+                for name in names:
+                    conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    populate(engine, size)
+    return engine
+
+
+def bench_queries(size: int):
+    """(tên, hàm sinh (statement) với tham số ngẫu nhiên) - giống truy vấn của các route"""
+    classes, teachers, rooms = dataset_shape(size)
+    item = models.ScheduleItem
+
+    def term():
+        return random.choice(TERMS)
+
+    def class_term():
+        hoc_ky, nam_hoc = term()
+        return select(item.id, item.week, item.day, item.period, item.subject_id) \
+            .where(item.class_id == random.randint(1, classes), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc) \
+            .order_by(item.slot_key)
+
+    def class_week_day():
+        hoc_ky, nam_hoc = term()
+        return select(item.id, item.period) \
+            .where(item.class_id == random.randint(1, classes), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc,
+                   item.week == random.randint(1, WEEKS), item.day == academic_calendar.DAY_NAMES[0])
+
+    def create_schedule_keys():
+        hoc_ky, nam_hoc = term()
+        return select(item.week, item.day, item.period) \
+            .where(item.class_id == random.randint(1, classes), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc)
+
+    def next_slot():
+        hoc_ky, nam_hoc = term()
+        return select(item.id, item.slot_key) \
+            .where(item.class_id == random.randint(1, classes), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc,
+                   item.slot_key >= random.randint(100, WEEKS * 100)) \
+            .order_by(item.slot_key).limit(1)
+
+    def teacher_term():
+        hoc_ky, nam_hoc = term()
+        return select(item.id, item.slot_key) \
+            .where(item.teacher_id == random.randint(1, teachers), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc) \
+            .order_by(item.slot_key)
+
+    def room_busy():
+        hoc_ky, nam_hoc = term()
+        start = random.randint(1, WEEKS) * 100
+        return select(item.slot_key) \
+            .where(item.room_id == random.randint(1, rooms), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc,
+                   item.slot_key.between(start, start + 99))
+
+    def students_by_class():
+        return select(models.Student.id, models.Student.name) \
+            .where(models.Student.class_id == random.randint(1, classes))
+
+    def teacher_by_user():
+        return select(models.Teacher.id).where(models.Teacher.user_id == random.randint(1, teachers))
+
+    return [
+        ("class_term", class_term),
+        ("class_week_day", class_week_day),
+        ("create_schedule_keys", create_schedule_keys),
+        ("next_slot", next_slot),
+        ("teacher_term", teacher_term),
+        ("room_busy", room_busy),
+        ("students_by_class", students_by_class),
+        ("teacher_by_user", teacher_by_user),
+    ]
+
+
+def time_query(engine, make_stmt, repeat: int):
+    timings = []
+    with engine.connect() as conn:
+        conn.execute(make_stmt()).all()  # warm-up (page cache)
+        for _ in range(repeat):
+            stmt = make_stmt()
+            start = time.perf_counter()
+            conn.execute(stmt).all()
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0]
+
+
+def query_plan(engine, make_stmt) -> str:
+    stmt = make_stmt()
+    with engine.connect() as conn:
+        compiled = stmt.compile(dialect=engine.dialect)
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return "; ".join(row[3] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--plans", action="store_true", help="In kế hoạch thực thi của từng truy vấn")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'query':<22} {'indexed p50':>12} {'p95':>9} {'no index p50':>13} {'p95':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            engines = {}
+            for indexed in (True, False):
+                path = os.path.join(tmp, f"bench_{size}_{'ix' if indexed else 'noix'}.db")
+                start = time.perf_counter()
+                engines[indexed] = build_database(path, size, indexed)
+                print(f"⏳ {size} rows ({'indexed' if indexed else 'no index'}) built in {time.perf_counter() - start:.1f}s")
+
+            for name, make_stmt in bench_queries(size):
+                random.seed(size)
+                with_ix = time_query(engines[True], make_stmt, args.repeat)
+                random.seed(size)
+                without_ix = time_query(engines[False], make_stmt, args.repeat)
+                speedup = without_ix[0] / with_ix[0] if with_ix[0] else float("inf")
+                print(f"{size:>9} {name:<22} {with_ix[0]:>10.3f}ms {with_ix[1]:>7.3f}ms "
+                      f"{without_ix[0]:>11.3f}ms {without_ix[1]:>7.3f}ms {speedup:>7.1f}x")
+                if args.plans:
+                    print(f"{'':>10} indexed : {query_plan(engines[True], make_stmt)}")
+                    print(f"{'':>10} no index: {query_plan(engines[False], make_stmt)}")
+
+            for engine in engines.values():
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark đọc/ghi đồng thời trên SQLite: cấu hình cũ (rollback journal, pool_pre_ping) so với create_sqlite_engine
+(WAL, synchronous=NORMAL, busy_timeout, cache/mmap, không pre-ping)
+Nhiều thread đọc lịch của lớp trong khi vài thread ghi lô tiết học mới như create_schedule
+
+    python bench_sqlite_concurrency.py
+    python bench_sqlite_concurrency.py --readers 16 --writers 4 --duration 10 --rows 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import academic_calendar
+import models
+from bench_schedule_indexes import TERMS, WEEKS, dataset_shape, populate
+from database import Base, create_sqlite_engine
+
+WRITE_BATCH = 20
+
+
+def legacy_engine(url: str):
+    """Cấu hình database.py trước đây"""
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=20,
+        max_overflow=0,
+        pool_timeout=30,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+    )
+
+
+PROFILES = {
+    "legacy": legacy_engine,
+    "tuned": create_sqlite_engine,
+}
+
+
+def reader(Session, classes, stop, latencies, errors):
+    item = models.ScheduleItem
+    rng = random.Random()
+    while not stop.is_set():
+        hoc_ky, nam_hoc = rng.choice(TERMS)
+        start = time.perf_counter()
+        try:
+            with Session() as db:
+                db.execute(
+                    select(item.id, item.week, item.day, item.period, item.subject_id)
+                    .where(item.class_id == rng.randint(1, classes), item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc)
+                    .order_by(item.slot_key)
+                ).all()
+        except OperationalError:
+            errors.append(1)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def writer(Session, classes, teachers, stop, latencies, errors):
+    rng = random.Random()
+    slots = [(day, period) for day in academic_calendar.DAY_NAMES[:5] for period in academic_calendar.PERIODS]
+    while not stop.is_set():
+        hoc_ky, nam_hoc = rng.choice(TERMS)
+        class_id = rng.randint(1, classes)
+        rows = []
+        for _ in range(WRITE_BATCH):
+            week = rng.randint(1, WEEKS)
+            day, period = rng.choice(slots)
+            rows.append({
+                "class_id": class_id, "hoc_ky": hoc_ky, "nam_hoc": nam_hoc,
+                "week": week, "day": day, "period": period,
+                "subject_id": "HP001", "teacher_id": rng.randint(1, teachers),
+                "hinh_thuc": "truc_tiep", "room_id": None,
+                "slot_key": academic_calendar.slot_key(week, day, period),
+            })
+        start = time.perf_counter()
+        try:
+            with Session() as db:
+                db.execute(insert(models.ScheduleItem), rows)
+                db.commit()
+        except OperationalError:
+            errors.append(1)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def summarize(latencies):
+    if not latencies:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {"count": len(ordered), "p50": statistics.median(ordered), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def run_profile(name: str, path: str, args):
+    engine = PROFILES[name](f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    populate(engine, args.rows)
+    classes, teachers, _ = dataset_shape(args.rows)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    stop = threading.Event()
+    read_latencies, write_latencies, read_errors, write_errors = [], [], [], []
+    threads = [
+        threading.Thread(target=reader, args=(Session, classes, stop, read_latencies, read_errors))
+        for _ in range(args.readers)
+    ] + [
+        threading.Thread(target=writer, args=(Session, classes, teachers, stop, write_latencies, write_errors))
+        for _ in range(args.writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    with engine.connect() as conn:
+        journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+
+    reads, writes = summarize(read_latencies), summarize(write_latencies)
+    print(f"{name:<7} journal={journal:<7} "
+          f"reads {reads['count'] / args.duration:>8.1f}/s p50 {reads['p50']:>7.2f}ms p95 {reads['p95']:>7.2f}ms "
+          f"p99 {reads['p99']:>7.2f}ms errors {len(read_errors):>3} | "
+          f"writes {writes['count'] / args.duration:>6.1f}/s p50 {writes['p50']:>7.2f}ms p95 {writes['p95']:>7.2f}ms "
+          f"errors {len(write_errors):>3}")
+    return reads, writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--dir", default=None, help="Thư mục đặt file database tạm (nên cùng ổ đĩa với users.db)")
+    args = parser.parse_args()
+
+    print(f"⏳ {args.rows} rows, {args.readers} readers, {args.writers} writers, {args.duration}s mỗi cấu hình")
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for name in PROFILES:
+            results[name] = run_profile(name, os.path.join(tmp, f"{name}.db"), args)
+
+    (old_reads, old_writes), (new_reads, new_writes) = results["legacy"], results["tuned"]
+    if old_reads["count"] and old_writes["count"]:
+        print(f"✅ tuned/legacy: reads x{new_reads['count'] / old_reads['count']:.2f}, "
+              f"writes x{new_writes['count'] / old_writes['count']:.2f}, "
+              f"read p99 {old_reads['p99']:.2f}ms -> {new_reads['p99']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
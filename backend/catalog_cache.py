@@ -0,0 +1,92 @@
+"""
+Cache đọc cho dữ liệu công khai ít thay đổi: chương trình đào tạo, học phần, tin tức, slider, phòng học
+Dùng cache_manager của core.optimization (memory, thêm Redis nếu có REDIS_URL)
+Key cố định theo namespace + tham số; mỗi entry gắn tag namespace và tag chi tiết (vd programs:khoa:50),
+các handler tạo/sửa/xóa gọi invalidate(<tag>) sau khi commit
+Endpoint cache cả response JSON đã serialize (bytes): cache hit không phải giải mã hay chạy lại Pydantic
+"""
+import json
+import os
+from typing import Any, Callable, Optional
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from core.optimization import cache_manager, invalidate_cache_tags
+
+PROGRAMS = "catalog:programs"
+COURSES = "catalog:courses"
+NEWS = "catalog:news"
+SLIDER = "catalog:slider"
+ROOMS = "catalog:rooms"
+
+# TTL chỉ là giới hạn an toàn, dữ liệu được làm mới ngay khi có thay đổi qua invalidate()
+CATALOG_TTLS = {
+    PROGRAMS: int(os.getenv("CATALOG_PROGRAMS_TTL", "3600")),
+    COURSES: int(os.getenv("CATALOG_COURSES_TTL", "3600")),
+    NEWS: int(os.getenv("CATALOG_NEWS_TTL", "600")),
+    SLIDER: int(os.getenv("CATALOG_SLIDER_TTL", "3600")),
+    ROOMS: int(os.getenv("CATALOG_ROOMS_TTL", "3600")),
+}
+
+
+def catalog_key(namespace: str, *parts) -> str:
+    """Key dạng catalog:<loại>:<tham số>..., ví dụ catalog:programs:tree:50"""
+    return ":".join([namespace, *(str(part) for part in parts)])
+
+
+# Danh sách khóa chỉ đổi khi thêm/xóa chương trình
+PROGRAM_YEARS_TAG = "programs:years"
+
+
+def program_tag(khoa) -> str:
+    """Tag của mọi entry chương trình đào tạo thuộc một khóa"""
+    return f"programs:khoa:{khoa}"
+
+
+def get_or_load(namespace: str, key: str, loader: Callable[[], Any], tags: tuple = ()) -> Any:
+    """Đọc từ cache, nếu chưa có thì gọi loader và lưu lại; loader trả None (không tìm thấy) thì không cache"""
+    value = cache_manager.get(key)
+    if value is not None:
+        return value
+
+    value = loader()
+    if value is not None:
+        store(namespace, key, value, tags)
+    return value
+
+
+def store(namespace: str, key: str, value: Any, tags: tuple = ()) -> bool:
+    """Ghi một entry với TTL và tag namespace, để invalidate(namespace) xóa được"""
+    return cache_manager.set(key, value, CATALOG_TTLS[namespace], tags=(namespace, *tags))
+
+
+def encode_body(data: Any) -> bytes:
+    """Serialize giống JSONResponse mặc định của FastAPI"""
+    return json.dumps(
+        jsonable_encoder(data), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def get_or_load_body(namespace: str, key: str, loader: Callable[[], Any], tags: tuple = ()) -> Optional[bytes]:
+    """Như get_or_load nhưng cache body JSON (bytes) của dữ liệu loader trả về"""
+    def load_body():
+        data = loader()
+        return None if data is None else encode_body(data)
+
+    return get_or_load(namespace, key, load_body, tags)
+
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_response(namespace: str, key: str, loader: Callable[[], Any], tags: tuple = ()) -> Optional[Response]:
+    """Response JSON lấy từ cache; None nếu loader không tìm thấy dữ liệu"""
+    body = get_or_load_body(namespace, key, loader, tags)
+    return None if body is None else json_response(body)
+
+
+def invalidate(*tags: str):
+    """Xóa các entry gắn tag (namespace như PROGRAMS hoặc tag chi tiết như program_tag(khoa))"""
+    invalidate_cache_tags(*tags)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from database import get_db
 import models, schemas
 
@@ -34,13 +34,13 @@ def create_class(data: schemas.ClassCreate, db: Session = Depends(get_db)):
 
 @router.get("/classes")
 def list_classes(db: Session = Depends(get_db)):
-    classes = db.query(models.Class).all()
+    classes = db.query(models.Class) \
+        .options(joinedload(models.Class.facility), joinedload(models.Class.major)) \
+        .order_by(models.Class.id) \
+        .all()
 
     result = []
     for c in classes:
-        facility = db.query(models.CoSoLienKet).filter_by(id=c.facility_id).first()
-        major = db.query(models.TrainingMajor).filter_by(id=c.major_id).first()
-
         result.append({
             "id": c.id,
             "ma_lop": c.ma_lop,
@@ -0,0 +1,218 @@
+"""
+Cache value codecs
+Mỗi giá trị ghi vào Redis có 2 byte header: [codec][nén] rồi tới payload
+- codec: r = bytes thô (response đã serialize), j = JSON (orjson nếu có), m = msgpack, p = pickle
+- nén: 0 = không nén, z = zstd, d = zlib (khi không có zstandard); chỉ nén khi payload vượt ngưỡng
+Giá trị không có header hợp lệ (định dạng cũ) được coi như miss
+Pickle chỉ được giải mã khi CACHE_ALLOW_PICKLE=1 vì Redis dùng chung có thể bị ghi dữ liệu độc hại
+"""
+import json
+import os
+import pickle
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "4096"))
+ALLOW_PICKLE = os.getenv("CACHE_ALLOW_PICKLE", "0") == "1"
+
+NO_COMPRESSION = b"0"
+ZSTD = b"z"
+ZLIB = b"d"
+
+
+class CodecError(Exception):
+    """Không encode/decode được giá trị cache"""
+
+
+class RawCodec:
+    """bytes đi thẳng, dùng cho response JSON đã serialize sẵn"""
+    name = "raw"
+    tag = b"r"
+
+    def encode(self, value: Any) -> bytes:
+        if not isinstance(value, (bytes, bytearray)):
+            raise CodecError("raw codec only accepts bytes")
+        return bytes(value)
+
+    def decode(self, payload: bytes) -> Any:
+        return payload
+
+
+def _check_str_keys(value: Any):
+    """json chuẩn tự đổi key int/float/bool thành chuỗi; từ chối để cache hit không khác cache miss"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise CodecError(f"dict key {key!r} is not a string")
+            _check_str_keys(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _check_str_keys(item)
+
+
+class JsonCodec:
+    """
+    JSON: dict chỉ được có key chuỗi (key khác bị từ chối, giá trị chỉ nằm ở L1), tuple giải mã thành list
+    Các endpoint cache dict/list thuần nên giá trị đọc lại giống hệt giá trị đã ghi
+    """
+    name = "orjson" if orjson else "json"
+    tag = b"j"
+
+    def encode(self, value: Any) -> bytes:
+        try:
+            if orjson:
+                return orjson.dumps(value)  # Không OPT_NON_STR_KEYS: key không phải chuỗi gây TypeError
+            _check_str_keys(value)
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        except TypeError as e:
+            raise CodecError(str(e))
+
+    def decode(self, payload: bytes) -> Any:
+        return orjson.loads(payload) if orjson else json.loads(payload)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    tag = b"m"
+
+    def encode(self, value: Any) -> bytes:
+        try:
+            return msgpack.packb(value, use_bin_type=True, datetime=False)
+        except TypeError as e:
+            raise CodecError(str(e))
+
+    def decode(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload, raw=False)
+
+
+class PickleCodec:
+    name = "pickle"
+    tag = b"p"
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, payload: bytes) -> Any:
+        if not ALLOW_PICKLE:
+            raise CodecError("pickle payloads are disabled (set CACHE_ALLOW_PICKLE=1)")
+        return pickle.loads(payload)
+
+
+CODECS = {"raw": RawCodec(), "json": JsonCodec(), "pickle": PickleCodec()}
+if msgpack:
+    CODECS["msgpack"] = MsgpackCodec()
+CODECS_BY_TAG = {codec.tag: codec for codec in CODECS.values()}
+
+
+def get_codec(name: Optional[str] = None):
+    """Codec theo tên (CACHE_CODEC), mặc định msgpack nếu có, không thì JSON"""
+    name = name or os.getenv("CACHE_CODEC") or ("msgpack" if msgpack else "json")
+    if name not in CODECS:
+        raise ValueError(f"Unknown or unavailable cache codec: {name}")
+    return CODECS[name]
+
+
+def _compress(payload: bytes):
+    if len(payload) < COMPRESS_THRESHOLD:
+        return NO_COMPRESSION, payload
+    if zstandard:
+        return ZSTD, zstandard.ZstdCompressor(level=3).compress(payload)
+    return ZLIB, zlib.compress(payload, 6)
+
+
+def _decompress(flag: bytes, payload: bytes) -> bytes:
+    if flag == NO_COMPRESSION:
+        return payload
+    if flag == ZSTD:
+        if not zstandard:
+            raise CodecError("zstd payload but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if flag == ZLIB:
+        return zlib.decompress(payload)
+    raise CodecError(f"unknown compression flag {flag!r}")
+
+
+class CodecSet:
+    """Chọn codec khi ghi (bytes -> raw, còn lại -> codec mặc định), đọc theo header; đo thời gian theo codec"""
+
+    def __init__(self, default_codec=None):
+        self.default = default_codec or get_codec()
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _stat(self, name: str) -> Dict[str, float]:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {
+                'encodes': 0, 'decodes': 0, 'encode_ms': 0.0, 'decode_ms': 0.0,
+                'bytes_in': 0, 'bytes_out': 0, 'compressed': 0, 'errors': 0,
+            }
+        return stats
+
+    def encode(self, value: Any) -> bytes:
+        codec = CODECS["raw"] if isinstance(value, (bytes, bytearray)) else self.default
+        stats = self._stat(codec.name)
+        start = time.perf_counter()
+        try:
+            payload = codec.encode(value)
+        except CodecError:
+            stats['errors'] += 1
+            raise
+        flag, payload = _compress(payload)
+        stats['encodes'] += 1
+        stats['encode_ms'] += (time.perf_counter() - start) * 1000
+        stats['bytes_out'] += len(payload)
+        if flag != NO_COMPRESSION:
+            stats['compressed'] += 1
+        return codec.tag + flag + payload
+
+    def decode(self, data: bytes) -> Any:
+        codec = CODECS_BY_TAG.get(data[:1])
+        if codec is None or len(data) < 2:
+            raise CodecError("missing or unknown codec header")
+        stats = self._stat(codec.name)
+        start = time.perf_counter()
+        try:
+            value = codec.decode(_decompress(data[1:2], data[2:]))
+        except CodecError:
+            stats['errors'] += 1
+            raise
+        except Exception as e:
+            stats['errors'] += 1
+            raise CodecError(str(e))
+        stats['decodes'] += 1
+        stats['decode_ms'] += (time.perf_counter() - start) * 1000
+        stats['bytes_in'] += len(data)
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'default': self.default.name,
+            'compression': 'zstd' if zstandard else 'zlib',
+            'compress_threshold': COMPRESS_THRESHOLD,
+            'codecs': {
+                name: {
+                    **stats,
+                    'encode_ms': round(stats['encode_ms'], 3),
+                    'decode_ms': round(stats['decode_ms'], 3),
+                    'avg_encode_ms': round(stats['encode_ms'] / stats['encodes'], 4) if stats['encodes'] else 0,
+                    'avg_decode_ms': round(stats['decode_ms'] / stats['decodes'], 4) if stats['decodes'] else 0,
+                }
+                for name, stats in self.stats.items()
+            },
+        }
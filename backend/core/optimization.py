@@ -1,5 +1,5 @@
 # Database optimization and caching utilities
-from sqlalchemy import event, text, inspect
+from sqlalchemy import event
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -8,258 +8,839 @@ import time
 import logging
 import json
 import hashlib
+import inspect
+import asyncio
+import math
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from fnmatch import fnmatchcase
+from itertools import islice
 from typing import Any, Dict, List, Optional, Callable
-from datetime import datetime, timedelta
-import redis
-import pickle
+from datetime import date, datetime
+
+from core import cache_codecs
+from core.cache_codecs import CodecError, CodecSet, get_codec
+
+try:
+    import redis
+except ImportError:  # Redis là tùy chọn, không có thì chỉ dùng memory cache
+    redis = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chuẩn hóa câu SQL thành fingerprint: bỏ literal/tham số để các câu chỉ khác giá trị được gộp chung
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_PARAM = re.compile(r"\?|%\(\w+\)s|%s|(?<!:):\w+|\$\d+")
+_SQL_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_ROW_LIST = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+_SQL_SPACE = re.compile(r"\s+")
+
+def fingerprint_statement(statement: str) -> str:
+    """SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a' -> SELECT * FROM t WHERE id IN (?, ...) AND name = ?"""
+    sql = _SQL_COMMENT.sub(" ", statement)
+    sql = _SQL_STRING.sub("?", sql)
+    sql = _SQL_NUMBER.sub("?", sql)
+    sql = _SQL_PARAM.sub("?", sql)
+    sql = _SQL_PARAM_LIST.sub("(?, ...)", sql)
+    sql = _SQL_ROW_LIST.sub("(?, ...), ...", sql)
+    return _SQL_SPACE.sub(" ", sql).strip()
+
+class LatencyHistogram:
+    """
+    Histogram bucket hình học (mỗi bucket rộng hơn bucket trước 10%) để tính p50/p95/p99 theo kiểu streaming:
+    bộ nhớ cố định, sai số tương đối tối đa khoảng 10%
+    """
+    GROWTH = 1.1
+    MIN_VALUE = 0.01  # giá trị nhỏ hơn gộp vào bucket đầu tiên
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.max = max(self.max, value)
+        index = 0 if value <= self.MIN_VALUE else int(math.log(value / self.MIN_VALUE, self.GROWTH)) + 1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                break
+        return min(self.MIN_VALUE * self.GROWTH ** index, self.max)  # cận trên của bucket
+
+    def percentiles(self, digits: int = 3) -> Dict[str, float]:
+        return {f"p{q}": round(self.percentile(q), digits) for q in (50, 95, 99)}
+
+def count_percentiles(counts: Dict[int, int]) -> Dict[str, int]:
+    """p50/p95/p99 chính xác từ phân bố {giá trị nguyên: số lần} (số câu SQL mỗi request chỉ có ít giá trị khác nhau)"""
+    total = sum(counts.values())
+    result = {}
+    for q in (50, 95, 99):
+        rank, seen, value = q / 100 * total, 0, 0
+        for value in sorted(counts):
+            seen += counts[value]
+            if seen >= rank:
+                break
+        result[f"p{q}"] = value
+    return result
+
+# Bảng lớn/đọc nhiều nhất của hệ thống: full scan trên các bảng này được ưu tiên xử lý
+HOT_TABLES = ("schedule_items", "students", "program_courses")
+
+_EXPLAINABLE = re.compile(r"\s*(SELECT|WITH|UPDATE|DELETE)\b", re.I)
+_PLAN_SCAN = re.compile(r"SCAN (?:TABLE )?(\w+)")
+_SQL_KEYWORDS = "ON|WHERE|JOIN|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|ORDER|GROUP|LIMIT|UNION|USING"
+_SQL_TABLE_ALIAS = re.compile(
+    rf"\b(?:FROM|JOIN)\s+\"?(\w+)\"?(?:\s+(?:AS\s+)?(?!(?:{_SQL_KEYWORDS})\b)(\w+))?", re.I
+)
+_SQL_COLUMN_PREDICATE = re.compile(r"\b(\w+)\.(\w+)\s*(==|=|IN\b|IS\b|>=|<=|>|<|BETWEEN\b|LIKE\b)", re.I)
+_SQL_BARE_PREDICATE = re.compile(r"(?<![.\w])(\w+)\s*(==|=|IN\b|IS\b|>=|<=|>|<|BETWEEN\b|LIKE\b)", re.I)
+_SQL_JOIN_RIGHT = re.compile(r"(?:==|=)\s*(\w+)\.(\w+)")
+
+def _table_aliases(statement: str) -> Dict[str, str]:
+    """alias -> bảng, gồm cả tên bảng trỏ về chính nó (SQLAlchemy sinh dạng "schedule_items AS schedule_items_1")"""
+    aliases = {}
+    for table, alias in _SQL_TABLE_ALIAS.findall(statement):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+def _clause_columns(clause: str, table: str, aliases: Dict[str, str], columns: List[str]):
+    single_table = len(set(aliases.values())) == 1
+    found = [(m.start(), m.group(1), m.group(2), m.group(3).upper()) for m in _SQL_COLUMN_PREDICATE.finditer(clause)]
+    found += [(m.start(1), m.group(1), m.group(2), "=") for m in _SQL_JOIN_RIGHT.finditer(clause)]
+    if single_table:  # Câu viết tay một bảng thường không ghi tiền tố bảng
+        found += [(m.start(), table, m.group(1), m.group(2).upper()) for m in _SQL_BARE_PREDICATE.finditer(clause)]
+    equality, ranges = [], []
+    for _, alias, column, op in sorted(found):
+        if aliases.get(alias, alias) != table or column not in columns:
+            continue
+        target = equality if op in ("=", "==", "IN", "IS") else ranges
+        if column not in equality and column not in target:
+            target.append(column)
+    return equality, ranges
+
+def _predicate_columns(statement: str, table: str, aliases: Dict[str, str], columns: List[str]) -> List[str]:
+    """
+    Cột nên index của một bảng bị SCAN: cột so sánh bằng trong WHERE trước, thêm một cột so sánh khoảng;
+    chỉ dùng cột trong điều kiện JOIN khi WHERE không lọc bảng đó (bảng ở vòng lặp trong của phép join)
+    """
+    body = re.split(r"\bORDER\s+BY\b|\bGROUP\s+BY\b", statement, flags=re.I)[0]
+    parts = re.split(r"\bWHERE\b", body, maxsplit=1, flags=re.I)
+    joins, where = parts[0], parts[1] if len(parts) > 1 else ""
+    equality, ranges = _clause_columns(where, table, aliases, columns)
+    if not equality and not ranges:
+        equality, ranges = _clause_columns(joins, table, aliases, columns)
+    return equality + [column for column in ranges[:1] if column not in equality]
+
+def index_ddl(table: str, columns: List[str]) -> str:
+    """DDL theo quy ước đặt tên index của models (ix_<bảng>_<cột>)"""
+    name = f"ix_{table}_{'_'.join(columns)}"
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)});"
+
+# Bộ đếm câu SQL của request hiện tại (do QueryProfilingMiddleware đặt); endpoint sync chạy trong threadpool
+# vẫn thấy cùng object vì Starlette copy context sang thread
+_request_profile: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_profile", default=None)
+
 class DatabaseOptimizer:
     """Database optimization utilities"""
     
     def __init__(self):
         self.query_stats = {}
-        self.slow_query_threshold = 0.5  # 500ms
+        self.route_stats = {}
+        self.slow_query_threshold = float(os.getenv("QUERY_SLOW_THRESHOLD", "0.5"))  # 500ms
+        self.enabled = False
+        self._lock = threading.Lock()
         
     def setup_query_profiling(self, engine: Engine):
-        """Setup query profiling and logging"""
+        """Setup query profiling and logging (thống kê theo fingerprint và theo route)"""
+        if self.enabled:
+            return
+        self.enabled = True
         
         @event.listens_for(engine, "before_cursor_execute")
         def receive_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-            context._query_start_time = time.time()
+            context._query_start_time = time.perf_counter()
             
         @event.listens_for(engine, "after_cursor_execute")
         def receive_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-            execution_time = time.time() - context._query_start_time
-            
-            # Log slow queries
-            if execution_time > self.slow_query_threshold:
-                logger.warning(f"🐌 Slow query detected ({execution_time:.3f}s): {statement[:100]}...")
-                
-            # Track query statistics
-            query_hash = hashlib.md5(statement.encode()).hexdigest()[:8]
-            if query_hash not in self.query_stats:
-                self.query_stats[query_hash] = {
-                    'statement': statement[:200],
+            execution_time = time.perf_counter() - context._query_start_time
+            self.record_query(statement, execution_time, None if executemany else parameters)
+
+    def record_query(self, statement: str, execution_time: float, parameters=None):
+        fingerprint = fingerprint_statement(statement)
+        query_hash = hashlib.md5(fingerprint.encode()).hexdigest()[:8]
+
+        # Log slow queries
+        if execution_time > self.slow_query_threshold:
+            logger.warning(f"🐌 Slow query detected ({execution_time:.3f}s): {fingerprint[:100]}...")
+
+        with self._lock:
+            stats = self.query_stats.get(query_hash)
+            if stats is None:
+                stats = self.query_stats[query_hash] = {
+                    'fingerprint': fingerprint[:500],
                     'count': 0,
                     'total_time': 0,
-                    'avg_time': 0,
-                    'max_time': 0
+                    'max_time': 0,
+                    'histogram': LatencyHistogram(),
+                    # Câu SQL gốc + tham số lần đầu gặp, để EXPLAIN QUERY PLAN lại sau này
+                    'sample': (statement, tuple(parameters)) if isinstance(parameters, (tuple, list)) else None
                 }
-            
-            stats = self.query_stats[query_hash]
             stats['count'] += 1
             stats['total_time'] += execution_time
-            stats['avg_time'] = stats['total_time'] / stats['count']
             stats['max_time'] = max(stats['max_time'], execution_time)
+            stats['histogram'].add(execution_time * 1000)
+
+        profile = _request_profile.get()
+        if profile is not None:
+            profile['statements'] += 1
+            profile['db_time'] += execution_time
+            profile['fingerprints'][query_hash] = profile['fingerprints'].get(query_hash, 0) + 1
+
+    def record_request(self, route: str, profile: Dict[str, Any]):
+        """Ghi số câu SQL của một request vào thống kê của route (path template, vd GET /news/{news_id})"""
+        with self._lock:
+            stats = self.route_stats.get(route)
+            if stats is None:
+                stats = self.route_stats[route] = {
+                    'route': route,
+                    'requests': 0,
+                    'total_statements': 0,
+                    'max_statements': 0,
+                    'db_time': 0.0,
+                    'statements': {},
+                    'fingerprints': {}
+                }
+            stats['requests'] += 1
+            stats['total_statements'] += profile['statements']
+            stats['max_statements'] = max(stats['max_statements'], profile['statements'])
+            stats['db_time'] += profile['db_time']
+            stats['statements'][profile['statements']] = stats['statements'].get(profile['statements'], 0) + 1
+            for query_hash, count in profile['fingerprints'].items():
+                stats['fingerprints'][query_hash] = stats['fingerprints'].get(query_hash, 0) + count
+
+    def _query_view(self, query_hash: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'id': query_hash,
+            'fingerprint': stats['fingerprint'],
+            'count': stats['count'],
+            'total_time': round(stats['total_time'], 6),
+            'avg_time': round(stats['total_time'] / stats['count'], 6),
+            'max_time': round(stats['max_time'], 6),
+            'latency_ms': stats['histogram'].percentiles(),
+        }
 
-    def get_query_stats(self) -> Dict[str, Any]:
+    def _route_view(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        top = sorted(stats['fingerprints'].items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            'route': stats['route'],
+            'requests': stats['requests'],
+            'avg_statements': round(stats['total_statements'] / stats['requests'], 2),
+            'max_statements': stats['max_statements'],
+            'statements_per_request': count_percentiles(stats['statements']),
+            'avg_db_time_ms': round(stats['db_time'] / stats['requests'] * 1000, 3),
+            'top_queries': [
+                {'id': query_hash, 'count': count, 'fingerprint': self.query_stats[query_hash]['fingerprint']}
+                for query_hash, count in top if query_hash in self.query_stats
+            ],
+        }
+
+    def get_query_stats(self, limit: int = 10) -> Dict[str, Any]:
         """Get query performance statistics"""
+        with self._lock:
+            queries = [self._query_view(h, s) for h, s in self.query_stats.items()]
+            routes = [self._route_view(s) for s in self.route_stats.values()]
         return {
-            'total_queries': sum(stat['count'] for stat in self.query_stats.values()),
-            'slow_queries': len([s for s in self.query_stats.values() if s['max_time'] > self.slow_query_threshold]),
-            'top_slow_queries': sorted(
-                self.query_stats.values(),
-                key=lambda x: x['max_time'],
-                reverse=True
-            )[:10],
-            'most_frequent_queries': sorted(
-                self.query_stats.values(),
-                key=lambda x: x['count'],
-                reverse=True
-            )[:10]
+            'enabled': self.enabled,
+            'total_queries': sum(q['count'] for q in queries),
+            'distinct_queries': len(queries),
+            'slow_queries': len([q for q in queries if q['max_time'] > self.slow_query_threshold]),
+            'top_slow_queries': sorted(queries, key=lambda x: x['latency_ms']['p95'], reverse=True)[:limit],
+            'most_frequent_queries': sorted(queries, key=lambda x: x['count'], reverse=True)[:limit],
+            'top_total_time_queries': sorted(queries, key=lambda x: x['total_time'], reverse=True)[:limit],
+            # Route chạy nhiều câu SQL nhất mỗi request đứng đầu (dấu hiệu N+1)
+            'routes': sorted(routes, key=lambda x: x['max_statements'], reverse=True)[:limit]
         }
 
+    def reset_query_stats(self):
+        with self._lock:
+            self.query_stats.clear()
+            self.route_stats.clear()
+
+    # ---- Advisor cho SQLite (database thực tế là users.db) ----
+
+    def _table_columns(self, conn, table: str) -> List[str]:
+        return [row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')]
+
+    def _table_indexes(self, conn, table: str) -> List[Dict[str, Any]]:
+        indexes = []
+        for row in conn.exec_driver_sql(f'PRAGMA index_list("{table}")'):
+            name, unique, origin = row[1], bool(row[2]), row[3]
+            columns = [info[2] for info in conn.exec_driver_sql(f'PRAGMA index_info("{name}")')]
+            indexes.append({'name': name, 'columns': columns, 'unique': unique, 'origin': origin})
+        return indexes
+
+    def _unindexed_foreign_keys(self, conn, table: str, indexes: List[Dict[str, Any]]) -> List[str]:
+        """Cột khóa ngoại không đứng đầu index nào: mỗi lần lọc/join theo cột đó phải SCAN cả bảng"""
+        leading = {ix['columns'][0] for ix in indexes if ix['columns']}
+        columns = [row[3] for row in conn.exec_driver_sql(f'PRAGMA foreign_key_list("{table}")')]
+        return [column for column in dict.fromkeys(columns) if column not in leading]
+
     def analyze_table_usage(self, db: Session) -> Dict[str, Any]:
-        """Analyze table usage and suggest optimizations"""
-        try:
-            # Get table statistics (PostgreSQL specific)
-            result = db.execute(text("""
-                SELECT 
-                    schemaname,
-                    tablename,
-                    n_tup_ins as inserts,
-                    n_tup_upd as updates,
-                    n_tup_del as deletes,
-                    n_live_tup as live_tuples,
-                    n_dead_tup as dead_tuples,
-                    seq_scan as sequential_scans,
-                    seq_tup_read as sequential_reads,
-                    idx_scan as index_scans,
-                    idx_tup_fetch as index_reads
-                FROM pg_stat_user_tables 
-                ORDER BY seq_scan DESC;
-            """))
-            
-            tables = []
-            for row in result:
-                table_stats = {
-                    'schema': row.schemaname,
-                    'table': row.tablename,
-                    'inserts': row.inserts,
-                    'updates': row.updates,
-                    'deletes': row.deletes,
-                    'live_tuples': row.live_tuples,
-                    'dead_tuples': row.dead_tuples,
-                    'sequential_scans': row.sequential_scans,
-                    'sequential_reads': row.sequential_reads,
-                    'index_scans': row.index_scans or 0,
-                    'index_reads': row.index_reads or 0
+        """Analyze table usage and suggest optimizations (SQLite: số dòng, index hiện có, khóa ngoại chưa có index)"""
+        conn = db.connection()
+        tables = []
+        names = [row[0] for row in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        for table in names:
+            indexes = self._table_indexes(conn, table)
+            unindexed = self._unindexed_foreign_keys(conn, table, indexes)
+            rows = conn.exec_driver_sql(f'SELECT count(*) FROM "{table}"').scalar()
+            suggestions = [f"Foreign key {table}.{column} has no index" for column in unindexed]
+            tables.append({
+                'table': table,
+                'rows': rows,
+                'indexes': indexes,
+                'unindexed_foreign_keys': unindexed,
+                'suggestions': suggestions
+            })
+
+        has_stats = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).scalar() > 0
+        return {
+            'tables': sorted(tables, key=lambda t: t['rows'], reverse=True),
+            'summary': {
+                'total_tables': len(tables),
+                'total_rows': sum(t['rows'] for t in tables),
+                'tables_needing_indexes': len([t for t in tables if t['suggestions']]),
+                # Không có sqlite_stat1 thì planner đoán độ chọn lọc của index, chạy ANALYZE để có số liệu thật
+                'analyzed': has_stats,
+            }
+        }
+
+    def explain_query(self, db: Session, statement: str, parameters: tuple = ()) -> List[Dict[str, Any]]:
+        """EXPLAIN QUERY PLAN một câu SQL (không thực thi câu đó), trả về các bước SCAN/SEARCH"""
+        rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        plan = []
+        for row in rows:
+            detail = row[3]
+            match = _PLAN_SCAN.match(detail)
+            plan.append({
+                'detail': detail,
+                'full_scan': bool(match) and 'COVERING INDEX' not in detail,
+                'name': match.group(1) if match else None,
+                'temp_btree': 'TEMP B-TREE' in detail,
+            })
+        return plan
+
+    def explain_hot_queries(self, db: Session, limit: int = 20) -> List[Dict[str, Any]]:
+        """EXPLAIN các fingerprint tốn tổng thời gian nhiều nhất (cần bật profiling để có mẫu câu SQL)"""
+        with self._lock:
+            candidates = [
+                (query_hash, dict(stats)) for query_hash, stats in self.query_stats.items()
+                if stats['sample'] and _EXPLAINABLE.match(stats['sample'][0])
+            ]
+        candidates.sort(key=lambda item: item[1]['total_time'], reverse=True)
+
+        conn = db.connection()
+        columns_cache: Dict[str, List[str]] = {}
+        results = []
+        for query_hash, stats in candidates[:limit]:
+            statement, parameters = stats['sample']
+            try:
+                plan = self.explain_query(db, statement, parameters)
+            except Exception as e:
+                logger.warning(f"Could not explain query {query_hash}: {e}")
+                continue
+
+            aliases = _table_aliases(statement)
+            scans = []
+            for step in plan:
+                if not step['full_scan']:
+                    continue
+                table = aliases.get(step['name'], step['name'])
+                if table not in columns_cache:
+                    columns_cache[table] = self._table_columns(conn, table)
+                scans.append({
+                    'table': table,
+                    'hot_table': table in HOT_TABLES,
+                    'filter_columns': _predicate_columns(statement, table, aliases, columns_cache[table]),
+                })
+            results.append({
+                'id': query_hash,
+                'fingerprint': stats['fingerprint'],
+                'count': stats['count'],
+                'total_time': round(stats['total_time'], 6),
+                'plan': [step['detail'] for step in plan],
+                'full_scans': scans,
+                'temp_btree': any(step['temp_btree'] for step in plan),
+            })
+        return results
+
+    def suggest_indexes(self, db: Session, explained: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, str]]:
+        """Suggest missing indexes: từ full scan có điều kiện lọc trong hot query và từ khóa ngoại chưa có index"""
+        conn = db.connection()
+        if explained is None:
+            explained = self.explain_hot_queries(db)
+        suggestions: Dict[tuple, Dict[str, Any]] = {}
+        indexes_cache: Dict[str, List[Dict[str, Any]]] = {}
+
+        def table_indexes(table):
+            if table not in indexes_cache:
+                indexes_cache[table] = self._table_indexes(conn, table)
+            return indexes_cache[table]
+
+        def add(table, columns, reason, query_id=None):
+            key = (table, tuple(columns))
+            if key not in suggestions:
+                suggestions[key] = {
+                    'table': table,
+                    'columns': ', '.join(columns),
+                    'sql': index_ddl(table, columns),
+                    'reason': reason,
+                    'priority': 'high' if table in HOT_TABLES else 'normal',
+                    'queries': []
                 }
-                
-                # Calculate metrics
-                total_scans = table_stats['sequential_scans'] + table_stats['index_scans']
-                if total_scans > 0:
-                    table_stats['index_usage_ratio'] = table_stats['index_scans'] / total_scans
-                else:
-                    table_stats['index_usage_ratio'] = 0
-                    
-                # Suggestions
-                suggestions = []
-                if table_stats['index_usage_ratio'] < 0.7 and table_stats['sequential_scans'] > 1000:
-                    suggestions.append("Consider adding indexes for frequently queried columns")
-                if table_stats['dead_tuples'] > table_stats['live_tuples'] * 0.1:
-                    suggestions.append("Table needs VACUUM to clean up dead tuples")
-                if table_stats['sequential_reads'] > table_stats['live_tuples'] * 10:
-                    suggestions.append("High sequential scan ratio - review queries and indexes")
-                    
-                table_stats['suggestions'] = suggestions
-                tables.append(table_stats)
-            
+            if query_id and query_id not in suggestions[key]['queries']:
+                suggestions[key]['queries'].append(query_id)
+
+        for query in explained:
+            for scan in query['full_scans']:
+                columns = scan['filter_columns']
+                if not columns:
+                    continue  # Đọc cả bảng không điều kiện lọc, index không giúp được
+                if any(ix['columns'][:1] == columns[:1] for ix in table_indexes(scan['table'])):
+                    continue  # Đã có index nhưng planner không dùng: chạy ANALYZE trước khi thêm index
+                add(scan['table'], columns, f"Full scan on {scan['table']} filtered by {', '.join(columns)}", query['id'])
+
+        names = [row[0] for row in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in names:
+            for column in self._unindexed_foreign_keys(conn, table, table_indexes(table)):
+                if any(t == table and cols[0] == column for t, cols in suggestions):
+                    continue  # Index đề xuất từ hot query đã bắt đầu bằng cột này
+                add(table, [column], f"Foreign key {table}.{column} has no index (joins and lookups scan the table)")
+
+        return sorted(suggestions.values(), key=lambda s: (s['priority'] != 'high', -len(s['queries']), s['table']))
+
+    def advise(self, db: Session, limit: int = 20) -> Dict[str, Any]:
+        """Báo cáo đầy đủ: bảng, kế hoạch thực thi của hot query và DDL index đề xuất"""
+        explained = self.explain_hot_queries(db, limit)
+        return {
+            'tables': self.analyze_table_usage(db),
+            'hot_queries': explained,
+            'full_scans_on_hot_tables': [
+                {'id': query['id'], 'table': scan['table'], 'fingerprint': query['fingerprint']}
+                for query in explained for scan in query['full_scans'] if scan['hot_table']
+            ],
+            'index_suggestions': self.suggest_indexes(db, explained),
+        }
+
+_MISSING = object()
+
+def cache_namespace(key: str) -> str:
+    """Namespace thống kê của key: hai phần đầu, ví dụ catalog:programs:tree:50 -> catalog:programs"""
+    return ":".join(key.split(":")[:2])
+
+# estimate_size chỉ xem tối đa chừng này phần tử mỗi container, tới độ sâu SIZE_SAMPLE_DEPTH
+SIZE_SAMPLE = 8
+SIZE_SAMPLE_DEPTH = 4
+
+def estimate_size(value: Any, depth: int = SIZE_SAMPLE_DEPTH) -> int:
+    """
+    Kích thước ước lượng (byte) của value, dùng để giới hạn tổng dung lượng memory cache
+    Không serialize: len() cho bytes/str, container lấy mẫu vài phần tử rồi nhân theo số phần tử
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    else:
+        return sys.getsizeof(value)
+
+    size = sys.getsizeof(value)
+    if not value or depth <= 0:
+        return size
+    sample = list(islice(items, SIZE_SAMPLE))
+    if isinstance(value, dict):
+        sampled = sum(estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in sample)
+    else:
+        sampled = sum(estimate_size(item, depth - 1) for item in sample)
+    return size + sampled * len(value) // len(sample)
+
+class MemoryCache:
+    """
+    Memory cache có giới hạn: LRU theo số entry và tổng byte, TTL cho từng entry
+    Entry hết hạn bị xóa khi đọc tới hoặc bởi luồng dọn dẹp chạy định kỳ
+    Mỗi entry có thể gắn tag; invalidate_tag xóa đúng các key của tag đó
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 sweep_interval: float = 60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # key -> (value, expires_at, size, tags)
+        self._tags: Dict[str, set] = {}  # tag -> các key đang gắn tag
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stop = threading.Event()
+        self._sweeper = None
+
+    def _ns_stats(self, key: str) -> Dict[str, int]:
+        namespace = cache_namespace(key)
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+        return stats
+
+    def _remove(self, key: str):
+        _, _, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            stats = self._ns_stats(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                stats['misses'] += 1
+                return default
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                stats['expirations'] += 1
+                stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: float, tags: tuple = (), size: Optional[int] = None) -> bool:
+        """size: kích thước đã biết (vd độ dài bản encode cho Redis), không có thì ước lượng"""
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return False  # Một entry lớn hơn cả giới hạn thì không cache
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size, tuple(tags))
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._ns_stats(key)['sets'] += 1
+
+            # Bỏ entry ít dùng nhất cho tới khi về dưới giới hạn
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._ns_stats(oldest)['evictions'] += 1
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def delete_matching(self, pattern: str) -> int:
+        """Xóa các key khớp pattern glob (cùng cú pháp với Redis)"""
+        with self._lock:
+            keys = [k for k in self._entries if fnmatchcase(k, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Xóa mọi key gắn tag, O(số key của tag)"""
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def sweep(self) -> int:
+        """Xóa toàn bộ entry đã hết hạn, trả về số entry bị xóa"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, entry in self._entries.items() if entry[1] <= now]
+            for key in expired:
+                self._remove(key)
+                self._ns_stats(key)['expirations'] += 1
+            return len(expired)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.debug(f"🧹 Memory cache swept {removed} expired entries")
+            except Exception as e:
+                logger.warning(f"Memory cache sweep error: {e}")
+
+    def start_sweeper(self):
+        """Chạy luồng nền dọn entry hết hạn (daemon, mỗi sweep_interval giây)"""
+        if self.sweep_interval <= 0 or (self._sweeper and self._sweeper.is_alive()):
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="memory-cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper:
+            self._sweeper.join(timeout=1)
+            self._sweeper = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
             return {
-                'tables': tables,
-                'summary': {
-                    'total_tables': len(tables),
-                    'tables_needing_vacuum': len([t for t in tables if 'VACUUM' in str(t['suggestions'])]),
-                    'tables_needing_indexes': len([t for t in tables if 'indexes' in str(t['suggestions'])]),
-                }
+                'entries': len(self._entries),
+                'tags': len(self._tags),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'namespaces': {ns: dict(stats) for ns, stats in self._stats.items()},
             }
-            
-        except Exception as e:
-            logger.warning(f"Could not analyze table usage (might not be PostgreSQL): {e}")
-            return {'error': 'Table analysis not available'}
 
-    def suggest_indexes(self, db: Session) -> List[Dict[str, str]]:
-        """Suggest missing indexes based on query patterns"""
-        suggestions = []
-        
-        # Common patterns that benefit from indexes
-        common_patterns = [
-            {
-                'table': 'students',
-                'columns': ['email', 'student_id'],
-                'reason': 'Frequently used for lookups and authentication'
-            },
-            {
-                'table': 'schedules',
-                'columns': ['date', 'teacher_id', 'room_id'],
-                'reason': 'Common filters in schedule queries'
-            },
-            {
-                'table': 'users',
-                'columns': ['email', 'username', 'last_login'],
-                'reason': 'Authentication and user management queries'
-            },
-            {
-                'table': 'classes',
-                'columns': ['course_id', 'teacher_id', 'start_date'],
-                'reason': 'Course and teacher filtering'
-            }
-        ]
-        
-        try:
-            # Check existing indexes
-            result = db.execute(text("""
-                SELECT 
-                    t.relname as table_name,
-                    i.relname as index_name,
-                    array_to_string(array_agg(a.attname), ', ') as column_names
-                FROM 
-                    pg_class t,
-                    pg_class i,
-                    pg_index ix,
-                    pg_attribute a
-                WHERE 
-                    t.oid = ix.indrelid
-                    AND i.oid = ix.indexrelid
-                    AND a.attrelid = t.oid
-                    AND a.attnum = ANY(ix.indkey)
-                    AND t.relkind = 'r'
-                GROUP BY t.relname, i.relname
-                ORDER BY t.relname, i.relname;
-            """))
-            
-            existing_indexes = {}
-            for row in result:
-                table = row.table_name
-                if table not in existing_indexes:
-                    existing_indexes[table] = []
-                existing_indexes[table].append(row.column_names)
-            
-            # Check which suggested indexes are missing
-            for pattern in common_patterns:
-                table = pattern['table']
-                columns = ', '.join(pattern['columns'])
-                
-                if table not in existing_indexes or columns not in existing_indexes[table]:
-                    suggestions.append({
-                        'table': table,
-                        'columns': columns,
-                        'sql': f"CREATE INDEX idx_{table}_{'_'.join(pattern['columns'])} ON {table} ({columns});",
-                        'reason': pattern['reason']
-                    })
-                    
-        except Exception as e:
-            logger.warning(f"Could not analyze indexes: {e}")
-            
-        return suggestions
+class LocalInvalidationBus:
+    """Kênh invalidation trong process (test hoặc nhiều CacheManager cùng process)"""
+
+    def __init__(self):
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    def publish(self, message: Dict[str, Any]):
+        for callback in list(self._subscribers):
+            callback(message)
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        self._subscribers.append(callback)
+
+    def close(self):
+        self._subscribers.clear()
+
+class RedisInvalidationBus:
+    """Kênh invalidation qua Redis pub/sub, lắng nghe bằng luồng nền của redis-py"""
+
+    def __init__(self, redis_client, channel: str):
+        self.redis_client = redis_client
+        self.channel = channel
+        self._pubsub = None
+        self._thread = None
+
+    def publish(self, message: Dict[str, Any]):
+        self.redis_client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        def handler(raw):
+            try:
+                callback(json.loads(raw["data"]))
+            except Exception as e:
+                logger.warning(f"Invalid cache invalidation message: {e}")
+
+        self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: handler})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self):
+        if self._thread:
+            self._thread.stop()
+            self._thread = None
+        if self._pubsub:
+            self._pubsub.close()
+            self._pubsub = None
+
+# L1 (memory của từng worker) giữ bản sao tối đa chừng này giây khi có Redis, giới hạn độ trễ nếu lỡ mất message pub/sub
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "30"))
+
+# Tag set trên Redis sống ít nhất chừng này (giây), được gia hạn mỗi lần gắn thêm key
+CACHE_TAG_TTL = int(os.getenv("CACHE_TAG_TTL", "86400"))
+REDIS_DELETE_BATCH = 500
+
+# Xóa khóa chỉ khi token khớp (compare-and-delete nguyên tử)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
 
 class CacheManager:
-    """Advanced caching system with Redis and in-memory fallback"""
+    """
+    Advanced caching system with Redis and in-memory fallback
+    Khi có Redis, memory_cache là L1 của từng worker đứng trước Redis (L2); mỗi thay đổi được phát
+    qua invalidation bus để các worker khác bỏ bản sao L1
+    Key Redis có tiền tố namespace (CACHE_NAMESPACE) để dùng chung Redis với ứng dụng khác;
+    tag lưu bằng Redis set <namespace>:tag:<tag> chứa các key gắn tag
+    """
     
-    def __init__(self, redis_url: Optional[str] = None):
+    def __init__(self, redis_url: Optional[str] = None, memory_cache: Optional[MemoryCache] = None,
+                 namespace: Optional[str] = None, invalidation_bus=None, l1_ttl: float = CACHE_L1_TTL,
+                 codec: Optional[str] = None):
         self.redis_client = None
-        self.memory_cache = {}
+        self.memory_cache = memory_cache or MemoryCache()
+        self.namespace = namespace or os.getenv("CACHE_NAMESPACE", "ctu-lms")
+        self.l1_ttl = l1_ttl
+        self.codecs = CodecSet(get_codec(codec))  # Định dạng giá trị trên Redis (header codec + nén)
+        if self.codecs.default.name == "pickle" and not cache_codecs.ALLOW_PICKLE:
+            # Ghi được nhưng mọi lần đọc đều bị từ chối, cache Redis sẽ luôn miss
+            raise ValueError("CACHE_CODEC=pickle requires CACHE_ALLOW_PICKLE=1")
+        self.origin = uuid.uuid4().hex  # Bỏ qua message do chính worker này phát
+        self.invalidation_bus = None
         self.cache_stats = {
             'hits': 0,
             'misses': 0,
-            'errors': 0
+            'errors': 0,
+            'l1_hits': 0,
+            'l2_hits': 0,
+            'invalidations_received': 0,
+            # Chống stampede trong @cached
+            'coalesced': 0,
+            'lock_waits': 0,
+            'early_refreshes': 0,
+            'stale_served': 0
         }
         
-        if redis_url:
+        if redis_url and redis is None:
+            logger.warning("⚠️ redis package not installed, using memory cache")
+        elif redis_url:
             try:
                 self.redis_client = redis.from_url(redis_url, decode_responses=False)
                 self.redis_client.ping()
                 logger.info("✅ Redis cache connected")
             except Exception as e:
                 logger.warning(f"⚠️ Redis connection failed, using memory cache: {e}")
+
+        if invalidation_bus is None and self.redis_client:
+            invalidation_bus = RedisInvalidationBus(self.redis_client, f"{self.namespace}:invalidate")
+        if invalidation_bus is not None:
+            self.attach_invalidation_bus(invalidation_bus)
+
+    def attach_invalidation_bus(self, bus):
+        try:
+            bus.subscribe(self._on_invalidation)
+            self.invalidation_bus = bus
+        except Exception as e:
+            logger.warning(f"⚠️ Cache invalidation bus unavailable, L1 relies on TTL only: {e}")
+
+    def _publish(self, op: str, items: List[str] = ()):
+        if not self.invalidation_bus:
+            return
+        try:
+            self.invalidation_bus.publish({'origin': self.origin, 'op': op, 'items': list(items)})
+        except Exception as e:
+            logger.warning(f"Cache invalidation publish error: {e}")
+            self.cache_stats['errors'] += 1
+
+    def _on_invalidation(self, message: Dict[str, Any]):
+        """Áp dụng invalidation từ worker khác lên L1"""
+        if message.get('origin') == self.origin:
+            return
+        self.cache_stats['invalidations_received'] += 1
+        op, items = message.get('op'), message.get('items', [])
+        if op == 'keys':
+            for key in items:
+                self.memory_cache.delete(key)
+        elif op == 'tags':
+            for tag in items:
+                self.memory_cache.invalidate_tag(tag)
+        elif op == 'pattern':
+            for pattern in items:
+                self.memory_cache.delete_matching(pattern)
+        elif op == 'clear':
+            self.memory_cache.clear()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    def _redis_delete(self, keys: List) -> int:
+        deleted = 0
+        for i in range(0, len(keys), REDIS_DELETE_BATCH):
+            deleted += self.redis_client.delete(*keys[i:i + REDIS_DELETE_BATCH])
+        return deleted
     
     def get(self, key: str) -> Any:
-        """Get value from cache"""
+        """Get value from cache: L1 (memory) trước, sau đó Redis"""
         try:
-            # Try Redis first
+            value = self.memory_cache.get(key, _MISSING)
+            if value is not _MISSING:
+                self.cache_stats['hits'] += 1
+                self.cache_stats['l1_hits'] += 1
+                return value
+
             if self.redis_client:
                 try:
-                    value = self.redis_client.get(key)
-                    if value is not None:
+                    raw = self.redis_client.get(self._redis_key(key))
+                    if raw is not None:
+                        value = self.codecs.decode(raw)
+                        self.memory_cache.set(key, value, self.l1_ttl, size=len(raw))
                         self.cache_stats['hits'] += 1
-                        return pickle.loads(value)
+                        self.cache_stats['l2_hits'] += 1
+                        return value
+                except CodecError as e:
+                    logger.warning(f"Cache decode error for {key}, treating as miss: {e}")
+                    self.cache_stats['errors'] += 1
                 except Exception as e:
                     logger.warning(f"Redis get error: {e}")
                     self.cache_stats['errors'] += 1
             
-            # Fallback to memory cache
-            if key in self.memory_cache:
-                entry = self.memory_cache[key]
-                if entry['expires'] > datetime.now():
-                    self.cache_stats['hits'] += 1
-                    return entry['value']
-                else:
-                    del self.memory_cache[key]
-            
             self.cache_stats['misses'] += 1
             return None
             
@@ -268,25 +849,33 @@ class CacheManager:
             self.cache_stats['errors'] += 1
             return None
     
-    def set(self, key: str, value: Any, ttl: int = 300) -> bool:
-        """Set value in cache with TTL in seconds"""
+    def set(self, key: str, value: Any, ttl: int = 300, tags: tuple = ()) -> bool:
+        """Set value in cache with TTL in seconds, gắn key vào các tag để invalidate theo nhóm"""
         try:
             # Try Redis first
             if self.redis_client:
                 try:
-                    serialized = pickle.dumps(value)
-                    self.redis_client.setex(key, ttl, serialized)
+                    serialized = self.codecs.encode(value)
+                    redis_key = self._redis_key(key)
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.setex(redis_key, ttl, serialized)
+                    for tag in tags:
+                        pipe.sadd(self._tag_key(tag), redis_key)
+                        pipe.expire(self._tag_key(tag), max(ttl, CACHE_TAG_TTL))
+                    pipe.execute()
+                    # Giữ bản sao L1 ngắn hạn và báo các worker khác bỏ bản cũ
+                    self.memory_cache.set(key, value, min(ttl, self.l1_ttl), tags, size=len(serialized))
+                    self._publish('keys', [key])
                     return True
+                except CodecError as e:
+                    logger.warning(f"Cache value for {key} not serializable with {self.codecs.default.name}, memory only: {e}")
+                    self.cache_stats['errors'] += 1
                 except Exception as e:
                     logger.warning(f"Redis set error: {e}")
                     self.cache_stats['errors'] += 1
             
             # Fallback to memory cache
-            self.memory_cache[key] = {
-                'value': value,
-                'expires': datetime.now() + timedelta(seconds=ttl)
-            }
-            return True
+            return self.memory_cache.set(key, value, ttl, tags)
             
         except Exception as e:
             logger.error(f"Cache set error: {e}")
@@ -300,13 +889,13 @@ class CacheManager:
             
             if self.redis_client:
                 try:
-                    deleted = bool(self.redis_client.delete(key))
+                    deleted = bool(self.redis_client.delete(self._redis_key(key)))
                 except Exception as e:
                     logger.warning(f"Redis delete error: {e}")
             
-            if key in self.memory_cache:
-                del self.memory_cache[key]
+            if self.memory_cache.delete(key):
                 deleted = True
+            self._publish('keys', [key])
                 
             return deleted
             
@@ -314,16 +903,96 @@ class CacheManager:
             logger.error(f"Cache delete error: {e}")
             return False
     
-    def clear(self) -> bool:
-        """Clear all cache"""
+    def acquire_lock(self, key: str, timeout: float) -> Optional[str]:
+        """Khóa việc tính lại một key giữa các worker (SET NX PX); trả token, None nếu worker khác đang giữ"""
+        token = uuid.uuid4().hex
+        if not self.redis_client:
+            return token  # Một worker: SingleFlight trong process là đủ
+        try:
+            if self.redis_client.set(self._lock_key(key), token, nx=True, px=int(timeout * 1000)):
+                return token
+            return None
+        except Exception as e:
+            logger.warning(f"Redis lock error: {e}")
+            return token  # Redis lỗi thì vẫn cho tính lại, không chặn request
+
+    def release_lock(self, key: str, token: str):
+        """Chỉ xóa khóa nếu vẫn là của mình (khóa có thể đã hết hạn và bị worker khác lấy)"""
+        if not self.redis_client:
+            return
         try:
+            self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), token)
+        except Exception as e:
+            logger.warning(f"Redis unlock error: {e}")
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """Xóa mọi key gắn một trong các tag, chi phí O(số key của tag) thay vì quét toàn bộ keyspace"""
+        removed = 0
+        # L1 của worker khác có thể chứa key đọc từ Redis mà không biết tag, nên phát cả danh sách key
+        member_keys = []
+        prefix_len = len(self.namespace) + 1
+        for tag in tags:
             if self.redis_client:
                 try:
-                    self.redis_client.flushdb()
+                    tag_key = self._tag_key(tag)
+                    members = list(self.redis_client.smembers(tag_key))
+                    if members:
+                        removed += self._redis_delete(members)
+                        member_keys.extend(
+                            (m.decode("utf-8") if isinstance(m, bytes) else m)[prefix_len:] for m in members
+                        )
+                    self.redis_client.delete(tag_key)
                 except Exception as e:
-                    logger.warning(f"Redis clear error: {e}")
-            
+                    logger.warning(f"Redis tag invalidation error: {e}")
+                    self.cache_stats['errors'] += 1
+            removed += self.memory_cache.invalidate_tag(tag)
+        if member_keys:
+            self._publish('keys', member_keys)
+        self._publish('tags', list(tags))
+        return removed
+
+    def _scan_redis(self, pattern: str):
+        prefix_len = len(self.namespace) + 1
+        for k in self.redis_client.scan_iter(match=self._redis_key(pattern), count=REDIS_DELETE_BATCH):
+            k = k.decode("utf-8") if isinstance(k, bytes) else k
+            yield k[prefix_len:]
+
+    def scan_keys(self, pattern: str) -> List[str]:
+        """Liệt kê key khớp pattern glob trên Redis (SCAN, không chặn server) và memory cache"""
+        keys = set(k for k in self.memory_cache.keys() if fnmatchcase(k, pattern))
+        if self.redis_client:
+            try:
+                keys.update(self._scan_redis(pattern))
+            except Exception as e:
+                logger.warning(f"Redis scan error: {e}")
+        return sorted(keys)
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Xóa key khớp pattern glob; Redis dùng SCAN theo lô thay vì KEYS"""
+        removed = 0
+        if self.redis_client:
+            try:
+                batch = []
+                for key in self._scan_redis(pattern):
+                    batch.append(self._redis_key(key))
+                    if len(batch) >= REDIS_DELETE_BATCH:
+                        removed += self._redis_delete(batch)
+                        batch = []
+                if batch:
+                    removed += self._redis_delete(batch)
+            except Exception as e:
+                logger.warning(f"Redis pattern delete error: {e}")
+                self.cache_stats['errors'] += 1
+        removed += self.memory_cache.delete_matching(pattern)
+        self._publish('pattern', [pattern])
+        return removed
+
+    def clear(self) -> bool:
+        """Clear all cache (chỉ các key trong namespace của ứng dụng, không flushdb Redis dùng chung)"""
+        try:
+            self.delete_pattern("*")
             self.memory_cache.clear()
+            self._publish('clear')
             return True
             
         except Exception as e:
@@ -340,7 +1009,17 @@ class CacheManager:
             'misses': self.cache_stats['misses'],
             'errors': self.cache_stats['errors'],
             'hit_rate': round(hit_rate, 2),
-            'memory_cache_size': len(self.memory_cache)
+            'l1_hits': self.cache_stats['l1_hits'],
+            'l2_hits': self.cache_stats['l2_hits'],
+            'invalidations_received': self.cache_stats['invalidations_received'],
+            'stampede': {
+                name: self.cache_stats[name]
+                for name in ('coalesced', 'lock_waits', 'early_refreshes', 'stale_served')
+            },
+            'invalidation_bus': type(self.invalidation_bus).__name__ if self.invalidation_bus else None,
+            'memory_cache_size': len(self.memory_cache),
+            'memory_cache': self.memory_cache.get_stats(),
+            'serialization': self.codecs.get_stats()
         }
         
         if self.redis_client:
@@ -358,98 +1037,416 @@ class CacheManager:
             
         return stats
 
-# Global cache instance
-cache_manager = CacheManager()
+# Global cache instance (REDIS_URL không đặt thì chỉ dùng memory cache)
+cache_manager = CacheManager(
+    os.getenv("REDIS_URL"),
+    MemoryCache(
+        max_entries=int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024))),
+        sweep_interval=float(os.getenv("CACHE_SWEEP_INTERVAL", "60")),
+    )
+)
+# Luồng dọn entry hết hạn được bật trong startup của app (main.py), import module không tạo thread
+
+# Tăng khi đổi định dạng dữ liệu cache để key cũ (kể cả trên Redis dùng chung) không còn được đọc
+CACHE_KEY_VERSION = os.getenv("CACHE_KEY_VERSION", "v1")
+
+class UncacheableArguments(TypeError):
+    """Tham số không chuyển được thành key ổn định (object tùy ý, self...)"""
+
+def _canonical_default(value: Any):
+    """Chuẩn hóa các kiểu không phải JSON thành giá trị ổn định giữa các process"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, bytes):
+        return value.hex()
+    if hasattr(value, "model_dump"):  # Pydantic model
+        return value.model_dump(mode="json")
+    raise UncacheableArguments(
+        f"Cannot build a stable cache key from {type(value).__name__}; exclude this argument"
+    )
+
+def canonical_args(arguments: Dict[str, Any]) -> str:
+    """Serialize tham số theo thứ tự cố định (không dùng hash() vì Python salt hash chuỗi theo từng process)"""
+    try:
+        return json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=_canonical_default, ensure_ascii=False)
+    except UncacheableArguments:
+        raise
+    except (TypeError, ValueError) as e:  # dict có key không phải chuỗi, tham chiếu vòng...
+        raise UncacheableArguments(f"Cannot build a stable cache key: {e}") from e
+
+def function_key_prefix(func: Callable, key_prefix: str = "", version: Optional[str] = None) -> str:
+    """Tiền tố chung cho mọi key của một hàm: <prefix>:<module.qualname>:<version>"""
+    name = f"{func.__module__}.{func.__qualname__}"
+    return ":".join(filter(None, [key_prefix or "fn", name, version or CACHE_KEY_VERSION]))
+
+def make_cache_key(func: Callable, args: tuple, kwargs: dict, key_prefix: str = "",
+                   exclude: tuple = (), version: Optional[str] = None, signature=None) -> str:
+    """
+    Key xác định: tham số được bind theo tên (f(1) và f(x=1) cùng key),
+    bỏ các tham số trong exclude và mọi Session (dù tên tham số là gì)
+    """
+    signature = signature or inspect.signature(func)
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {
+        name: value for name, value in bound.arguments.items()
+        if name not in exclude and not isinstance(value, Session)
+    }
+    digest = hashlib.sha256(canonical_args(arguments).encode("utf-8")).hexdigest()[:32]
+    return f"{function_key_prefix(func, key_prefix, version)}:{digest}"
+
+def _attach_cache_helpers(wrapper: Callable, func: Callable, key_prefix: str, exclude: tuple,
+                          version: Optional[str], signature):
+    prefix = function_key_prefix(func, key_prefix, version)
+    wrapper.cache_key = lambda *args, **kwargs: make_cache_key(
+        func, args, kwargs, key_prefix, exclude, version, signature
+    )
+    wrapper.invalidate = lambda *args, **kwargs: cache_manager.delete(wrapper.cache_key(*args, **kwargs))
+    wrapper.key_pattern = f"{prefix}:*"
+    wrapper.cache_keys = lambda: cache_manager.scan_keys(wrapper.key_pattern)
+    wrapper.invalidate_all = lambda: invalidate_cache_pattern(wrapper.key_pattern)
+
+def _resolve_tags(tags, args: tuple, kwargs: dict) -> tuple:
+    """tags có thể là tuple cố định hoặc hàm nhận cùng tham số với hàm được cache"""
+    if callable(tags):
+        return tuple(tags(*args, **kwargs))
+    return tuple(tags)
+
+# Chống cache stampede cho @cached / @cached_query
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "30"))
+CACHE_LOCK_POLL = 0.05
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+_ENVELOPE = "__cached__"
+
+def _envelope(value: Any, ttl: int, delta: float) -> Dict[str, Any]:
+    """Giá trị kèm hạn logic và thời gian tính (delta) để quyết định tính lại sớm"""
+    return {_ENVELOPE: 1, 'value': value, 'expires_at': time.time() + ttl, 'delta': delta}
+
+def _entry_state(entry: Any, beta: float) -> str:
+    """miss / fresh / early / stale; early theo XFetch: xác suất tăng khi gần hết hạn và khi hàm chạy lâu"""
+    if not isinstance(entry, dict) or entry.get(_ENVELOPE) != 1:
+        return 'miss'
+    now = time.time()
+    if now >= entry['expires_at']:
+        return 'stale'
+    if beta > 0 and now - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['expires_at']:
+        return 'early'
+    return 'fresh'
+
+class SingleFlight:
+    """Gộp các lời gọi tính lại cùng key trong một worker: một lời gọi chạy, các lời gọi khác dùng chung kết quả"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, Any] = {}
+        self._executor = None
+
+    def _join(self, key: str):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+            return call, True
+
+    def _run(self, key: str, call: Dict[str, Any], fn: Callable):
+        try:
+            call['result'] = fn()
+        except BaseException as e:
+            call['error'] = e
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
+
+    def do(self, key: str, fn: Callable) -> Any:
+        call, leader = self._join(key)
+        if leader:
+            self._run(key, call, fn)
+        else:
+            cache_manager.cache_stats['coalesced'] += 1
+            call['event'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+    def spawn(self, key: str, fn: Callable):
+        """Tính lại trong thread nền, bỏ qua nếu key đang được tính"""
+        call, leader = self._join(key)
+        if not leader:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+        self._executor.submit(self._run, key, call, fn)
+
+    def _task(self, key: str, coro_fn: Callable):
+        task = self._tasks.get(key)
+        if task is not None:
+            return task, False
+        task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+
+        def done(t):
+            if self._tasks.get(key) is t:
+                del self._tasks[key]
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning(f"Cache refresh failed for {key}: {t.exception()}")
+        task.add_done_callback(done)
+        return task, True
+
+    async def do_async(self, key: str, coro_fn: Callable) -> Any:
+        task, leader = self._task(key, coro_fn)
+        if not leader:
+            cache_manager.cache_stats['coalesced'] += 1
+        # shield: một request bị hủy không hủy lần tính mà các request khác đang chờ
+        return await asyncio.shield(task)
+
+    def spawn_async(self, key: str, coro_fn: Callable):
+        self._task(key, coro_fn)
+
+single_flight = SingleFlight()
+
+def _detach_sessions(args: tuple, kwargs: dict):
+    """Tác vụ nền chạy sau khi request đóng Session, nên thay bằng Session mới cùng engine"""
+    opened = []
+
+    def swap(value):
+        if isinstance(value, Session):
+            value = Session(bind=value.get_bind())
+            opened.append(value)
+        return value
+
+    return tuple(swap(a) for a in args), {k: swap(v) for k, v in kwargs.items()}, opened
+
+def _wait_for_fresh(cache_key: str, timeout: float):
+    """Worker khác đang giữ khóa: chờ nó ghi giá trị mới thay vì cùng chạy lại hàm"""
+    cache_manager.cache_stats['lock_waits'] += 1
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LOCK_POLL)
+        entry = cache_manager.get(cache_key)
+        if _entry_state(entry, 0) == 'fresh':
+            return entry
+    return None
+
+async def _wait_for_fresh_async(cache_key: str, timeout: float):
+    cache_manager.cache_stats['lock_waits'] += 1
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(CACHE_LOCK_POLL)
+        entry = cache_manager.get(cache_key)
+        if _entry_state(entry, 0) == 'fresh':
+            return entry
+    return None
+
+_uncacheable_warned = set()
+
+def _warn_uncacheable(func: Callable, error: Exception):
+    """Chỉ cảnh báo lần đầu mỗi hàm để không ngập log"""
+    name = f"{func.__module__}.{func.__qualname__}"
+    if name not in _uncacheable_warned:
+        _uncacheable_warned.add(name)
+        logger.warning(f"⚠️ Cache bypassed for {name}: {error}")
+
+def _stampede_wrapper(func: Callable, key_for: Callable, ttl: int, tags, stale_ttl: int, early_refresh,
+                      lock_timeout: float) -> Callable:
+    """Bọc func: đọc cache, tính lại (đồng bộ hoặc nền) khi miss / sắp hết hạn / đã cũ"""
+    beta = CACHE_EARLY_REFRESH_BETA if early_refresh is True else float(early_refresh or 0)
+
+    def store(cache_key, value, started, args, kwargs):
+        delta = time.perf_counter() - started
+        cache_manager.set(cache_key, _envelope(value, ttl, delta), ttl + stale_ttl, _resolve_tags(tags, args, kwargs))
+
+    if inspect.iscoroutinefunction(func):
+        async def compute(cache_key, args, kwargs, fallback=_MISSING, background=False):
+            token = cache_manager.acquire_lock(cache_key, lock_timeout)
+            if token is None:
+                if fallback is not _MISSING or background:
+                    return fallback  # Worker khác đang tính lại, tạm dùng giá trị hiện có
+                entry = await _wait_for_fresh_async(cache_key, lock_timeout)
+                if entry is not None:
+                    return entry['value']
+            opened = []
+            if background:
+                args, kwargs, opened = _detach_sessions(args, kwargs)
+            try:
+                started = time.perf_counter()
+                value = await func(*args, **kwargs)
+                store(cache_key, value, started, args, kwargs)
+                return value
+            finally:
+                for session in opened:
+                    session.close()
+                if token is not None:
+                    cache_manager.release_lock(cache_key, token)
 
-def cached(ttl: int = 300, key_prefix: str = ""):
-    """Decorator for caching function results"""
-    def decorator(func: Callable) -> Callable:
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            # Generate cache key
-            key_parts = [key_prefix, func.__name__]
-            if args:
-                key_parts.append(str(hash(args)))
-            if kwargs:
-                key_parts.append(str(hash(tuple(sorted(kwargs.items())))))
-            cache_key = ":".join(filter(None, key_parts))
-            
-            # Try to get from cache
-            cached_result = cache_manager.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache_manager.set(cache_key, result, ttl)
-            return result
-            
-        wrapper.cache_key = lambda *args, **kwargs: ":".join(filter(None, [
-            key_prefix, func.__name__,
-            str(hash(args)) if args else "",
-            str(hash(tuple(sorted(kwargs.items())))) if kwargs else ""
-        ]))
-        wrapper.invalidate = lambda *args, **kwargs: cache_manager.delete(
-            wrapper.cache_key(*args, **kwargs)
-        )
-        
+        async def wrapper(*args, **kwargs):
+            try:
+                cache_key = key_for(args, kwargs)
+            except UncacheableArguments as e:
+                _warn_uncacheable(func, e)
+                return await func(*args, **kwargs)
+            entry = cache_manager.get(cache_key)
+            state = _entry_state(entry, beta)
+            if state == 'fresh':
+                return entry['value']
+            if state == 'miss' or (state == 'stale' and not stale_ttl):
+                return await single_flight.do_async(cache_key, lambda: compute(cache_key, args, kwargs))
+
+            cache_manager.cache_stats['stale_served' if state == 'stale' else 'early_refreshes'] += 1
+            if stale_ttl:
+                single_flight.spawn_async(cache_key, lambda: compute(cache_key, args, kwargs, background=True))
+                return entry['value']
+            return await single_flight.do_async(
+                cache_key, lambda: compute(cache_key, args, kwargs, fallback=entry['value'])
+            )
+        return wrapper
+
+    def compute(cache_key, args, kwargs, fallback=_MISSING, background=False):
+        token = cache_manager.acquire_lock(cache_key, lock_timeout)
+        if token is None:
+            if fallback is not _MISSING or background:
+                return fallback
+            entry = _wait_for_fresh(cache_key, lock_timeout)
+            if entry is not None:
+                return entry['value']
+        opened = []
+        if background:
+            args, kwargs, opened = _detach_sessions(args, kwargs)
+        try:
+            started = time.perf_counter()
+            value = func(*args, **kwargs)
+            store(cache_key, value, started, args, kwargs)
+            return value
+        except Exception as e:
+            if background:
+                logger.warning(f"Cache refresh failed for {cache_key}: {e}")
+                return None
+            raise
+        finally:
+            for session in opened:
+                session.close()
+            if token is not None:
+                cache_manager.release_lock(cache_key, token)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            cache_key = key_for(args, kwargs)
+        except UncacheableArguments as e:
+            _warn_uncacheable(func, e)  # Gọi thẳng hàm thay vì lỗi ở mọi request
+            return func(*args, **kwargs)
+        entry = cache_manager.get(cache_key)
+        state = _entry_state(entry, beta)
+        if state == 'fresh':
+            return entry['value']
+        if state == 'miss' or (state == 'stale' and not stale_ttl):
+            return single_flight.do(cache_key, lambda: compute(cache_key, args, kwargs))
+
+        cache_manager.cache_stats['stale_served' if state == 'stale' else 'early_refreshes'] += 1
+        if stale_ttl:
+            single_flight.spawn(cache_key, lambda: compute(cache_key, args, kwargs, background=True))
+            return entry['value']
+        return single_flight.do(cache_key, lambda: compute(cache_key, args, kwargs, fallback=entry['value']))
+    return wrapper
+
+def cached(ttl: int = 300, key_prefix: str = "", exclude: tuple = ("db",), version: Optional[str] = None,
+           tags=(), stale_ttl: int = 0, early_refresh=True, lock_timeout: float = CACHE_LOCK_TIMEOUT):
+    """
+    Decorator for caching function results (key ổn định giữa các worker, bỏ qua tham số trong exclude và Session)
+    Tham số không tạo được key (object tùy ý, self...) thì gọi thẳng hàm, không cache, kèm một cảnh báo
+    Hỗ trợ cả hàm async; chống stampede khi key hết hạn:
+    - các lời gọi cùng key chỉ tính lại một lần (SingleFlight trong worker, khóa Redis giữa các worker)
+    - early_refresh: tính lại sớm ngẫu nhiên trước khi hết hạn (XFetch), True dùng CACHE_EARLY_REFRESH_BETA
+    - stale_ttl > 0: hết hạn rồi vẫn trả giá trị cũ thêm stale_ttl giây trong khi một tác vụ nền tính lại
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        key_for = lambda args, kwargs: make_cache_key(func, args, kwargs, key_prefix, exclude, version, signature)
+        wrapper = _stampede_wrapper(func, key_for, ttl, tags, stale_ttl, early_refresh, lock_timeout)
+        _attach_cache_helpers(wrapper, func, key_prefix, exclude, version, signature)
         return wrapper
     return decorator
 
 def invalidate_cache_pattern(pattern: str):
-    """Invalidate cache keys matching pattern"""
+    """Invalidate cache keys matching pattern (ưu tiên invalidate_cache_tags khi entry có gắn tag)"""
     try:
-        if cache_manager.redis_client:
-            keys = cache_manager.redis_client.keys(pattern)
-            if keys:
-                cache_manager.redis_client.delete(*keys)
-                logger.info(f"Invalidated {len(keys)} cache keys matching '{pattern}'")
-        
-        # Clear memory cache entries matching pattern
-        keys_to_delete = [k for k in cache_manager.memory_cache.keys() if pattern in k]
-        for key in keys_to_delete:
-            del cache_manager.memory_cache[key]
-            
+        removed = cache_manager.delete_pattern(pattern)
+        if removed:
+            logger.info(f"Invalidated {removed} cache keys matching '{pattern}'")
     except Exception as e:
         logger.error(f"Error invalidating cache pattern: {e}")
 
+def invalidate_cache_tags(*tags: str) -> int:
+    """Invalidate mọi entry gắn một trong các tag, ví dụ invalidate_cache_tags("programs:khoa:2024")"""
+    try:
+        return cache_manager.invalidate_tags(*tags)
+    except Exception as e:
+        logger.error(f"Error invalidating cache tags: {e}")
+        return 0
+
 # Database session caching
-def cached_query(ttl: int = 300):
-    """Decorator for caching database queries"""
+def cached_query(ttl: int = 300, exclude: tuple = ("db",), version: Optional[str] = None, tags=(),
+                 stale_ttl: int = 0, early_refresh=True, lock_timeout: float = CACHE_LOCK_TIMEOUT):
+    """Decorator for caching database queries (Session không tham gia vào key, tham số như @cached)"""
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(db: Session, *args, **kwargs):
-            # Generate cache key based on query
-            key_parts = ["query", func.__name__]
-            if args:
-                key_parts.append(str(hash(args)))
-            if kwargs:
-                key_parts.append(str(hash(tuple(sorted(kwargs.items())))))
-            cache_key = ":".join(key_parts)
-            
-            # Try cache first
-            cached_result = cache_manager.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute query and cache
-            result = func(db, *args, **kwargs)
-            cache_manager.set(cache_key, result, ttl)
-            return result
-            
+        signature = inspect.signature(func)
+        key_for = lambda args, kwargs: make_cache_key(func, args, kwargs, "query", exclude, version, signature)
+        wrapper = _stampede_wrapper(func, key_for, ttl, tags, stale_ttl, early_refresh, lock_timeout)
+        _attach_cache_helpers(wrapper, func, "query", exclude, version, signature)
         return wrapper
     return decorator
 
 # Initialize database optimizer
 db_optimizer = DatabaseOptimizer()
 
+UNMATCHED_ROUTE = "<unmatched>"
+
+class QueryProfilingMiddleware:
+    """ASGI middleware đếm câu SQL và thời gian DB của từng request, gộp theo method + path template"""
+
+    def __init__(self, app, optimizer: DatabaseOptimizer = db_optimizer):
+        self.app = app
+        self.optimizer = optimizer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = {'statements': 0, 'db_time': 0.0, 'fingerprints': {}}
+        token = _request_profile.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_profile.reset(token)
+            # Router gắn route khớp vào scope; request không khớp route nào (404, quét đường dẫn) gộp chung
+            # một key để số entry route_stats không tăng theo URL do client gửi lên
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            self.optimizer.record_request(f"{scope['method']} {route}", profile)
+
 # Export utilities
 __all__ = [
     'DatabaseOptimizer',
+    'QueryProfilingMiddleware',
+    'fingerprint_statement',
     'CacheManager', 
+    'MemoryCache',
+    'LocalInvalidationBus',
+    'RedisInvalidationBus',
     'cache_manager',
     'cached',
     'cached_query',
+    'SingleFlight',
+    'single_flight',
+    'make_cache_key',
+    'CACHE_KEY_VERSION',
     'invalidate_cache_pattern',
+    'invalidate_cache_tags',
     'db_optimizer'
 ]
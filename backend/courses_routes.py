@@ -3,6 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from database import SessionLocal
 import models, schemas
+import catalog_cache
+from catalog_cache import COURSES, catalog_key
 
 router = APIRouter(prefix="/admin", tags=["Courses"])  # ✅ prefix và tags rõ ràng
 
@@ -17,8 +19,11 @@ from typing import List
 
 @router.get("/courses", response_model=List[schemas.CourseOut])
 def get_courses(db: Session = Depends(get_db)):
-    courses = db.query(models.Course).all()
-    return courses
+    def load():
+        courses = db.query(models.Course).all()
+        return [schemas.CourseOut.model_validate(c).model_dump() for c in courses]
+
+    return catalog_cache.cached_response(COURSES, catalog_key(COURSES, "all"), load)
 
 
 @router.post("/courses", response_model=schemas.CourseOut)
@@ -33,5 +38,6 @@ def create_course(course: schemas.CourseCreate, db: Session = Depends(get_db)):
     )
     db.add(new_course)
     db.commit()
+    catalog_cache.invalidate(COURSES)
     db.refresh(new_course)
     return new_course
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 import os
@@ -6,17 +6,50 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # thư mục của database.py
 DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'users.db')}"
 
-# Cấu hình engine với pool settings tối ưu cho SQLite
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False},
-    pool_size=20,           # Tăng pool size
-    max_overflow=0,         # Không cho overflow để tránh tạo quá nhiều connection
-    pool_timeout=30,        # Timeout 30 giây
-    pool_recycle=3600,      # Recycle connection sau 1 giờ
-    pool_pre_ping=True,     # Test connection trước khi sử dụng
-    echo=False              # Tắt logging SQL để tăng performance
-)
+# Pragma đặt cho mỗi connection SQLite mới
+# - WAL: reader không bị writer chặn (và ngược lại), chỉ các writer phải xếp hàng
+# - synchronous=NORMAL: an toàn với WAL (không hỏng file khi crash), chỉ fsync lúc checkpoint
+# - busy_timeout: writer chờ khóa thay vì lỗi "database is locked" ngay lập tức
+# - cache_size âm là KiB cho mỗi connection; mmap_size cho phép đọc trang qua memory map
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", str(32 * 1024))),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict = SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def create_sqlite_engine(url: str = DATABASE_URL, pragmas: dict = SQLITE_PRAGMAS, **kwargs):
+    """
+    Engine cho file SQLite: QueuePool giữ connection (kèm page cache, pragma) giữa các request,
+    không pre-ping / recycle vì không có kết nối mạng nào bị rớt
+    """
+    options = {
+        "connect_args": {"check_same_thread": False},
+        "pool_size": int(os.getenv("SQLITE_POOL_SIZE", "20")),
+        "max_overflow": 0,      # Không cho overflow để tránh tạo quá nhiều connection
+        "pool_timeout": 30,     # Timeout 30 giây
+        "echo": False,          # Tắt logging SQL để tăng performance
+    }
+    options.update(kwargs)
+    engine = create_engine(url, **options)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+engine = create_sqlite_engine()
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
@@ -27,4 +60,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
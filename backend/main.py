@@ -17,9 +17,34 @@ from classes import router as class_router
 from weeks import router as week_router
 from schedule import router as schedule_router
 from students import router as students_router
+from query_stats import router as query_stats_router
+from analytics_routes import router as analytics_router
+from migrations import run_migrations
+from database import engine
+from core.optimization import cache_manager, db_optimizer, QueryProfilingMiddleware
+import os
 
 app = FastAPI()
 
+# Bật bằng QUERY_PROFILING=1: thống kê câu SQL theo fingerprint và theo route, xem tại GET /admin/query-stats
+if os.getenv("QUERY_PROFILING", "0") == "1":
+    db_optimizer.setup_query_profiling(engine)
+    app.add_middleware(QueryProfilingMiddleware, optimizer=db_optimizer)
+
+@app.on_event("startup")
+def apply_migrations():
+    # Tạo bảng/index mới khai báo trong models cho database đã tồn tại
+    run_migrations()
+
+@app.on_event("startup")
+def start_cache_sweeper():
+    # Dọn entry hết hạn của memory cache định kỳ (CACHE_SWEEP_INTERVAL giây)
+    cache_manager.memory_cache.start_sweeper()
+
+@app.on_event("shutdown")
+def stop_cache_sweeper():
+    cache_manager.memory_cache.stop_sweeper()
+
 # Cho phép mọi nguồn (trong môi trường dev)
 app.add_middleware(
     CORSMiddleware,
@@ -45,4 +70,6 @@ app.include_router(class_router, prefix="/admin")
 app.include_router(week_router, prefix="/weeks")
 app.include_router(schedule_router, prefix="/admin")
 app.include_router(schedule_router)  # Thêm route không có prefix cho sinh viên
-app.include_router(students_router, prefix="/admin")
\ No newline at end of file
+app.include_router(students_router, prefix="/admin")
+app.include_router(query_stats_router, prefix="/admin")
+app.include_router(analytics_router)  # /api/analytics
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from database import SessionLocal
 import models, schemas
 from passlib.hash import bcrypt
@@ -41,11 +41,14 @@ def create_manager(manager: schemas.ManagerCreate, db: Session = Depends(get_db)
 
 @router.get("/admin/users/managers")
 def list_managers(db: Session = Depends(get_db)):
-    managers = db.query(models.ManagerProfile).all()
+    managers = db.query(models.ManagerProfile) \
+        .options(joinedload(models.ManagerProfile.facility), joinedload(models.ManagerProfile.user)) \
+        .order_by(models.ManagerProfile.id) \
+        .all()
     result = []
     for m in managers:
-        facility = db.query(models.CoSoLienKet).filter_by(id=m.facility_id).first()
-        user = db.query(models.User).filter_by(id=m.user_id).first()
+        facility = m.facility
+        user = m.user
         result.append({
             "id": m.id,
             "full_name": m.full_name,
@@ -0,0 +1,90 @@
+from sqlalchemy import case, inspect, text, update
+from database import Base, engine
+import academic_calendar
+import models
+
+def add_missing_columns(bind=engine):
+    """Thêm các cột nullable mới khai báo trong models vào bảng đã tồn tại"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable:
+                print(f"⚠️ Bỏ qua cột NOT NULL {table.name}.{column.name}, cần migration thủ công")
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+
+    return added
+
+def slot_key_expression():
+    """Biểu thức SQL tương đương academic_calendar.slot_key"""
+    item = models.ScheduleItem
+    day_idx = case(
+        {day: i for i, day in enumerate(academic_calendar.DAY_NAMES)},
+        value=item.day, else_=academic_calendar.UNKNOWN_SLOT_INDEX
+    )
+    period_idx = case(
+        {period: i for i, period in enumerate(academic_calendar.PERIODS)},
+        value=item.period, else_=academic_calendar.UNKNOWN_SLOT_INDEX
+    )
+    return item.week * 100 + day_idx * 10 + period_idx
+
+def backfill_schedule_slot_keys(bind=engine):
+    """Tính slot_key cho các dòng schedule_items cũ chưa có giá trị"""
+    stmt = update(models.ScheduleItem) \
+        .where(models.ScheduleItem.slot_key.is_(None)) \
+        .values(slot_key=slot_key_expression())
+    with bind.begin() as conn:
+        return conn.execute(stmt).rowcount
+
+def create_missing_indexes(bind=engine):
+    """Tạo các index khai báo trong models nhưng chưa có trên database hiện tại (create_all không thêm index cho bảng đã tồn tại)"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=bind, checkfirst=True)
+                created.append(index.name)
+
+    return created
+
+def analyze_statistics(bind=engine):
+    """Cập nhật thống kê (sqlite_stat1) để planner của SQLite biết độ chọn lọc của các index mới"""
+    if bind.dialect.name != "sqlite":
+        return
+    with bind.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+def run_migrations(bind=engine):
+    """Đồng bộ schema: tạo bảng mới, cột và index còn thiếu, backfill dữ liệu dẫn xuất"""
+    Base.metadata.create_all(bind=bind)
+    added = add_missing_columns(bind)
+    if added:
+        print(f"✅ Đã thêm cột: {', '.join(added)}")
+    backfilled = backfill_schedule_slot_keys(bind)
+    if backfilled:
+        print(f"✅ Đã tính slot_key cho {backfilled} tiết học")
+    created = create_missing_indexes(bind)
+    if created:
+        print(f"✅ Đã tạo index: {', '.join(created)}")
+        analyze_statistics(bind)
+    return created
+
+if __name__ == "__main__":
+    run_migrations()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -28,7 +28,7 @@ class ManagerProfile(Base):
     full_name = Column(String)
     phone = Column(String)
     facility_id = Column(Integer, ForeignKey("co_so_lien_ket.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)  # Tra hồ sơ của manager đang đăng nhập
 
     facility = relationship("CoSoLienKet")
     user = relationship("User")
@@ -111,7 +111,7 @@ class Teacher(Base):
     code = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True)
     phone = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)  # Tra giáo viên theo tài khoản, join với schedule_items.teacher_id
     faculty_id = Column(Integer, ForeignKey("faculties.id"))  # ✅ thêm dòng này
 
     user = relationship("User")
@@ -136,6 +136,16 @@ class Class(Base):
     
 class ScheduleItem(Base):
     __tablename__ = "schedule_items"
+    __table_args__ = (
+        # Lịch theo lớp trong học kỳ, lọc tiếp theo tuần/thứ (/student/schedules?date=...);
+        # có thêm period để create_schedule đọc các (tuần, thứ, ca) đã có chỉ từ index
+        Index("ix_schedule_items_class_term_week_day_period", "class_id", "hoc_ky", "nam_hoc", "week", "day", "period"),
+        # Tra tiết học tiếp theo: range scan theo slot_key rồi LIMIT 1
+        Index("ix_schedule_items_class_term_slot", "class_id", "hoc_ky", "nam_hoc", "slot_key"),
+        Index("ix_schedule_items_teacher_term_slot", "teacher_id", "hoc_ky", "nam_hoc", "slot_key"),
+        # Bảng chiếm dụng phòng: kiểm tra trùng phòng / tìm phòng trống theo slot
+        Index("ix_schedule_items_room_term_slot", "room_id", "hoc_ky", "nam_hoc", "slot_key"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
     hoc_ky = Column(String, nullable=False)
@@ -147,6 +157,7 @@ class ScheduleItem(Base):
     teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     hinh_thuc = Column(String, nullable=False)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=True)
+    slot_key = Column(Integer, nullable=True)  # week * 100 + thứ * 10 + ca, xem academic_calendar.slot_key
     subject = relationship("Course", backref="schedules", lazy="joined")
     teacher = relationship("User", backref="teaching_schedule", lazy="joined")
     classroom = relationship("Room", backref="schedules", lazy="joined")
@@ -158,6 +169,14 @@ class ScheduleItem(Base):
         overlaps="teacher,teaching_schedule"
     )
 
+class ScheduleVersion(Base):
+    """Phiên bản thời khóa biểu của lớp, tăng mỗi khi schedule_items của lớp thay đổi (dùng làm ETag)"""
+    __tablename__ = "schedule_versions"
+
+    class_id = Column(Integer, ForeignKey("classes.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Student(Base):
     __tablename__ = "students"
 
@@ -166,6 +185,6 @@ class Student(Base):
     dob = Column(DateTime, nullable=False)
     gender = Column(String, nullable=False)
     student_code = Column(String, unique=True, nullable=False)
-    class_id = Column(Integer, ForeignKey("classes.id"))
+    class_id = Column(Integer, ForeignKey("classes.id"), index=True)  # Danh sách sinh viên theo lớp
 
     class_obj = relationship("Class")
\ No newline at end of file
@@ -9,6 +9,8 @@ from fastapi import UploadFile, File
 import os
 import uuid
 from fastapi.responses import JSONResponse
+import catalog_cache
+from catalog_cache import NEWS, catalog_key
 router = APIRouter()
 
 def get_db():
@@ -29,18 +31,27 @@ def create_news(news: NewsCreate, db: Session = Depends(get_db)):
     )
     db.add(new_news)
     db.commit()
+    catalog_cache.invalidate(NEWS)
     db.refresh(new_news)
     return new_news
 
 # Lấy danh sách bài viết (hiển thị trang chủ)
 @router.get("/news", response_model=List[NewsResponse])
 def list_news(db: Session = Depends(get_db)):
-    return db.query(News).order_by(News.created_at.desc()).all()
+    def load():
+        news = db.query(News).order_by(News.created_at.desc()).all()
+        return [NewsResponse.model_validate(n).model_dump() for n in news]
+
+    return catalog_cache.cached_response(NEWS, catalog_key(NEWS, "list"), load)
 
 # Lấy chi tiết bài viết theo id
 @router.get("/news/{id}", response_model=NewsResponse)
 def get_news(id: int, db: Session = Depends(get_db)):
-    news = db.query(News).filter(News.id == id).first()
+    def load():
+        news = db.query(News).filter(News.id == id).first()
+        return NewsResponse.model_validate(news).model_dump() if news else None
+
+    news = catalog_cache.cached_response(NEWS, catalog_key(NEWS, "item", id), load)
     if not news:
         raise HTTPException(status_code=404, detail="Không tìm thấy tin tức")
     return news
@@ -56,6 +67,7 @@ def update_news(id: int, updated: NewsCreate, db: Session = Depends(get_db)):
     news.content = updated.content
     news.image = updated.image
     db.commit()
+    catalog_cache.invalidate(NEWS)
     db.refresh(news)
     return news
 
@@ -67,6 +79,7 @@ def delete_news(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Không tìm thấy tin tức")
     db.delete(news)
     db.commit()
+    catalog_cache.invalidate(NEWS)
     return {"message": "Đã xoá tin tức thành công"}
 
 UPLOAD_DIR = "static/news"
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
+import hashlib
 from database import SessionLocal
 import models
+import catalog_cache
+from schedule import etag_matches
+from catalog_cache import PROGRAM_YEARS_TAG, PROGRAMS, catalog_key, program_tag
 
 router = APIRouter(prefix="/programs", tags=["Program View"])
 
@@ -14,51 +18,147 @@ def get_db():
 
 @router.get("/years")
 def get_available_years(db: Session = Depends(get_db)):
-    years = db.query(models.TrainingProgram.khoa).distinct().all()
-    return [y[0] for y in years]
+    def load():
+        years = db.query(models.TrainingProgram.khoa).distinct().all()
+        return [y[0] for y in years]
+
+    return catalog_cache.cached_response(PROGRAMS, catalog_key(PROGRAMS, "years"), load, tags=(PROGRAM_YEARS_TAG,))
+
+# Học phần trong chương trình theo khóa chính của program_courses (program_id, course_code): đúng thứ tự
+# mà truy vấn cũ (không ORDER BY) nhận được khi SQLite đọc qua index khóa chính
+PROGRAM_COURSE_ORDER = (models.ProgramCourse.program_id, models.ProgramCourse.course_code)
+
+def program_courses_query(db: Session):
+    """Chương trình kèm ngành, khoa và học phần trong một câu JOIN (chương trình chưa có học phần vẫn có một dòng)"""
+    return db.query(
+        models.TrainingProgram.id.label("program_id"),
+        models.TrainingProgram.khoa,
+        models.TrainingMajor.id.label("major_id"),
+        models.TrainingMajor.name.label("major_name"),
+        models.Faculty.id.label("faculty_id"),
+        models.Faculty.name.label("faculty_name"),
+        models.Course.code,
+        models.Course.name,
+        models.Course.credit,
+        models.Course.syllabus_url
+    ) \
+        .join(models.TrainingMajor, models.TrainingMajor.id == models.TrainingProgram.major_id) \
+        .join(models.Faculty, models.Faculty.id == models.TrainingMajor.faculty_id) \
+        .outerjoin(models.ProgramCourse, models.ProgramCourse.program_id == models.TrainingProgram.id) \
+        .outerjoin(models.Course, models.Course.code == models.ProgramCourse.course_code)
+
+def course_payload(row) -> dict:
+    return {
+        "code": row.code,
+        "name": row.name,
+        "credit": row.credit,
+        "syllabus_url": row.syllabus_url
+    }
+
+def build_program_tree(khoa: str, rows) -> dict:
+    """Gom các dòng JOIN thành cây khoa -> ngành -> học phần"""
+    faculties = {}
+    programs = {}
+    for row in rows:
+        faculty = faculties.get(row.faculty_id)
+        if faculty is None:
+            faculty = faculties[row.faculty_id] = {"id": row.faculty_id, "name": row.faculty_name, "majors": []}
+
+        program = programs.get(row.program_id)
+        if program is None:
+            program = programs[row.program_id] = {
+                "id": row.major_id,
+                "name": row.major_name,
+                "program_id": row.program_id,
+                "courses": []
+            }
+            faculty["majors"].append(program)
+
+        if row.code is not None:
+            program["courses"].append(course_payload(row))
+
+    return {"khoa": khoa, "faculties": list(faculties.values())}
+
+def tree_etag(body: bytes) -> str:
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return f'W/"program-tree-{digest}"'
 
 @router.get("/years/{khoa}/faculties")
 def get_faculties_by_year(khoa: str, db: Session = Depends(get_db)):
-    programs = db.query(models.TrainingProgram).filter_by(khoa=khoa).all()
-    faculty_ids = set()
-    for p in programs:
-        major = db.query(models.TrainingMajor).filter_by(id=p.major_id).first()
-        if major:
-            faculty_ids.add(major.faculty_id)
+    def load():
+        faculties = db.query(models.Faculty.id, models.Faculty.name) \
+            .join(models.TrainingMajor, models.TrainingMajor.faculty_id == models.Faculty.id) \
+            .join(models.TrainingProgram, models.TrainingProgram.major_id == models.TrainingMajor.id) \
+            .filter(models.TrainingProgram.khoa == khoa) \
+            .distinct() \
+            .order_by(models.Faculty.id) \
+            .all()
+        return [{"id": f.id, "name": f.name} for f in faculties]
 
-    faculties = db.query(models.Faculty).filter(models.Faculty.id.in_(faculty_ids)).all()
-    return [{"id": f.id, "name": f.name} for f in faculties]
+    return catalog_cache.cached_response(PROGRAMS, catalog_key(PROGRAMS, "faculties", khoa), load, tags=(program_tag(khoa),))
 
 @router.get("/years/{khoa}/faculties/{faculty_id}/majors")
 def get_majors_by_faculty(khoa: str, faculty_id: int, db: Session = Depends(get_db)):
-    programs = db.query(models.TrainingProgram).filter_by(khoa=khoa).all()
-    majors = []
-    for p in programs:
-        major = db.query(models.TrainingMajor).filter_by(id=p.major_id, faculty_id=faculty_id).first()
-        if major:
-            majors.append({"id": major.id, "name": major.name})
-    return majors
+    def load():
+        majors = db.query(models.TrainingMajor.id, models.TrainingMajor.name) \
+            .join(models.TrainingProgram, models.TrainingProgram.major_id == models.TrainingMajor.id) \
+            .filter(models.TrainingProgram.khoa == khoa, models.TrainingMajor.faculty_id == faculty_id) \
+            .order_by(models.TrainingProgram.id) \
+            .all()
+        return [{"id": m.id, "name": m.name} for m in majors]
+
+    return catalog_cache.cached_response(
+        PROGRAMS, catalog_key(PROGRAMS, "majors", khoa, faculty_id), load, tags=(program_tag(khoa),)
+    )
+
+@router.get("/years/{khoa}/tree")
+def get_program_tree(khoa: str, request: Request, db: Session = Depends(get_db)):
+    """Toàn bộ chương trình của khóa: khoa -> ngành -> học phần trong một response, hỗ trợ If-None-Match"""
+    def load():
+        rows = program_courses_query(db) \
+            .filter(models.TrainingProgram.khoa == khoa) \
+            .order_by(models.Faculty.id, *PROGRAM_COURSE_ORDER) \
+            .all()
+        return build_program_tree(khoa, rows)
+
+    body = catalog_cache.get_or_load_body(PROGRAMS, catalog_key(PROGRAMS, "tree", khoa), load, tags=(program_tag(khoa),))
+
+    etag = tree_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return catalog_cache.json_response(body, headers)
 
 @router.get("/by_major")
 def get_program_by_major(khoa: str, major_id: int, db: Session = Depends(get_db)):
-    program = db.query(models.TrainingProgram).filter_by(khoa=khoa, major_id=major_id).first()
-    if not program:
-        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình")
+    def load():
+        rows = db.query(
+            models.TrainingProgram.id.label("program_id"),
+            models.TrainingProgram.khoa,
+            models.Course.code,
+            models.Course.name,
+            models.Course.credit,
+            models.Course.syllabus_url
+        ) \
+            .outerjoin(models.ProgramCourse, models.ProgramCourse.program_id == models.TrainingProgram.id) \
+            .outerjoin(models.Course, models.Course.code == models.ProgramCourse.course_code) \
+            .filter(models.TrainingProgram.khoa == khoa, models.TrainingProgram.major_id == major_id) \
+            .order_by(models.TrainingProgram.id, *PROGRAM_COURSE_ORDER) \
+            .all()
+        if not rows:
+            return None
 
-    links = db.query(models.ProgramCourse).filter_by(program_id=program.id).all()
-    courses = []
-    for link in links:
-        course = db.query(models.Course).filter_by(code=link.course_code).first()
-        if course:
-            courses.append({
-                "code": course.code,
-                "name": course.name,
-                "credit": course.credit,
-                "syllabus_url": course.syllabus_url
-            })
+        # Nếu trùng (khoa, ngành) thì lấy chương trình đầu tiên như trước
+        program_id = rows[0].program_id
+        return {
+            "program_id": program_id,
+            "khoa": rows[0].khoa,
+            "courses": [course_payload(row) for row in rows if row.program_id == program_id and row.code is not None]
+        }
 
-    return {
-        "program_id": program.id,
-        "khoa": program.khoa,
-        "courses": courses
-    }
\ No newline at end of file
+    program = catalog_cache.cached_response(
+        PROGRAMS, catalog_key(PROGRAMS, "by_major", khoa, major_id), load, tags=(program_tag(khoa),)
+    )
+    if program is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình")
+    return program
@@ -0,0 +1,37 @@
+"""
+Thống kê truy vấn SQL khi bật QUERY_PROFILING=1: theo fingerprint (p50/p95/p99) và theo route (số câu SQL mỗi request)
+/query-stats/advisor chạy EXPLAIN QUERY PLAN trên các hot query và đề xuất index cho SQLite
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from auth import get_current_user
+from database import get_db
+from core.optimization import db_optimizer
+
+router = APIRouter()
+
+
+def require_admin(current_user=Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Chỉ admin được xem thống kê truy vấn")
+    return current_user
+
+
+@router.get("/query-stats")
+def get_query_stats(limit: int = Query(20, ge=1, le=200), current_user=Depends(require_admin)):
+    return db_optimizer.get_query_stats(limit)
+
+
+@router.delete("/query-stats")
+def reset_query_stats(current_user=Depends(require_admin)):
+    db_optimizer.reset_query_stats()
+    return {"message": "Đã xóa thống kê truy vấn"}
+
+
+@router.get("/query-stats/advisor")
+def get_index_advice(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user=Depends(require_admin)
+):
+    return db_optimizer.advise(db, limit)
@@ -3,6 +3,9 @@ from sqlalchemy.orm import Session
 from auth import get_current_user
 from database import get_db
 import models, schemas
+import catalog_cache
+from catalog_cache import ROOMS, catalog_key
+from core.optimization import cache_manager
 from fastapi import Query
 router = APIRouter()
 
@@ -59,6 +62,48 @@ def get_rooms(
     return rooms
 
 
+# Giới hạn số phòng trong một request batch
+MAX_PUBLIC_ROOM_IDS = 200
+
+
+def public_room_key(room_id: int) -> str:
+    """Key cache dùng chung của /rooms/public và /rooms/public/{room_id}, giá trị luôn là dict"""
+    return catalog_key(ROOMS, "public", "room", room_id)
+
+
+def public_room(row) -> dict:
+    return {"id": row.id, "room_number": row.room_number, "building": row.building}
+
+# Khai báo trước /rooms/{room_id} để "public" không bị match thành room_id
+@router.get("/rooms/public")
+def get_rooms_public_info(
+    ids: list[int] = Query(...),
+    db: Session = Depends(get_db)
+):
+    """Public endpoint lấy thông tin cơ bản của nhiều phòng trong một lần gọi (?ids=1&ids=2)"""
+    room_ids = list(dict.fromkeys(ids))
+    if len(room_ids) > MAX_PUBLIC_ROOM_IDS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_PUBLIC_ROOM_IDS} phòng mỗi lần")
+
+    # Dùng chung cache với /rooms/public/{room_id}, chỉ query các phòng chưa có trong cache
+    rooms = {}
+    for room_id in room_ids:
+        cached = cache_manager.get(public_room_key(room_id))
+        if cached is not None:
+            rooms[room_id] = cached
+    missing = [room_id for room_id in room_ids if room_id not in rooms]
+
+    if missing:
+        rows = db.query(models.Room.id, models.Room.room_number, models.Room.building).filter(
+            models.Room.id.in_(missing)
+        ).all()
+        for row in rows:
+            room = public_room(row)
+            catalog_cache.store(ROOMS, public_room_key(row.id), room)
+            rooms[row.id] = room
+
+    return [rooms[room_id] for room_id in sorted(rooms)]
+
 @router.get("/rooms/{room_id}", response_model=schemas.RoomOut)
 def get_room_by_id(
     room_id: int,
@@ -77,15 +122,16 @@ def get_room_public_info(
     db: Session = Depends(get_db)
 ):
     """Public endpoint để lấy thông tin cơ bản của phòng (room_number, building)"""
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
+    def load():
+        room = db.query(models.Room.id, models.Room.room_number, models.Room.building) \
+            .filter(models.Room.id == room_id).first()
+        return public_room(room) if room else None
+
+    # Cùng key và kiểu giá trị (dict) với route batch, nên không dùng cached_response (bytes) ở đây
+    room = catalog_cache.get_or_load(ROOMS, public_room_key(room_id), load)
     if not room:
         raise HTTPException(status_code=404, detail="Không tìm thấy phòng học")
-    
-    return {
-        "id": room.id,
-        "room_number": room.room_number,
-        "building": room.building
-    }
+    return room
 
 @router.delete("/rooms/{room_id}")
 def delete_room(
@@ -114,5 +160,6 @@ def delete_room(
 
     db.delete(room)
     db.commit()
+    catalog_cache.invalidate(ROOMS)
 
     return {"message": "Phòng học đã được xóa"}
\ No newline at end of file
@@ -1,13 +1,114 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import func, insert, or_
+from typing import List, Optional
+from datetime import date, datetime
+import hashlib
 from auth import get_current_user
 from database import get_db
 import models, schemas
 from sqlalchemy.orm import joinedload
 
+from academic_calendar import DAY_NAMES, current_slot_key, slot_key, term_year
+import schedule_export
+
 router = APIRouter()
 
+def apply_schedule_scope(query, hoc_ky: str, nam_hoc: int, week: Optional[int] = None,
+                         day: Optional[str] = None, ngay: Optional[date] = None):
+    """Thu hẹp truy vấn lịch theo một ngày hoặc theo tuần/thứ; trả về None nếu ngày nằm ngoài năm của học kỳ"""
+    if ngay is not None:
+        iso_year, iso_week, _ = ngay.isocalendar()
+        if iso_year != term_year(hoc_ky, nam_hoc):
+            return None
+        week, day = iso_week, DAY_NAMES[ngay.weekday()]
+    if week is not None:
+        query = query.filter(models.ScheduleItem.week == week)
+    if day is not None:
+        query = query.filter(models.ScheduleItem.day == day)
+    return query
+
+SCHEDULE_VERSION_HEADER = "X-Schedule-Version"
+
+def bump_schedule_version(db: Session, class_id: int):
+    """Tăng phiên bản lịch của lớp, gọi trong cùng transaction với thay đổi schedule_items"""
+    updated = db.query(models.ScheduleVersion) \
+        .filter(models.ScheduleVersion.class_id == class_id) \
+        .update({
+            models.ScheduleVersion.version: models.ScheduleVersion.version + 1,
+            models.ScheduleVersion.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+    if not updated:
+        db.add(models.ScheduleVersion(class_id=class_id, version=1))
+
+def get_schedule_version(db: Session, class_id: int) -> int:
+    version = db.query(models.ScheduleVersion.version) \
+        .filter(models.ScheduleVersion.class_id == class_id) \
+        .scalar()
+    return version or 0
+
+def schedule_etag(class_id: int, version: int, *scope) -> str:
+    """ETag theo lớp, phiên bản lịch và phạm vi truy vấn"""
+    scope_hash = hashlib.sha1(repr(scope).encode("utf-8")).hexdigest()[:12]
+    return f'W/"schedule-{class_id}-{version}-{scope_hash}"'
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match: "*", danh sách phân cách bằng dấu phẩy, so sánh yếu (W/"x" khớp "x")"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in if_none_match.split(",")}
+
+def get_student_or_404(db: Session, current_user) -> models.Student:
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Chỉ sinh viên mới có thể xem lịch học của mình")
+
+    # Tìm thông tin sinh viên dựa trên user hiện tại
+    student = db.query(models.Student).filter(models.Student.student_code == current_user.username).first()
+    if not student:
+        raise HTTPException(status_code=404, detail="Không tìm thấy thông tin sinh viên")
+
+    if not student.class_id:
+        raise HTTPException(status_code=404, detail="Sinh viên chưa được phân lớp")
+    return student
+
+def find_booking_conflicts(db: Session, class_id: int, hoc_ky: str, nam_hoc: int, rows: List[dict]):
+    """
+    Tìm phòng/giáo viên đã bị lớp khác xếp cùng (tuần, thứ, ca) trong học kỳ - một truy vấn cho cả lô
+    Trả về dict slot_key -> danh sách tiết đang chiếm slot đó
+    """
+    slot_keys = {row["slot_key"] for row in rows}
+    teacher_ids = {row["teacher_id"] for row in rows}
+    room_ids = {row["room_id"] for row in rows if row["room_id"] is not None}
+    if not slot_keys:
+        return {}
+
+    item = models.ScheduleItem
+    owner_filter = item.teacher_id.in_(teacher_ids)
+    if room_ids:
+        owner_filter = or_(owner_filter, item.room_id.in_(room_ids))
+
+    busy = db.query(item.class_id, item.slot_key, item.teacher_id, item.room_id) \
+        .filter(
+            item.hoc_ky == hoc_ky,
+            item.nam_hoc == nam_hoc,
+            item.class_id != class_id,
+            item.slot_key.in_(slot_keys),
+            owner_filter
+        ).all()
+
+    by_slot = {}
+    for booking in busy:
+        by_slot.setdefault(booking.slot_key, []).append(booking)
+    return by_slot
+
 @router.post("/schedules")
 def create_schedule(
     data: schemas.ScheduleCreate,
@@ -21,49 +122,139 @@ def create_schedule(
     if not class_obj:
         raise HTTPException(status_code=404, detail="Không tìm thấy lớp học")
 
-    added, skipped = [], []
+    # Một truy vấn lấy các (tuần, thứ, ca) đã có của lớp trong học kỳ, so khớp trong bộ nhớ
+    existing_keys = set(
+        db.query(models.ScheduleItem.week, models.ScheduleItem.day, models.ScheduleItem.period)
+        .filter(
+            models.ScheduleItem.class_id == data.class_id,
+            models.ScheduleItem.hoc_ky == data.hoc_ky,
+            models.ScheduleItem.nam_hoc == data.nam_hoc
+        ).all()
+    )
 
+    candidates, skipped = [], []
     for item in data.schedule_items:
-        exists = db.query(models.ScheduleItem).filter(
-            models.ScheduleItem.class_id == data.class_id,
-            models.ScheduleItem.week == item.week,
-            models.ScheduleItem.day == item.day,
-            models.ScheduleItem.period == item.period
-        ).first()
-
-        if exists:
-            skipped.append({
-                "week": item.week,
-                "day": item.day,
-                "period": item.period
-            })
+        key = (item.week, item.day, item.period)
+        if key in existing_keys:
+            skipped.append({"week": item.week, "day": item.day, "period": item.period})
             continue
-
-        schedule = models.ScheduleItem(
-            class_id=data.class_id,
-            hoc_ky=data.hoc_ky,
-            nam_hoc=data.nam_hoc,
-            week=item.week,
-            day=item.day,
-            period=item.period,
-            subject_id=item.subject_id,
-            teacher_id=item.teacher_id,
-            hinh_thuc=item.hinh_thuc,
-            room_id=item.room_id,
-        )
-        db.add(schedule)
-        added.append({
+        candidates.append({
+            "class_id": data.class_id,
+            "hoc_ky": data.hoc_ky,
+            "nam_hoc": data.nam_hoc,
             "week": item.week,
             "day": item.day,
-            "period": item.period
+            "period": item.period,
+            "subject_id": item.subject_id,
+            "teacher_id": item.teacher_id,
+            "hinh_thuc": item.hinh_thuc,
+            "room_id": item.room_id,
+            "slot_key": slot_key(item.week, item.day, item.period),
         })
 
+    # Phòng hoặc giáo viên đã có lịch với lớp khác cùng thời điểm
+    bookings = find_booking_conflicts(db, data.class_id, data.hoc_ky, data.nam_hoc, candidates)
+    rows, added, conflicts = [], [], []
+    for row in candidates:
+        slot = {"week": row["week"], "day": row["day"], "period": row["period"]}
+        clash = next((
+            (booking, "teacher" if booking.teacher_id == row["teacher_id"] else "room")
+            for booking in bookings.get(row["slot_key"], [])
+            if booking.teacher_id == row["teacher_id"]
+            or (row["room_id"] is not None and booking.room_id == row["room_id"])
+        ), None)
+        if clash:
+            booking, reason = clash
+            conflicts.append({**slot, "reason": reason, "class_id": booking.class_id})
+            continue
+        # Chỉ giữ chỗ sau khi qua kiểm tra trùng: dòng bị từ chối không làm dòng hợp lệ cùng slot bị bỏ qua
+        key = (row["week"], row["day"], row["period"])
+        if key in existing_keys:
+            skipped.append(slot)  # Trùng ngay trong dữ liệu gửi lên
+            continue
+        existing_keys.add(key)
+        rows.append(row)
+        added.append(slot)
+
+    if rows:
+        # Một câu INSERT executemany cho cả lô
+        db.execute(insert(models.ScheduleItem), rows)
+        bump_schedule_version(db, data.class_id)
     db.commit()
 
+    message = f"Đã thêm {len(added)} mục, bỏ qua {len(skipped)} mục bị trùng"
+    if conflicts:
+        message += f", {len(conflicts)} mục trùng phòng hoặc giáo viên với lớp khác"
+
     return {
-        "message": f"Đã thêm {len(added)} mục, bỏ qua {len(skipped)} mục bị trùng",
+        "message": message,
         "added": added,
-        "skipped": skipped
+        "skipped": skipped,
+        "conflicts": conflicts
+    }
+
+@router.get("/schedules/free")
+def get_free_resources(
+    hoc_ky: str,
+    nam_hoc: int,
+    week: int,
+    day: str,
+    period: str,
+    facility_id: Optional[int] = None,
+    faculty_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Phòng và giáo viên còn trống tại một (tuần, thứ, ca); mỗi phòng/giáo viên là một lookup trên index chiếm dụng"""
+    if current_user.role not in ("admin", "manager"):
+        raise HTTPException(status_code=403, detail="Bạn không có quyền xem lịch trống")
+
+    if current_user.role == "manager":
+        # Quản lý chỉ xem phòng của cơ sở mình
+        profile = db.query(models.ManagerProfile).filter(models.ManagerProfile.user_id == current_user.id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Không tìm thấy hồ sơ quản lý")
+        facility_id = profile.facility_id
+
+    key = slot_key(week, day, period)
+    item = models.ScheduleItem
+    busy = db.query(item.id).filter(item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc, item.slot_key == key)
+
+    room_query = db.query(models.Room).filter(
+        ~busy.filter(item.room_id == models.Room.id).exists()
+    )
+    if facility_id is not None:
+        room_query = room_query.filter(models.Room.facility_id == facility_id)
+
+    teacher_query = db.query(models.Teacher).filter(
+        models.Teacher.user_id.isnot(None),
+        # teacher_id trong ScheduleItem là user_id của giáo viên
+        ~busy.filter(item.teacher_id == models.Teacher.user_id).exists()
+    )
+    if faculty_id is not None:
+        teacher_query = teacher_query.filter(models.Teacher.faculty_id == faculty_id)
+
+    return {
+        "slot": {"hoc_ky": hoc_ky, "nam_hoc": nam_hoc, "week": week, "day": day, "period": period},
+        "rooms": [
+            {
+                "id": room.id,
+                "room_number": room.room_number,
+                "building": room.building,
+                "capacity": room.capacity,
+                "type": room.type,
+                "facility_id": room.facility_id
+            } for room in room_query.order_by(models.Room.id).all()
+        ],
+        "teachers": [
+            {
+                "id": teacher.id,
+                "user_id": teacher.user_id,
+                "name": teacher.name,
+                "code": teacher.code,
+                "faculty_id": teacher.faculty_id
+            } for teacher in teacher_query.order_by(models.Teacher.id).all()
+        ]
     }
 
 @router.get("/schedules", response_model=List[schemas.ScheduleItemOut])
@@ -91,21 +282,25 @@ def get_schedule(
 def get_student_schedule(
     hoc_ky: str,
     nam_hoc: int,
+    request: Request,
+    response: Response,
+    week: Optional[int] = None,
+    day: Optional[str] = None,
+    ngay: Optional[date] = Query(None, alias="date"),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    if current_user.role != "student":
-        raise HTTPException(status_code=403, detail="Chỉ sinh viên mới có thể xem lịch học của mình")
+    """Lịch học của sinh viên; có thể lọc theo ?date=YYYY-MM-DD hoặc ?week=&day=. Hỗ trợ If-None-Match"""
+    student = get_student_or_404(db, current_user)
 
-    # Tìm thông tin sinh viên dựa trên user hiện tại
-    student = db.query(models.Student).filter(models.Student.student_code == current_user.username).first()
-    if not student:
-        raise HTTPException(status_code=404, detail="Không tìm thấy thông tin sinh viên")
-
-    if not student.class_id:
-        raise HTTPException(status_code=404, detail="Sinh viên chưa được phân lớp")
+    version = get_schedule_version(db, student.class_id)
+    etag = schedule_etag(student.class_id, version, hoc_ky, nam_hoc, week, day, ngay)
+    headers = {"ETag": etag, SCHEDULE_VERSION_HEADER: str(version), "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
 
-    schedules = db.query(models.ScheduleItem) \
+    query = db.query(models.ScheduleItem) \
         .options(
             joinedload(models.ScheduleItem.subject),
             joinedload(models.ScheduleItem.teacher_profile),
@@ -115,14 +310,60 @@ def get_student_schedule(
             class_id=student.class_id,
             hoc_ky=hoc_ky,
             nam_hoc=nam_hoc
-        ).all()
-    return schedules
+        )
+    query = apply_schedule_scope(query, hoc_ky, nam_hoc, week, day, ngay)
+    if query is None:
+        return []
+    return query.all()
+
+def next_schedule_query(db: Session, hoc_ky: str, nam_hoc: int, **owner):
+    """
+    Tiết học tiếp theo của lớp/giáo viên: một range scan trên index (owner, hoc_ky, nam_hoc, slot_key) với LIMIT 1
+    Trả về None nếu học kỳ đã kết thúc
+    """
+    current_key = current_slot_key(hoc_ky, nam_hoc)
+    if current_key is None:
+        return None
+
+    return db.query(models.ScheduleItem) \
+        .filter_by(hoc_ky=hoc_ky, nam_hoc=nam_hoc, **owner) \
+        .filter(models.ScheduleItem.slot_key >= current_key) \
+        .order_by(models.ScheduleItem.slot_key) \
+        .first()
+
+@router.get("/student/schedules/next", response_model=Optional[schemas.ScheduleItemOut])
+def get_student_next_schedule(
+    hoc_ky: str,
+    nam_hoc: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Tiết học sắp tới của sinh viên tính từ thời điểm hiện tại (null nếu đã hết lịch học kỳ)"""
+    student = get_student_or_404(db, current_user)
+    return next_schedule_query(db, hoc_ky, nam_hoc, class_id=student.class_id)
+
+@router.get("/teacher/schedules/next", response_model=Optional[schemas.ScheduleItemOut])
+def get_teacher_next_schedule(
+    hoc_ky: str,
+    nam_hoc: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Tiết dạy sắp tới của giáo viên tính từ thời điểm hiện tại (null nếu đã hết lịch học kỳ)"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Chỉ giáo viên mới có thể xem lịch giảng dạy của mình")
+
+    # teacher_id trong ScheduleItem là user_id của giáo viên
+    return next_schedule_query(db, hoc_ky, nam_hoc, teacher_id=current_user.id)
 
 @router.get("/teacher/schedules", response_model=List[schemas.ScheduleItemOut])
 def get_teacher_schedule(
     hoc_ky: str,
     nam_hoc: int,
     class_id: int = None,
+    week: Optional[int] = None,
+    day: Optional[str] = None,
+    ngay: Optional[date] = Query(None, alias="date"),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
@@ -151,10 +392,107 @@ def get_teacher_schedule(
     # Nếu có class_id thì filter thêm
     if class_id:
         query = query.filter_by(class_id=class_id)
-    
+
+    query = apply_schedule_scope(query, hoc_ky, nam_hoc, week, day, ngay)
+    if query is None:
+        return []
     schedules = query.all()
     return schedules
 
+def export_response(request: Request, db: Session, fmt: str, etag: str, filename: str,
+                    calendar_name: str, hoc_ky: str, nam_hoc: int, **owner):
+    """StreamingResponse xuất lịch; trả 304 nếu client đã có bản mới nhất"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    # Session của request đóng khi handler trả về nên generator mở session riêng trên cùng engine
+    rows = schedule_export.stream_rows(db.get_bind(), schedule_export.export_statement(hoc_ky, nam_hoc, **owner))
+    return StreamingResponse(
+        schedule_export.iter_export(fmt, rows, calendar_name),
+        media_type=schedule_export.EXPORT_FORMATS[fmt],
+        headers=headers
+    )
+
+@router.get("/schedules/export")
+def export_class_schedule(
+    class_id: int,
+    hoc_ky: str,
+    nam_hoc: int,
+    request: Request,
+    format: str = Query("ics", pattern="^(ics|csv)$"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Xuất lịch học kỳ của một lớp (admin/manager) dạng iCalendar hoặc CSV"""
+    if current_user.role not in ("admin", "manager"):
+        raise HTTPException(status_code=403, detail="Không có quyền xem lịch")
+
+    class_obj = db.query(models.Class).filter(models.Class.id == class_id).first()
+    if not class_obj:
+        raise HTTPException(status_code=404, detail="Không tìm thấy lớp")
+
+    version = get_schedule_version(db, class_id)
+    etag = schedule_etag(class_id, version, "export", format, hoc_ky, nam_hoc)
+    return export_response(
+        request, db, format, etag, f"tkb_{class_obj.ma_lop}_{hoc_ky}_{nam_hoc}",
+        f"TKB {class_obj.ma_lop} {hoc_ky} {nam_hoc}", hoc_ky, nam_hoc, class_id=class_id
+    )
+
+@router.get("/student/schedules/export")
+def export_student_schedule(
+    hoc_ky: str,
+    nam_hoc: int,
+    request: Request,
+    format: str = Query("ics", pattern="^(ics|csv)$"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Xuất lịch học kỳ của sinh viên (theo lớp) để đăng ký vào ứng dụng lịch"""
+    student = get_student_or_404(db, current_user)
+
+    version = get_schedule_version(db, student.class_id)
+    etag = schedule_etag(student.class_id, version, "export", format, hoc_ky, nam_hoc)
+    return export_response(
+        request, db, format, etag, f"tkb_{student.student_code}_{hoc_ky}_{nam_hoc}",
+        f"TKB {hoc_ky} {nam_hoc}", hoc_ky, nam_hoc, class_id=student.class_id
+    )
+
+@router.get("/teacher/schedules/export")
+def export_teacher_schedule(
+    hoc_ky: str,
+    nam_hoc: int,
+    request: Request,
+    format: str = Query("ics", pattern="^(ics|csv)$"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """Xuất lịch giảng dạy học kỳ của giáo viên dạng iCalendar hoặc CSV"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Chỉ giáo viên mới có thể xem lịch giảng dạy của mình")
+
+    # Lịch giáo viên trải trên nhiều lớp: ETag theo tập (lớp, phiên bản) của các lớp đang dạy
+    class_versions = db.query(
+        models.ScheduleItem.class_id,
+        func.coalesce(models.ScheduleVersion.version, 0)
+    ) \
+        .outerjoin(models.ScheduleVersion, models.ScheduleVersion.class_id == models.ScheduleItem.class_id) \
+        .filter(
+            models.ScheduleItem.teacher_id == current_user.id,
+            models.ScheduleItem.hoc_ky == hoc_ky,
+            models.ScheduleItem.nam_hoc == nam_hoc
+        ) \
+        .distinct() \
+        .order_by(models.ScheduleItem.class_id) \
+        .all()
+    etag = schedule_etag(f"teacher{current_user.id}", len(class_versions),
+                         "export", format, hoc_ky, nam_hoc, [tuple(row) for row in class_versions])
+    return export_response(
+        request, db, format, etag, f"lich_day_{current_user.username}_{hoc_ky}_{nam_hoc}",
+        f"Lịch dạy {hoc_ky} {nam_hoc}", hoc_ky, nam_hoc, teacher_id=current_user.id
+    )
+
 @router.get("/teacher/classes")
 def get_teacher_classes(
     hoc_ky: str,
@@ -250,5 +588,6 @@ def delete_schedule(
         raise HTTPException(status_code=404, detail="Không tìm thấy lịch học")
 
     db.delete(schedule)
+    bump_schedule_version(db, schedule.class_id)
     db.commit()
     return {"message": "Đã xóa lịch học thành công"}
\ No newline at end of file
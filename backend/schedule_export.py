@@ -0,0 +1,151 @@
+"""
+Xuất thời khóa biểu dạng iCalendar (.ics) và CSV
+Dữ liệu được đọc theo lô (yield_per) và ghi ra từng dòng để StreamingResponse gửi dần cho client
+"""
+import csv
+import io
+from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import academic_calendar
+import models
+
+EXPORT_BATCH_SIZE = 500
+CALENDAR_TZID = "Asia/Ho_Chi_Minh"
+
+EXPORT_FORMATS = {
+    "ics": "text/calendar; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+CSV_HEADER = ["Tuần", "Thứ", "Ngày", "Ca", "Mã HP", "Tên học phần", "Giảng viên", "Phòng", "Hình thức", "Lớp"]
+
+def export_statement(hoc_ky: str, nam_hoc: int, **owner):
+    """Truy vấn projection (không load ORM object) cho lịch của lớp hoặc giáo viên trong học kỳ"""
+    item = models.ScheduleItem
+    stmt = select(
+        item.id, item.hoc_ky, item.nam_hoc, item.week, item.day, item.period, item.hinh_thuc, item.subject_id,
+        models.Course.name.label("subject_name"),
+        models.Teacher.name.label("teacher_name"),
+        models.Room.room_number, models.Room.building,
+        models.Class.ma_lop
+    ) \
+        .select_from(item) \
+        .outerjoin(models.Course, models.Course.code == item.subject_id) \
+        .outerjoin(models.Teacher, models.Teacher.user_id == item.teacher_id) \
+        .outerjoin(models.Room, models.Room.id == item.room_id) \
+        .outerjoin(models.Class, models.Class.id == item.class_id) \
+        .where(item.hoc_ky == hoc_ky, item.nam_hoc == nam_hoc)
+    for column, value in owner.items():
+        stmt = stmt.where(getattr(item, column) == value)
+    return stmt.order_by(item.slot_key, item.id)
+
+def stream_rows(bind, stmt, batch_size: int = EXPORT_BATCH_SIZE):
+    """Đọc kết quả theo lô bằng session riêng, sống cùng vòng đời của response stream"""
+    with Session(bind=bind) as session:
+        result = session.execute(stmt.execution_options(yield_per=batch_size))
+        for row in result:
+            yield row
+
+def _room_label(row) -> str:
+    if row.building and row.room_number:
+        return f"{row.building}/{row.room_number}"
+    return row.room_number or ""
+
+def _format_label(row) -> str:
+    return "Trực tiếp" if row.hinh_thuc == "truc_tiep" else "Trực tuyến"
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    # BOM để Excel nhận đúng UTF-8 tiếng Việt
+    writer.writerow(CSV_HEADER)
+    yield "\ufeff" + flush()
+    for row in rows:
+        class_date = academic_calendar.date_of_slot(row.hoc_ky, row.nam_hoc, row.week, row.day)
+        writer.writerow([
+            row.week, row.day, class_date.isoformat() if class_date else "", row.period,
+            row.subject_id, row.subject_name or "", row.teacher_name or "",
+            _room_label(row), _format_label(row), row.ma_lop or ""
+        ])
+        yield flush()
+
+def _ics_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_line(line: str) -> str:
+    """Gấp dòng dài hơn 75 octet theo RFC 5545"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, chunk = [], b""
+    for char in line:
+        char_bytes = char.encode("utf-8")
+        if len(chunk) + len(char_bytes) > (75 if not parts else 74):
+            parts.append(chunk.decode("utf-8"))
+            chunk = b""
+        chunk += char_bytes
+    parts.append(chunk.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+def _ics_time(class_date, at) -> str:
+    return datetime.combine(class_date, at).strftime("%Y%m%dT%H%M%S")
+
+def iter_ics(rows, calendar_name: str):
+    dtstamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//CTU LMS//Thoi khoa bieu//VI",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_ics_escape(calendar_name)}",
+        f"X-WR-TIMEZONE:{CALENDAR_TZID}",
+        "BEGIN:VTIMEZONE",
+        f"TZID:{CALENDAR_TZID}",
+        "BEGIN:STANDARD",
+        "DTSTART:19700101T000000",
+        "TZOFFSETFROM:+0700",
+        "TZOFFSETTO:+0700",
+        "TZNAME:ICT",
+        "END:STANDARD",
+        "END:VTIMEZONE",
+    ]
+    yield "".join(_ics_line(line) for line in header)
+
+    for row in rows:
+        class_date = academic_calendar.date_of_slot(row.hoc_ky, row.nam_hoc, row.week, row.day)
+        start = academic_calendar.PERIOD_START_TIMES.get(row.period)
+        end = academic_calendar.PERIOD_END_TIMES.get(row.period)
+        if class_date is None or start is None:
+            continue  # Thứ/ca không chuẩn thì không đặt được vào lịch
+
+        summary = row.subject_name or row.subject_id
+        description = f"Mã HP: {row.subject_id}\nGiảng viên: {row.teacher_name or ''}\nLớp: {row.ma_lop or ''}\nHình thức: {_format_label(row)}"
+        event = [
+            "BEGIN:VEVENT",
+            f"UID:schedule-{row.id}@ctu-lms",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART;TZID={CALENDAR_TZID}:{_ics_time(class_date, start)}",
+            f"DTEND;TZID={CALENDAR_TZID}:{_ics_time(class_date, end)}",
+            f"SUMMARY:{_ics_escape(summary)}",
+            f"DESCRIPTION:{_ics_escape(description)}",
+        ]
+        room = _room_label(row)
+        if room:
+            event.append(f"LOCATION:{_ics_escape(room)}")
+        event.append("END:VEVENT")
+        yield "".join(_ics_line(line) for line in event)
+
+    yield _ics_line("END:VCALENDAR")
+
+def iter_export(fmt: str, rows, calendar_name: str):
+    if fmt == "ics":
+        return iter_ics(rows, calendar_name)
+    return iter_csv(rows)
@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session
 import os, shutil, uuid
 from database import SessionLocal
 import models, schemas
+import catalog_cache
+from catalog_cache import SLIDER, catalog_key
 
 router = APIRouter()
 UPLOAD_DIR = "static/slider"
@@ -30,21 +32,25 @@ def upload_slider_image(file: UploadFile = File(...), db: Session = Depends(get_
     new_image = models.SliderImage(filename=filename)
     db.add(new_image)
     db.commit()
+    catalog_cache.invalidate(SLIDER)
     db.refresh(new_image)
 
     return {"message": "Tải ảnh thành công", "id": new_image.id}
 
 @router.get("/home/slider-images", response_model=list[schemas.SliderImageOut])
 def get_slider_images(db: Session = Depends(get_db)):
-    images = db.query(models.SliderImage).order_by(models.SliderImage.uploaded_at.desc()).all()
-    return [
-        {
-            "id": img.id,
-            "url": f"/static/slider/{img.filename}",
-            "uploaded_at": img.uploaded_at.isoformat()
-        }
-        for img in images
-    ]
+    def load():
+        images = db.query(models.SliderImage).order_by(models.SliderImage.uploaded_at.desc()).all()
+        return [
+            {
+                "id": img.id,
+                "url": f"/static/slider/{img.filename}",
+                "uploaded_at": img.uploaded_at.isoformat()
+            }
+            for img in images
+        ]
+
+    return catalog_cache.cached_response(SLIDER, catalog_key(SLIDER, "home"), load)
 
 @router.delete("/admin/slider-images/{id}")
 def delete_slider_image(id: int, db: Session = Depends(get_db)):
@@ -59,4 +65,5 @@ def delete_slider_image(id: int, db: Session = Depends(get_db)):
 
     db.delete(image)
     db.commit()
+    catalog_cache.invalidate(SLIDER)
     return {"message": "Đã xoá ảnh"}
\ No newline at end of file
@@ -50,10 +50,13 @@ def create_teacher(teacher: schemas.TeacherCreate, db: Session = Depends(get_db)
 # ✅ 2. Lấy danh sách giảng viên
 @router.get("/admin/users/teachers")
 def list_teachers(db: Session = Depends(get_db)):
-    teachers = db.query(models.Teacher).all()
+    teachers = db.query(models.Teacher) \
+        .options(joinedload(models.Teacher.user)) \
+        .order_by(models.Teacher.id) \
+        .all()
     result = []
     for t in teachers:
-        user = db.query(models.User).filter_by(id=t.user_id).first()
+        user = t.user
         result.append({
             "id": t.id,
             "name": t.name,
@@ -124,11 +127,14 @@ def get_teacher_profile(
 
 @router.get("/admin/users/teachers/list")
 def list_teachers(db: Session = Depends(get_db)):
-    teachers = db.query(models.Teacher).all()
+    teachers = db.query(models.Teacher) \
+        .options(joinedload(models.Teacher.user), joinedload(models.Teacher.faculty)) \
+        .order_by(models.Teacher.id) \
+        .all()
     result = []
     for t in teachers:
-        user = db.query(models.User).filter_by(id=t.user_id).first()
-        faculty = db.query(models.Faculty).filter_by(id=t.faculty_id).first()
+        user = t.user
+        faculty = t.faculty
         result.append({
             "id": t.id,
             "user_id": t.user_id,  # ✅ THÊM DÒNG NÀY
@@ -0,0 +1,149 @@
+import os
+import sys
+from fnmatch import fnmatchcase
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Backend chạy với các module phẳng (from database import ...), nên thêm thư mục backend vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base  # noqa: E402
+import models  # noqa: E402,F401
+from core.optimization import cache_manager  # noqa: E402
+
+
+class StatementCounter:
+    """Đếm số câu SQL gửi xuống database"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+class FakeRedis:
+    """Redis trong memory đủ cho CacheManager (decode_responses=False: key và giá trị trả về là bytes)"""
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _key(key):
+        return key.decode("utf-8") if isinstance(key, bytes) else key
+
+    def get(self, key):
+        return self.data.get(self._key(key))
+
+    def setex(self, key, ttl, value):
+        self.data[self._key(key)] = value
+
+    def set(self, key, value, nx=False, px=None):
+        key = self._key(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode("utf-8") if isinstance(value, str) else value
+        return True
+
+    def sadd(self, key, *members):
+        self.data.setdefault(self._key(key), set()).update(m.encode("utf-8") for m in members)
+
+    def expire(self, key, ttl):
+        return self._key(key) in self.data
+
+    def smembers(self, key):
+        return set(self.data.get(self._key(key), ()))
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(self._key(key), None) is not None)
+
+    def scan_iter(self, match="*", count=None):
+        return [key.encode("utf-8") for key in list(self.data) if fnmatchcase(key, match)]
+
+    def eval(self, script, numkeys, key, token):
+        key = self._key(key)
+        if self.data.get(key) == token.encode("utf-8"):
+            del self.data[key]
+            return 1
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@pytest.fixture
+def statements(engine):
+    return StatementCounter(engine)
+
+
+@pytest.fixture
+def clean_cache():
+    """cache_manager là global của process: xóa trước và sau test để các test không thấy dữ liệu của nhau"""
+    cache_manager.clear()
+    yield cache_manager
+    cache_manager.clear()
+
+
+@pytest.fixture
+def make_client(session_factory):
+    """Tạo TestClient chỉ với các router cần test, thay get_db bằng database in-memory"""
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def factory(*routers):
+        app = FastAPI()
+        for module, prefix in routers:
+            app.include_router(module.router, prefix=prefix)
+            if hasattr(module, "get_db"):
+                app.dependency_overrides[module.get_db] = override_get_db
+        return TestClient(app)
+
+    return factory
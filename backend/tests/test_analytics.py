@@ -0,0 +1,57 @@
+"""
+/api/analytics/dashboard qua @cached(stale_ttl=...): lần gọi thứ hai không chạm database, invalidate tag thì tính lại
+"""
+import pytest
+
+import academic_calendar
+import analytics_routes
+import models
+from core.optimization import invalidate_cache_tags
+
+
+@pytest.fixture
+def client(make_client, session_factory, clean_cache):
+    hoc_ky, nam_hoc = academic_calendar.current_semester()
+    with session_factory() as db:
+        facility = models.CoSoLienKet(name="Cơ sở 1", address="Cần Thơ", phone="0292")
+        db.add(facility)
+        db.flush()
+        db.add_all([
+            models.User(id=1, username="gv1", password="x", role="teacher"),
+            models.Teacher(id=1, name="GV 1", code="GV001", user_id=1),
+            models.Course(code="CT101", name="Lập trình", credit=3),
+            models.Class(id=1, khoa="50", ma_lop="L01", facility_id=facility.id),
+            models.Room(id=1, room_number="101", capacity=40, facility_id=facility.id),
+            models.Room(id=2, room_number="102", capacity=40, facility_id=facility.id),
+        ])
+        db.flush()
+        db.add_all([
+            models.ScheduleItem(class_id=1, hoc_ky=hoc_ky, nam_hoc=nam_hoc, week=week, day="Thứ Hai",
+                                period="Sáng", subject_id="CT101", teacher_id=1, hinh_thuc="truc_tiep", room_id=1)
+            for week in (1, 2, 3)
+        ])
+        db.commit()
+
+    client = make_client((analytics_routes, ""))
+    client.app.dependency_overrides[analytics_routes.get_current_user] = lambda: models.User(id=9, role="manager")
+    return client
+
+
+def test_dashboard_is_cached_and_refreshed_on_invalidation(client, statements, session_factory):
+    response = client.get("/api/analytics/dashboard?role=manager")
+    assert response.status_code == 200
+    stats = response.json()["data"]
+    assert stats["totalRooms"] == 2
+    assert stats["scheduledClasses"] == 3
+    assert stats["teacherWorkload"] == 3.0
+    assert stats["facilityUtilization"][0]["name"] == "Cơ sở 1"
+
+    statements.reset()
+    assert client.get("/api/analytics/dashboard?role=manager").json()["data"] == stats
+    assert statements.count == 0
+
+    with session_factory() as db:
+        db.add(models.Room(id=3, room_number="103", capacity=40, facility_id=1))
+        db.commit()
+    invalidate_cache_tags(analytics_routes.DASHBOARD_STATS_TAG)
+    assert client.get("/api/analytics/dashboard?role=manager").json()["data"]["totalRooms"] == 3
@@ -0,0 +1,91 @@
+"""
+Codec giá trị cache: round-trip qua header [codec][nén], nén khi vượt ngưỡng, pickle bị từ chối mặc định
+"""
+import pytest
+
+from core import cache_codecs
+from core.cache_codecs import CODECS, COMPRESS_THRESHOLD, NO_COMPRESSION, CodecError, CodecSet
+from core.optimization import CacheManager, MemoryCache
+
+SMALL = {"khoa": "50", "courses": [{"code": "CT101", "credit": 3}]}
+LARGE = {"khoa": "50", "courses": [{"code": f"CT{i:03d}", "name": "Lập trình căn bản"} for i in range(500)]}
+
+
+@pytest.fixture(autouse=True)
+def allow_pickle(monkeypatch):
+    monkeypatch.setattr(cache_codecs, "ALLOW_PICKLE", True)
+
+
+@pytest.mark.parametrize("name", sorted(name for name in CODECS if name != "raw"))
+@pytest.mark.parametrize("value", [SMALL, LARGE], ids=["small", "compressed"])
+def test_round_trip(name, value):
+    codecs = CodecSet(CODECS[name])
+    data = codecs.encode(value)
+
+    assert data[:1] == CODECS[name].tag
+    assert (data[1:2] != NO_COMPRESSION) == (value is LARGE)
+    assert codecs.decode(data) == value
+
+
+@pytest.mark.parametrize("value", [b'{"id":1}', b"x" * (COMPRESS_THRESHOLD * 2)], ids=["small", "compressed"])
+def test_bytes_use_raw_codec(value):
+    codecs = CodecSet(CODECS["json"])
+    data = codecs.encode(value)
+
+    assert data[:1] == CODECS["raw"].tag
+    assert (data[1:2] != NO_COMPRESSION) == (len(value) >= COMPRESS_THRESHOLD)
+    assert codecs.decode(data) == value
+
+
+def test_legacy_payload_without_header_is_rejected():
+    with pytest.raises(CodecError):
+        CodecSet(CODECS["json"]).decode(b"\x80\x05K\x01.")
+
+
+def test_pickle_refused_unless_allowed(monkeypatch, fake_redis):
+    data = CodecSet(CODECS["pickle"]).encode(SMALL)
+    monkeypatch.setattr(cache_codecs, "ALLOW_PICKLE", False)
+
+    with pytest.raises(CodecError):
+        CodecSet(CODECS["json"]).decode(data)
+
+    # Trên Redis dùng chung, payload pickle bị coi như miss thay vì được giải mã
+    manager = CacheManager(memory_cache=MemoryCache(sweep_interval=0), namespace="test", codec="json")
+    manager.redis_client = fake_redis
+    fake_redis.data["test:catalog:news:list"] = data
+    assert manager.get("catalog:news:list") is None
+    assert manager.cache_stats["errors"] == 1
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "json"])
+def test_json_rejects_non_string_keys(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(cache_codecs, "orjson", None)
+    codecs = CodecSet(cache_codecs.JsonCodec())
+
+    with pytest.raises(CodecError):
+        codecs.encode({"rooms": {1: "101"}})
+    assert codecs.decode(codecs.encode({"rooms": {"1": "101"}})) == {"rooms": {"1": "101"}}
+
+
+def test_json_round_trip_is_exact_for_endpoint_payloads():
+    # Dạng dữ liệu các endpoint cache: dict key chuỗi, list, số thực, None, tiếng Việt
+    payloads = [
+        {"khoa": "50", "faculties": [{"id": 1, "name": "Khoa Kinh tế", "majors": [
+            {"id": 2, "name": "Kế toán", "program_id": 3, "courses": [
+                {"code": "KT001", "name": "Nguyên lý kế toán", "credit": 3, "syllabus_url": None}]}]}]},
+        {"totalRooms": 2, "roomUtilization": 4.2, "facilityUtilization": [{"name": "Cơ sở 1", "utilization": 0.0}]},
+        [{"id": 1, "room_number": "101", "building": "A"}],
+    ]
+    codecs = CodecSet(CODECS["json"])
+    for payload in payloads:
+        assert codecs.decode(codecs.encode(payload)) == payload
+
+
+def test_pickle_codec_requires_allow_pickle(monkeypatch):
+    monkeypatch.setattr(cache_codecs, "ALLOW_PICKLE", False)
+    with pytest.raises(ValueError):
+        CacheManager(memory_cache=MemoryCache(sweep_interval=0), codec="pickle")
+
+    monkeypatch.setattr(cache_codecs, "ALLOW_PICKLE", True)
+    assert CacheManager(memory_cache=MemoryCache(sweep_interval=0), codec="pickle").codecs.default.name == "pickle"
@@ -0,0 +1,44 @@
+"""
+Invalidation theo tag: xóa đúng các key của tag trên Redis (L2) và memory (L1) của mọi worker, không quét toàn bộ keyspace
+"""
+from core.optimization import CacheManager, LocalInvalidationBus, MemoryCache
+
+
+def make_manager(redis_client, bus=None) -> CacheManager:
+    manager = CacheManager(memory_cache=MemoryCache(sweep_interval=0), namespace="test",
+                           invalidation_bus=bus, codec="json")
+    manager.redis_client = redis_client
+    return manager
+
+
+def test_tag_invalidation_removes_only_tagged_keys(fake_redis):
+    manager = make_manager(fake_redis)
+    fake_redis.data["other-app:x"] = b"1"
+    manager.set("catalog:programs:tree:50", {"khoa": "50"}, 60, tags=("catalog:programs", "programs:khoa:50"))
+    manager.set("catalog:programs:tree:51", {"khoa": "51"}, 60, tags=("catalog:programs", "programs:khoa:51"))
+
+    assert manager.invalidate_tags("programs:khoa:50") == 2  # Một key trên Redis, một bản sao L1
+
+    assert "test:catalog:programs:tree:50" not in fake_redis.data
+    assert "test:tag:programs:khoa:50" not in fake_redis.data
+    assert "catalog:programs:tree:50" not in manager.memory_cache
+    assert manager.get("catalog:programs:tree:50") is None
+    assert manager.get("catalog:programs:tree:51") == {"khoa": "51"}
+    assert fake_redis.data["other-app:x"] == b"1"
+
+
+def test_tag_invalidation_clears_l1_of_other_workers(fake_redis):
+    bus = LocalInvalidationBus()
+    writer, reader = make_manager(fake_redis, bus), make_manager(fake_redis, bus)
+    writer.set("catalog:news:list", [1, 2], 60, tags=("catalog:news",))
+
+    assert reader.get("catalog:news:list") == [1, 2]  # Đọc từ L2, giữ bản sao L1 (không biết tag)
+    assert reader.cache_stats["l2_hits"] == 1
+    assert "catalog:news:list" in reader.memory_cache
+
+    writer.invalidate_tags("catalog:news")
+
+    assert "test:catalog:news:list" not in fake_redis.data
+    assert "catalog:news:list" not in writer.memory_cache
+    assert "catalog:news:list" not in reader.memory_cache
+    assert reader.get("catalog:news:list") is None
@@ -0,0 +1,55 @@
+"""
+Key của @cached / @cached_query: Session bị bỏ theo kiểu (không chỉ theo tên "db"),
+tham số không tạo được key thì gọi thẳng hàm thay vì lỗi ở mọi lời gọi
+"""
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from core import optimization
+from core.optimization import cached, cached_query, make_cache_key
+
+
+def test_session_parameter_with_other_name_is_cached(session_factory, clean_cache):
+    calls = []
+
+    @cached_query(ttl=60)
+    def count_rooms(session, facility_id: int):
+        calls.append(facility_id)
+        return session.execute(text("SELECT COUNT(*) FROM rooms")).scalar()
+
+    with session_factory() as first, session_factory() as second:
+        assert count_rooms(first, 1) == 0
+        assert count_rooms(second, facility_id=1) == 0
+        assert count_rooms.cache_key(first, 1) == count_rooms.cache_key(second, 1)
+    assert calls == [1]
+
+
+def test_unkeyable_argument_bypasses_cache(clean_cache, caplog, monkeypatch):
+    monkeypatch.setattr(optimization, "_uncacheable_warned", set())
+
+    class Repository:
+        def __init__(self):
+            self.calls = 0
+
+        @cached(ttl=60)
+        def load(self, key: str):
+            self.calls += 1
+            return key.upper()
+
+    repo = Repository()
+    with caplog.at_level(logging.WARNING, logger=optimization.__name__):
+        assert repo.load("a") == "A"
+        assert repo.load("a") == "A"
+
+    assert repo.calls == 2  # Không cache, nhưng cũng không lỗi
+    assert len([r for r in caplog.records if "Cache bypassed" in r.getMessage()]) == 1
+
+
+def test_non_string_dict_keys_are_uncacheable():
+    def lookup(mapping):
+        return mapping
+
+    with pytest.raises(optimization.UncacheableArguments):
+        make_cache_key(lookup, ({(1, 2): "x"},), {})
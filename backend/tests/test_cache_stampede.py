@@ -0,0 +1,65 @@
+"""
+Chống stampede trong @cached: miss đồng thời chỉ tính một lần, giá trị cũ được trả trong khi tác vụ nền tính lại
+"""
+import threading
+import time
+
+from core.optimization import cached, cache_manager
+
+
+def test_concurrent_miss_loads_once(clean_cache):
+    calls = []
+    callers = 8
+    barrier = threading.Barrier(callers)
+
+    @cached(ttl=60, early_refresh=False)
+    def slow_square(x: int):
+        calls.append(x)
+        time.sleep(0.2)
+        return x * x
+
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(slow_square(7))
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [7]
+    assert results == [49] * callers
+
+
+def test_stale_value_served_while_refreshing(clean_cache):
+    version = {"value": 1}
+    refreshing, release = threading.Event(), threading.Event()
+
+    @cached(ttl=60, stale_ttl=60, early_refresh=False)
+    def current_version():
+        if version["value"] > 1:
+            refreshing.set()
+            release.wait(5)
+        return version["value"]
+
+    assert current_version() == 1
+
+    # Đẩy hạn logic về quá khứ: entry còn trong cache (stale_ttl) nhưng đã cũ
+    key = current_version.cache_key()
+    cache_manager.set(key, {**cache_manager.get(key), "expires_at": time.time() - 1}, 60)
+    version["value"] = 2
+    stale_served = cache_manager.cache_stats["stale_served"]
+
+    assert current_version() == 1  # Trả ngay giá trị cũ, không chờ lần tính lại
+    assert refreshing.wait(5)
+    assert cache_manager.cache_stats["stale_served"] == stale_served + 1
+    assert current_version() == 1  # Tác vụ nền vẫn đang chạy
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache_manager.get(key)["value"] != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert current_version() == 2
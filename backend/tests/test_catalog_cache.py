@@ -0,0 +1,30 @@
+"""
+Read-through cache của endpoint công khai: lần đọc thứ hai không chạm database, ghi xong thì đọc lại thấy dữ liệu mới
+"""
+import pytest
+
+import news_routes
+
+
+@pytest.fixture
+def client(make_client, clean_cache):
+    return make_client((news_routes, ""))
+
+
+def test_news_list_is_cached_until_write(client, statements):
+    assert client.get("/news").json() == []
+
+    statements.reset()
+    assert client.get("/news").json() == []
+    assert statements.count == 0
+
+    created = client.post("/admin/news", json={"title": "Tuyển sinh", "content": "..."}).json()
+    assert [n["id"] for n in client.get("/news").json()] == [created["id"]]
+
+    client.put(f"/admin/news/{created['id']}", json={"title": "Tuyển sinh 2025", "content": "..."})
+    assert client.get(f"/news/{created['id']}").json()["title"] == "Tuyển sinh 2025"
+    assert client.get("/news").json()[0]["title"] == "Tuyển sinh 2025"
+
+    client.delete(f"/admin/news/{created['id']}")
+    assert client.get("/news").json() == []
+    assert client.get(f"/news/{created['id']}").status_code == 404
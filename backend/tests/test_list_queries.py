@@ -0,0 +1,108 @@
+"""
+Các endpoint danh sách của admin phải chạy số câu SQL cố định, không tăng theo số dòng (N+1)
+"""
+import pytest
+
+import classes
+import manager
+import models
+import teachers
+import training_program
+
+
+def seed(db, start: int, count: int):
+    faculty = db.query(models.Faculty).first()
+    if faculty is None:
+        faculty = models.Faculty(name="Khoa Kinh tế")
+        db.add(faculty)
+        db.flush()
+    major = db.query(models.TrainingMajor).first()
+    if major is None:
+        major = models.TrainingMajor(name="Kế toán", faculty_id=faculty.id)
+        db.add(major)
+        db.flush()
+
+    for i in range(start, start + count):
+        facility = models.CoSoLienKet(name=f"Cơ sở {i}", address="Cần Thơ", phone="0292")
+        db.add(facility)
+        db.flush()
+
+        teacher_user = models.User(username=f"gv{i}", password="x", role="teacher", status="active")
+        manager_user = models.User(username=f"ql{i}", password="x", role="manager", status="blocked")
+        db.add_all([teacher_user, manager_user])
+        db.flush()
+
+        db.add(models.Teacher(name=f"GV {i}", code=f"GV{i:03d}", email=f"gv{i}@ctu.edu.vn",
+                              phone="09", user_id=teacher_user.id, faculty_id=faculty.id))
+        db.add(models.ManagerProfile(full_name=f"QL {i}", phone="09",
+                                     facility_id=facility.id, user_id=manager_user.id))
+        db.add(models.Class(khoa="K50", ma_lop=f"L{i:03d}", facility_id=facility.id,
+                            major_id=major.id, he_dao_tao="vhvl"))
+
+        course = models.Course(code=f"HP{i:03d}", name=f"Học phần {i}", credit=3)
+        program = models.TrainingProgram(khoa=f"{2000 + i}", major_id=major.id)
+        db.add_all([course, program])
+        db.flush()
+        db.add(models.ProgramCourse(program_id=program.id, course_code=course.code))
+    db.commit()
+
+
+LIST_ENDPOINTS = [
+    "/admin/users/teachers",
+    "/admin/users/teachers/list",
+    "/admin/users/managers",
+    "/admin/classes",
+    "/admin/programs",
+]
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(
+        (teachers, ""),
+        (manager, ""),
+        (classes, "/admin"),
+        (training_program, ""),
+    )
+
+
+@pytest.mark.parametrize("url", LIST_ENDPOINTS)
+def test_list_statement_count_is_constant(url, client, session_factory, statements):
+    with session_factory() as db:
+        seed(db, 0, 2)
+    statements.reset()
+    small = client.get(url)
+    small_count = statements.count
+
+    with session_factory() as db:
+        seed(db, 2, 8)
+    statements.reset()
+    large = client.get(url)
+    large_count = statements.count
+
+    assert small.status_code == large.status_code == 200
+    assert len(small.json()) == 2
+    assert len(large.json()) == 10
+    assert large_count == small_count == 1
+
+
+def test_list_payloads(client, session_factory):
+    with session_factory() as db:
+        seed(db, 0, 1)
+
+    teacher = client.get("/admin/users/teachers/list").json()[0]
+    assert teacher["faculty"] == "Khoa Kinh tế"
+    assert teacher["status"] == "active"
+    assert teacher["username"] == "gv0"
+
+    managers = client.get("/admin/users/managers").json()
+    assert managers[0]["facility_name"] == "Cơ sở 0"
+    assert managers[0]["status"] == "blocked"
+
+    class_row = client.get("/admin/classes").json()[0]
+    assert class_row["facility"] == "Cơ sở 0"
+    assert class_row["major"] == "Kế toán"
+
+    program = client.get("/admin/programs").json()[0]
+    assert program["major_name"] == "Kế toán"
+    assert program["course_count"] == 1
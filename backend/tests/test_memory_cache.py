@@ -0,0 +1,58 @@
+"""
+MemoryCache: LRU theo số entry và byte (ước lượng không serialize), TTL, dọn entry hết hạn
+"""
+import threading
+import time
+
+from core.optimization import CacheManager, MemoryCache, estimate_size
+
+
+def test_lru_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, sweep_interval=0)
+    cache.set("catalog:news:a", 1, 60)
+    cache.set("catalog:news:b", 2, 60)
+    assert cache.get("catalog:news:a") == 1  # a mới được dùng, b là entry cũ nhất
+    cache.set("catalog:news:c", 3, 60)
+
+    assert cache.keys() == ["catalog:news:a", "catalog:news:c"]
+    assert cache.get_stats()["namespaces"]["catalog:news"]["evictions"] == 1
+
+
+def test_max_bytes_bounds_total_size():
+    cache = MemoryCache(max_bytes=2048, sweep_interval=0)
+    cache.set("big:1", "x" * 1500, 60)
+    cache.set("big:2", "y" * 1500, 60)
+    assert cache.keys() == ["big:2"]
+    assert not cache.set("big:3", "z" * 4096, 60)  # Lớn hơn cả giới hạn thì không cache
+    assert cache.get_stats()["bytes"] <= 2048
+
+
+def test_expired_entries_are_swept():
+    cache = MemoryCache(sweep_interval=0)
+    cache.set("tmp:a", 1, 0.01)
+    cache.set("tmp:b", 2, 60)
+    time.sleep(0.02)
+
+    assert "tmp:a" not in cache
+    assert cache.sweep() == 1
+    assert cache.keys() == ["tmp:b"]
+
+
+def test_estimate_size_is_structural():
+    assert estimate_size(b"x" * 100) == 100
+    assert estimate_size("y" * 100) == 100
+    rows = [{"code": f"CT{i:03d}", "name": "x" * 50} for i in range(1000)]
+    # Lấy mẫu vài phần tử rồi nhân lên, không đi hết (hay serialize) cả danh sách
+    assert estimate_size(rows) > 1000 * 50
+
+
+def test_l1_copy_reuses_encoded_size(fake_redis):
+    manager = CacheManager(memory_cache=MemoryCache(sweep_interval=0), namespace="test", codec="json")
+    manager.redis_client = fake_redis
+    manager.set("catalog:news:list", [{"id": 1, "title": "Tin"}], 60)
+
+    assert manager.memory_cache.get_stats()["bytes"] == len(fake_redis.data["test:catalog:news:list"])
+
+
+def test_import_does_not_start_sweeper():
+    assert not any(thread.name == "memory-cache-sweeper" for thread in threading.enumerate())
@@ -0,0 +1,58 @@
+"""
+Thứ tự học phần của chương trình đào tạo: theo khóa chính (program_id, course_code), không theo thứ tự thêm
+"""
+import pytest
+from sqlalchemy import text
+
+import models
+import program_view
+
+
+@pytest.fixture
+def client(make_client, session_factory, clean_cache):
+    with session_factory() as db:
+        faculty = models.Faculty(name="Khoa Kinh tế")
+        db.add(faculty)
+        db.flush()
+        major = models.TrainingMajor(name="Kế toán", faculty_id=faculty.id)
+        db.add(major)
+        db.flush()
+        program = models.TrainingProgram(khoa="50", major_id=major.id)
+        db.add_all([program] + [models.Course(code=code, name=f"Học phần {code}", credit=3) for code in ("KT003", "KT001", "KT002")])
+        db.flush()
+        # Thêm liên kết lệch thứ tự mã để phân biệt thứ tự thêm (rowid) với thứ tự khóa chính
+        for code in ("KT003", "KT001", "KT002"):
+            db.add(models.ProgramCourse(program_id=program.id, course_code=code))
+            db.flush()
+        db.commit()
+    return make_client((program_view, ""))
+
+
+EXPECTED_CODES = ["KT001", "KT002", "KT003"]
+
+
+def test_by_major_orders_courses_by_primary_key(client, session_factory):
+    major_id = client.get("/programs/years/50/faculties/1/majors").json()[0]["id"]
+    program = client.get(f"/programs/by_major?khoa=50&major_id={major_id}").json()
+    assert [course["code"] for course in program["courses"]] == EXPECTED_CODES
+
+    # Truy vấn cũ (không ORDER BY) đọc qua index khóa chính và cũng ra đúng thứ tự này
+    with session_factory() as db:
+        baseline = db.execute(text(
+            "SELECT course_code FROM program_courses WHERE program_id = :p"
+        ), {"p": program["program_id"]}).scalars().all()
+    assert baseline == EXPECTED_CODES
+
+
+def test_tree_orders_courses_by_primary_key(client):
+    tree = client.get("/programs/years/50/tree").json()
+    courses = tree["faculties"][0]["majors"][0]["courses"]
+    assert [course["code"] for course in courses] == EXPECTED_CODES
+
+
+def test_tree_if_none_match_forms(client):
+    etag = client.get("/programs/years/50/tree").headers["etag"]
+
+    for header in (etag, f'"other", {etag}', "*", etag[2:]):
+        assert client.get("/programs/years/50/tree", headers={"If-None-Match": header}).status_code == 304, header
+    assert client.get("/programs/years/50/tree", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,49 @@
+"""
+Fingerprint câu SQL và advisor EXPLAIN QUERY PLAN trên SQLite
+"""
+from sqlalchemy import text
+
+from core.optimization import DatabaseOptimizer, fingerprint_statement
+
+
+def test_fingerprint_merges_literals():
+    a = fingerprint_statement("SELECT * FROM news WHERE id = 1 AND title = 'a' LIMIT 10")
+    b = fingerprint_statement("SELECT *  FROM news\nWHERE id = 42 AND title = 'it''s' LIMIT 20")
+    assert a == b == "SELECT * FROM news WHERE id = ? AND title = ? LIMIT ?"
+    assert fingerprint_statement("SELECT 1 FROM rooms WHERE rooms.id IN (?, ?, ?)") == \
+        "SELECT ? FROM rooms WHERE rooms.id IN (?, ...)"
+
+
+def test_advisor_flags_full_scan_on_hot_table(engine, session_factory):
+    optimizer = DatabaseOptimizer()
+    optimizer.setup_query_profiling(engine)
+    with session_factory() as db:
+        db.execute(text("DROP INDEX IF EXISTS ix_students_class_id"))
+        db.execute(text("SELECT students.id FROM students WHERE students.class_id = :c"), {"c": 1}).all()
+        db.execute(text("SELECT courses.code FROM courses WHERE courses.code = :c"), {"c": "CT101"}).all()
+        report = optimizer.advise(db)
+
+    scans = report["full_scans_on_hot_tables"]
+    assert [scan["table"] for scan in scans] == ["students"]
+    suggestion = report["index_suggestions"][0]
+    assert suggestion["sql"] == "CREATE INDEX IF NOT EXISTS ix_students_class_id ON students (class_id);"
+    assert suggestion["priority"] == "high"
+    assert suggestion["queries"] == [scans[0]["id"]]
+
+
+def test_unmatched_paths_share_one_route_entry(engine, make_client):
+    import news_routes
+    from core.optimization import QueryProfilingMiddleware
+
+    optimizer = DatabaseOptimizer()
+    optimizer.setup_query_profiling(engine)
+    client = make_client((news_routes, ""))
+    client.app.add_middleware(QueryProfilingMiddleware, optimizer=optimizer)
+
+    for path in ("/wp-admin", "/.env", "/news/1/unknown", "/static/x.png"):
+        assert client.get(path).status_code == 404
+    client.get("/news/1")
+
+    routes = sorted(optimizer.get_query_stats()["routes"], key=lambda r: r["route"])
+    assert [r["route"] for r in routes] == ["GET /news/{id}", "GET <unmatched>"]
+    assert routes[1]["requests"] == 4
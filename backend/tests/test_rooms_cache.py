@@ -0,0 +1,64 @@
+"""
+/rooms/public và /rooms/public/{room_id} dùng chung cache theo phòng: thứ tự gọi không được làm đổi kiểu dữ liệu trả về
+"""
+import pytest
+
+import catalog_cache
+import models
+import rooms
+
+
+@pytest.fixture
+def client(make_client, session_factory, clean_cache):
+    with session_factory() as db:
+        facility = models.CoSoLienKet(name="Cơ sở 1", address="Cần Thơ", phone="0292")
+        db.add(facility)
+        db.flush()
+        db.add_all([
+            models.Room(id=1, room_number="101", capacity=40, building="A", facility_id=facility.id),
+            models.Room(id=2, room_number="202", capacity=40, building="B", facility_id=facility.id),
+        ])
+        db.commit()
+    return make_client((rooms, "/manager"))
+
+
+ROOM_1 = {"id": 1, "room_number": "101", "building": "A"}
+ROOM_2 = {"id": 2, "room_number": "202", "building": "B"}
+
+
+def test_single_then_batch_then_single(client):
+    assert client.get("/manager/rooms/public/1").json() == ROOM_1
+    assert client.get("/manager/rooms/public?ids=1&ids=2").json() == [ROOM_1, ROOM_2]
+
+    single = client.get("/manager/rooms/public/2")
+    assert single.status_code == 200
+    assert single.json() == ROOM_2
+    assert client.get("/manager/rooms/public?ids=2&ids=1").json() == [ROOM_1, ROOM_2]
+
+
+def test_rooms_namespace_invalidation(client, statements):
+    client.get("/manager/rooms/public?ids=1&ids=2")
+    statements.reset()
+    client.get("/manager/rooms/public/1")
+    assert statements.count == 0
+
+    catalog_cache.invalidate(catalog_cache.ROOMS)
+    assert client.get("/manager/rooms/public/1").json() == ROOM_1
+    assert statements.count == 1
+    assert client.get("/manager/rooms/public/404").status_code == 404
+
+
+def test_delete_room_drops_cached_batch_entries(client, session_factory):
+    with session_factory() as db:
+        db.add_all([
+            models.User(id=5, username="ql1", password="x", role="manager"),
+            models.ManagerProfile(full_name="QL 1", user_id=5, facility_id=1),
+        ])
+        db.commit()
+    client.app.dependency_overrides[rooms.get_current_user] = lambda: models.User(id=5, role="manager")
+
+    assert client.get("/manager/rooms/public?ids=1&ids=2").json() == [ROOM_1, ROOM_2]
+    assert client.delete("/manager/rooms/2").status_code == 200
+
+    assert client.get("/manager/rooms/public?ids=1&ids=2").json() == [ROOM_1]
+    assert client.get("/manager/rooms/public/2").status_code == 404
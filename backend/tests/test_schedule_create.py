@@ -0,0 +1,49 @@
+"""
+POST /admin/schedules: dòng trùng phòng/giáo viên với lớp khác bị từ chối mà không chiếm slot của dòng hợp lệ sau nó
+"""
+import pytest
+
+import models
+import schedule
+from academic_calendar import slot_key
+
+
+@pytest.fixture
+def client(make_client, session_factory):
+    with session_factory() as db:
+        facility = models.CoSoLienKet(name="Cơ sở 1", address="Cần Thơ", phone="0292")
+        db.add(facility)
+        db.flush()
+        db.add_all([
+            models.User(id=1, username="gv1", password="x", role="teacher"),
+            models.User(id=2, username="gv2", password="x", role="teacher"),
+            models.Course(code="CT101", name="Lập trình", credit=3),
+            models.Class(id=1, khoa="50", ma_lop="L01", facility_id=facility.id),
+            models.Class(id=2, khoa="50", ma_lop="L02", facility_id=facility.id),
+        ])
+        db.flush()
+        # Giáo viên 1 đã dạy lớp 2 vào sáng thứ Hai tuần 1
+        db.add(models.ScheduleItem(class_id=2, hoc_ky="HK1", nam_hoc=2025, week=1, day="Thứ Hai", period="Sáng",
+                                   subject_id="CT101", teacher_id=1, hinh_thuc="truc_tiep",
+                                   slot_key=slot_key(1, "Thứ Hai", "Sáng")))
+        db.commit()
+
+    client = make_client((schedule, "/admin"))
+    client.app.dependency_overrides[schedule.get_current_user] = lambda: models.User(id=9, role="admin")
+    return client
+
+
+def test_conflicting_row_does_not_block_valid_row_for_same_slot(client, session_factory):
+    slot = {"week": 1, "day": "Thứ Hai", "period": "Sáng", "subject_id": "CT101", "hinh_thuc": "truc_tiep"}
+    response = client.post("/admin/schedules", json={
+        "class_id": 1, "hoc_ky": "HK1", "nam_hoc": 2025,
+        "schedule_items": [{**slot, "teacher_id": 1}, {**slot, "teacher_id": 2}, {**slot, "teacher_id": 2}],
+    }).json()
+
+    assert [c["reason"] for c in response["conflicts"]] == ["teacher"]
+    assert response["added"] == [{"week": 1, "day": "Thứ Hai", "period": "Sáng"}]
+    assert len(response["skipped"]) == 1  # Dòng lặp lại trong dữ liệu gửi lên
+
+    with session_factory() as db:
+        teachers = db.query(models.ScheduleItem.teacher_id).filter(models.ScheduleItem.class_id == 1).all()
+    assert teachers == [(2,)]
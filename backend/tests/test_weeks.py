@@ -0,0 +1,25 @@
+"""
+GET /weeks/: ETag theo lịch học kỳ, If-None-Match dạng danh sách, "*" và so sánh yếu đều trả 304
+"""
+import pytest
+
+import weeks
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client((weeks, "/weeks"))
+
+
+def test_weeks_if_none_match_forms(client):
+    response = client.get("/weeks/?nam_hoc=2025&hoc_ky=HK1")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    for header in (etag, f'"other", {etag}', "*", etag[2:]):
+        revalidated = client.get("/weeks/?nam_hoc=2025&hoc_ky=HK1", headers={"If-None-Match": header})
+        assert revalidated.status_code == 304, header
+        assert revalidated.headers["etag"] == etag
+
+    assert client.get("/weeks/?nam_hoc=2025&hoc_ky=HK1", headers={"If-None-Match": '"other"'}).status_code == 200
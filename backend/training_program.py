@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
 from database import SessionLocal
 import models, schemas
+import catalog_cache
 from schemas import CourseUpdateInProgram
 from pydantic import BaseModel
 router = APIRouter()
@@ -37,6 +39,7 @@ def create_program(program: schemas.ProgramCreate, db: Session = Depends(get_db)
     for code in program.course_codes:
         db.add(models.ProgramCourse(program_id=new_program.id, course_code=code))
     db.commit()
+    catalog_cache.invalidate(catalog_cache.program_tag(program.khoa), catalog_cache.PROGRAM_YEARS_TAG)
 
     return schemas.ProgramOut(
         id=new_program.id,
@@ -47,16 +50,25 @@ def create_program(program: schemas.ProgramCreate, db: Session = Depends(get_db)
 
 @router.get("/admin/programs")
 def list_programs(db: Session = Depends(get_db)):
-    programs = db.query(models.TrainingProgram).all()
+    # Đếm học phần bằng subquery GROUP BY thay vì query từng chương trình
+    course_counts = db.query(
+        models.ProgramCourse.program_id,
+        func.count(models.ProgramCourse.course_code).label("course_count")
+    ).group_by(models.ProgramCourse.program_id).subquery()
+
+    programs = db.query(models.TrainingProgram, func.coalesce(course_counts.c.course_count, 0)) \
+        .options(joinedload(models.TrainingProgram.major)) \
+        .outerjoin(course_counts, course_counts.c.program_id == models.TrainingProgram.id) \
+        .order_by(models.TrainingProgram.id) \
+        .all()
     result = []
-    for p in programs:
-        major = db.query(models.TrainingMajor).filter_by(id=p.major_id).first()
-        courses = db.query(models.ProgramCourse).filter_by(program_id=p.id).all()
+    for p, course_count in programs:
+        major = p.major
         result.append({
             "id": p.id,
             "khoa": p.khoa,
             "major_name": major.name if major else "Không rõ",
-            "course_count": len(courses)
+            "course_count": course_count
         })
     return result
 
@@ -112,6 +124,7 @@ def update_course_in_program(
     course.credit = payload.credit
     course.syllabus_url = payload.syllabus_url
     db.commit()
+    catalog_cache.invalidate(catalog_cache.PROGRAMS, catalog_cache.COURSES)
     return {"message": "Đã cập nhật thành công"}
 class DeleteCourseInput(BaseModel):
     khoa: str
@@ -140,6 +153,7 @@ def delete_course_from_program(
 
     db.delete(course)
     db.commit()
+    catalog_cache.invalidate(catalog_cache.program_tag(payload.khoa))
     return {"message": "Đã xóa học phần khỏi chương trình"}
 
 class ProgramCourseCreate(BaseModel):
@@ -171,6 +185,7 @@ def add_multiple_courses_to_program(
             added_codes.append(code)
 
     db.commit()
+    catalog_cache.invalidate(catalog_cache.program_tag(payload.khoa))
     return {"message": f"Đã thêm {len(added_codes)} học phần vào chương trình"}
 
 @router.delete("/admin/programs/delete_program")
@@ -186,5 +201,6 @@ def delete_training_program(payload: schemas.ProgramDeleteInput = Body(...), db:
     db.query(models.ProgramCourse).filter_by(program_id=program.id).delete()
     db.delete(program)
     db.commit()
+    catalog_cache.invalidate(catalog_cache.program_tag(payload.khoa), catalog_cache.PROGRAM_YEARS_TAG)
 
     return {"message": "Đã xóa chương trình đào tạo"}
\ No newline at end of file
@@ -2,11 +2,12 @@ from typing import Any, Text, Dict, List
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
-import requests
 from datetime import datetime, timedelta
+import asyncio
 import json
 import os
 import sys
+import time
 
 # Load environment variables manually
 def load_env_file():
@@ -29,15 +30,21 @@ def load_env_file():
 # Load environment variables
 load_env_file()
 
+# HTTP client dùng chung (keep-alive) - import sau khi .env đã được load
+from http_client import async_backend_client
+from ttl_cache import TTLCache
+from schedule_cache import create_schedule_cache
+from calendar_lookup import academic_calendar
+
 # Import RAG bridge system
 try:
     # Debug environment variables
     print(f"🔧 DEBUG: RAG_SERVER_URL = {os.getenv('RAG_SERVER_URL', 'NOT_SET')}")
     print(f"🔧 DEBUG: Current working directory = {os.getcwd()}")
     
-    from rag_bridge import RAGBridge
+    # Dùng instance chung của module để circuit breaker được chia sẻ giữa các action
+    from rag_bridge import rag_bridge
     RAG_AVAILABLE = True
-    rag_bridge = RAGBridge()
     print("✅ RAG Bridge initialized successfully")
 except ImportError as e:
     print(f"⚠️ RAG Bridge not available: {e}")
@@ -48,32 +55,115 @@ except Exception as e:
     RAG_AVAILABLE = False
     rag_bridge = None
 
-# Cache để lưu thông tin phòng
-room_cache = {}
-
-def fetch_room_info(room_id):
-    """Fetch thông tin phòng từ API và cache lại"""
-    if not room_id:
+# Cache thông tin phòng trong process (LRU + TTL), dùng chung cho mọi action
+room_cache = TTLCache(
+    maxsize=int(os.getenv("ROOM_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("ROOM_CACHE_TTL", "600")),
+)
+
+# Cache lịch học sinh viên và lịch tuần (revalidate bằng ETag của backend)
+schedule_cache = create_schedule_cache(async_backend_client)
+
+# Cây chương trình đào tạo theo khóa: (thời điểm lấy, ETag, dữ liệu), revalidate bằng If-None-Match
+program_tree_cache = TTLCache(
+    maxsize=int(os.getenv("PROGRAM_TREE_CACHE_SIZE", "32")),
+    ttl=float(os.getenv("PROGRAM_TREE_CACHE_MAX_AGE", "86400")),
+)
+PROGRAM_TREE_FRESH_TTL = float(os.getenv("PROGRAM_TREE_FRESH_TTL", "300"))
+
+async def get_program_tree(khoa):
+    """Cây khoa -> ngành -> học phần của khóa từ /programs/years/{khoa}/tree; None nếu không lấy được"""
+    cached = program_tree_cache.get(khoa)
+    now = time.monotonic()
+    if cached and now - cached[0] < PROGRAM_TREE_FRESH_TTL:
+        return cached[2]
+
+    headers = {"If-None-Match": cached[1]} if cached and cached[1] else {}
+    response = await async_backend_client.get(f"/programs/years/{khoa}/tree", headers=headers)
+    if response.status_code == 304 and cached:
+        program_tree_cache.set(khoa, (now, cached[1], cached[2]))
+        return cached[2]
+    if response.status_code != 200:
         return None
-    
-    # Kiểm tra cache trước
-    if room_id in room_cache:
-        return room_cache[room_id]
+
+    tree = response.json()
+    program_tree_cache.set(khoa, (now, response.headers.get("ETag"), tree))
+    return tree
+
+def get_current_semester_info(today=None):
+    """Lấy thông tin học kỳ và năm học hiện tại"""
+    today = today or datetime.now().date()
+    if academic_calendar is not None:
+        return academic_calendar.current_semester(today)
+    
+    # Xác định học kỳ dựa trên tháng hiện tại: 9-1 là HK1, 2-6 là HK2, 7-8 là HK3 (học hè)
+    if today.month >= 9:
+        return "HK1", today.year
+    if today.month == 1:
+        return "HK1", today.year - 1
+    if today.month <= 6:
+        return "HK2", today.year - 1
+    return "HK3", today.year - 1
+
+async def get_week_for_date(target_date, hoc_ky, nam_hoc):
+    """Tuần học chứa ngày cụ thể: (week, start_date, end_date), hoặc (None, None, None) nếu ngoài học kỳ"""
+    if academic_calendar is not None:
+        info = academic_calendar.week_for_date(target_date, hoc_ky, nam_hoc)
+        return (info.week, info.start_date, info.end_date) if info else (None, None, None)
     
     try:
-        # Thử endpoint public trước
-        response = requests.get(f"http://localhost:8000/manager/rooms/public/{room_id}", timeout=5)
-        if response.status_code == 200:
-            room_data = response.json()
-            room_cache[room_id] = room_data
-            return room_data
+        weeks = await schedule_cache.get_weeks(hoc_ky, nam_hoc)
+        for week in weeks or []:
+            start_date = datetime.strptime(week["start_date"], "%Y-%m-%d").date()
+            end_date = datetime.strptime(week["end_date"], "%Y-%m-%d").date()
+            
+            if start_date <= target_date <= end_date:
+                return week["week"], start_date, end_date
     except Exception as e:
-        print(f"Lỗi khi fetch thông tin phòng {room_id}: {e}")
+        print(f"Error getting week for date: {e}")
+    return None, None, None
+
+async def resolve_rooms(room_ids):
+    """Lấy thông tin nhiều phòng bằng một request batch, chỉ hỏi backend các phòng chưa có trong cache"""
+    rooms = {}
+    missing = []
+    for room_id in set(room_ids):
+        if not room_id:
+            continue
+        cached = room_cache.get(room_id)
+        if cached is not None:
+            rooms[room_id] = cached
+        else:
+            missing.append(room_id)
+    
+    if missing:
+        try:
+            response = await async_backend_client.get(
+                "/manager/rooms/public",
+                params=[("ids", room_id) for room_id in sorted(missing)]
+            )
+            if response.status_code == 200:
+                for room_data in response.json():
+                    room_cache.set(room_data["id"], room_data)
+                    rooms[room_data["id"]] = room_data
+                # Phòng không tồn tại: cache thông tin cơ bản để không hỏi lại
+                for room_id in missing:
+                    if room_id not in rooms:
+                        rooms[room_id] = {"room_number": str(room_id), "building": None}
+                        room_cache.set(room_id, rooms[room_id])
+        except Exception as e:
+            print(f"Lỗi khi fetch thông tin phòng {missing}: {e}")
     
-    # Cache thông tin cơ bản nếu không fetch được
-    fallback_info = {"room_number": str(room_id), "building": None}
-    room_cache[room_id] = fallback_info
-    return fallback_info
+    return rooms
+
+async def prefetch_room_info(schedule_items):
+    """Nạp trước thông tin phòng cho các tiết chưa có classroom/room object"""
+    room_ids = [
+        item["room_id"] for item in schedule_items
+        if item.get("room_id") and not item.get("classroom") and not item.get("room")
+    ]
+    if room_ids:
+        await resolve_rooms(room_ids)
 
 def format_room_display(room_info):
     """Format hiển thị thông tin phòng"""
@@ -92,7 +182,7 @@ class ActionSubmitProgram(Action):
     def name(self) -> Text:
         return "action_submit_program"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
@@ -100,35 +190,23 @@ class ActionSubmitProgram(Action):
         faculty = tracker.get_slot("faculty")
         major = tracker.get_slot("major")
 
-        # B1: Tìm faculty_id từ API năm học
-        faculty_resp = requests.get(f"http://localhost:8000/programs/years/{year}/faculties")
-        faculty_data = faculty_resp.json()
-        faculty_id = next((f["id"] for f in faculty_data if f["name"] == faculty), None)
+        # Một request lấy cả cây khoa -> ngành -> học phần của khóa
+        tree = await get_program_tree(year)
+        if tree is None:
+            dispatcher.utter_message(text="Không tìm thấy chương trình đào tạo.")
+            return []
 
-        if not faculty_id:
+        faculty_node = next((f for f in tree["faculties"] if f["name"] == faculty), None)
+        if not faculty_node:
             dispatcher.utter_message(text="Không tìm thấy khoa.")
             return []
 
-        # B2: Tìm major_id
-        major_resp = requests.get(f"http://localhost:8000/programs/years/{year}/faculties/{faculty_id}/majors")
-        major_data = major_resp.json()
-        major_id = next((m["id"] for m in major_data if m["name"] == major), None)
-
-        if not major_id:
+        major_node = next((m for m in faculty_node["majors"] if m["name"] == major), None)
+        if not major_node:
             dispatcher.utter_message(text="Không tìm thấy ngành.")
             return []
 
-        # B3: Lấy chương trình đào tạo
-        program_resp = requests.get(
-            f"http://localhost:8000/programs/by_major?khoa={year}&major_id={major_id}"
-        )
-
-        if program_resp.status_code != 200:
-            dispatcher.utter_message(text="Không tìm thấy chương trình đào tạo.")
-            return []
-
-        data = program_resp.json()
-        courses = data.get("courses", [])
+        courses = major_node["courses"]
         course_text = "\n".join([f"{c['code']} - {c['name']} ({c['credit']} tín chỉ)" for c in courses])
 
         dispatcher.utter_message(text=f"Chương trình đào tạo:\n{course_text}")
@@ -140,7 +218,7 @@ class ActionGetStudentProgram(Action):
     def name(self) -> Text:
         return "action_get_student_program"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -157,7 +235,7 @@ class ActionGetStudentProgram(Action):
             headers = {"Authorization": f"Bearer {token}"}
             
             # B1: Lấy thông tin sinh viên
-            student_resp = requests.get("http://localhost:8000/admin/student/profile", headers=headers)
+            student_resp = await async_backend_client.get("/admin/student/profile", headers=headers)
             
             if student_resp.status_code == 403:
                 dispatcher.utter_message(text="🚫 Bạn không có quyền truy cập thông tin sinh viên.")
@@ -180,7 +258,7 @@ class ActionGetStudentProgram(Action):
                 return []
             
             # B3: Tìm chương trình đào tạo dựa trên class_id (thông qua major)
-            class_resp = requests.get(f"http://localhost:8000/admin/classes/{student_data['class_id']}")
+            class_resp = await async_backend_client.get(f"/admin/classes/{student_data['class_id']}")
             
             if class_resp.status_code != 200:
                 dispatcher.utter_message(text="⚠️ Không thể tải thông tin lớp học.")
@@ -196,14 +274,18 @@ class ActionGetStudentProgram(Action):
             # B4: Lấy chương trình đào tạo theo major_id và khóa học
             khoa = class_data.get('khoa', datetime.now().year)  # Lấy khóa từ class hoặc dùng năm hiện tại
             
-            program_resp = requests.get(f"http://localhost:8000/programs/by_major?khoa={khoa}&major_id={major_id}")
+            # Dùng chung cây chương trình đã cache với action_submit_program
+            tree = await get_program_tree(khoa)
+            program_node = next(
+                (m for f in (tree or {}).get("faculties", []) for m in f["majors"] if m["id"] == major_id),
+                None
+            )
             
-            if program_resp.status_code != 200:
+            if program_node is None:
                 dispatcher.utter_message(text="📚 Không tìm thấy chương trình đào tạo cho ngành của bạn.")
                 return []
             
-            program_data = program_resp.json()
-            courses = program_data.get("courses", [])
+            courses = program_node["courses"]
             
             if not courses:
                 dispatcher.utter_message(text="📚 Chương trình đào tạo chưa có môn học nào được cập nhật.")
@@ -272,31 +354,6 @@ class ActionGetTodaySchedule(Action):
     def name(self) -> Text:
         return "action_get_today_schedule"
     
-    def get_current_semester_info(self):
-        """Lấy thông tin học kỳ và năm học hiện tại"""
-        current_date = datetime.now()
-        current_month = current_date.month
-        current_year = current_date.year
-        
-        # Xác định học kỳ dựa trên tháng hiện tại
-        if current_month >= 9 or current_month <= 1:
-            # Tháng 9-12 và tháng 1: HK1
-            current_semester = "HK1"
-            if current_month >= 9:
-                academic_year = current_year
-            else:
-                academic_year = current_year - 1
-        elif current_month >= 2 and current_month <= 6:
-            # Tháng 2-6: HK2
-            current_semester = "HK2"
-            academic_year = current_year - 1
-        else:
-            # Tháng 7-8: HK3 (học hè)
-            current_semester = "HK3"
-            academic_year = current_year - 1
-            
-        return current_semester, academic_year
-    
     def get_today_vietnamese(self):
         """Lấy tên thứ tiếng Việt của hôm nay"""
         today = datetime.now()
@@ -304,29 +361,6 @@ class ActionGetTodaySchedule(Action):
         day_names = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "CN"]
         return day_names[day_index]
     
-    def get_current_week(self, hoc_ky, nam_hoc):
-        """Lấy tuần học hiện tại"""
-        try:
-            response = requests.get(
-                "http://localhost:8000/weeks/",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc}
-            )
-            if response.status_code == 200:
-                weeks = response.json()
-                today = datetime.now().date()
-                
-                for week in weeks:
-                    start_date = datetime.strptime(week["start_date"], "%Y-%m-%d").date()
-                    end_date = datetime.strptime(week["end_date"], "%Y-%m-%d").date()
-                    
-                    if start_date <= today <= end_date:
-                        return week["week"]
-                        
-            return None
-        except Exception as e:
-            print(f"Error getting current week: {e}")
-            return None
-    
     def format_schedule_message(self, schedule_items):
         """Định dạng tin nhắn lịch học"""
         if not schedule_items:
@@ -372,9 +406,9 @@ class ActionGetTodaySchedule(Action):
             elif room.get("room_number"):
                 return f"P.{room['room_number']}"
         
-        # Nếu có room_id, fetch thông tin từ API
+        # Nếu có room_id, lấy thông tin đã prefetch từ API
         if item.get("room_id"):
-            room_info = fetch_room_info(item["room_id"])
+            room_info = room_cache.get(item["room_id"])
             formatted = format_room_display(room_info)
             if formatted:
                 return formatted
@@ -383,7 +417,7 @@ class ActionGetTodaySchedule(Action):
         
         return None
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -398,21 +432,20 @@ class ActionGetTodaySchedule(Action):
         
         try:
             # Lấy thông tin học kỳ hiện tại
-            hoc_ky, nam_hoc = self.get_current_semester_info()
-            current_week = self.get_current_week(hoc_ky, nam_hoc)
+            hoc_ky, nam_hoc = get_current_semester_info()
+            
+            # Lấy tuần hiện tại và lịch học sinh viên song song
+            (current_week, _, _), response = await asyncio.gather(
+                get_week_for_date(datetime.now().date(), hoc_ky, nam_hoc),
+                schedule_cache.get_student_schedules(
+                    token, hoc_ky, nam_hoc, date=datetime.now().date().isoformat()
+                ),
+            )
             
             if not current_week:
                 dispatcher.utter_message(text="⚠️ Không thể xác định tuần học hiện tại. Có thể đang trong kỳ nghỉ.")
                 return []
             
-            # Gọi API lấy lịch học sinh viên
-            headers = {"Authorization": f"Bearer {token}"}
-            response = requests.get(
-                "http://localhost:8000/student/schedules",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc},
-                headers=headers
-            )
-            
             if response.status_code == 403:
                 dispatcher.utter_message(text="🚫 Bạn không có quyền truy cập lịch học sinh viên.")
                 return []
@@ -423,16 +456,11 @@ class ActionGetTodaySchedule(Action):
                 dispatcher.utter_message(text="⚠️ Không thể tải lịch học. Vui lòng thử lại sau.")
                 return []
             
-            schedule_data = response.json()
-            
-            # Lọc lịch học hôm nay
-            today_vietnamese = self.get_today_vietnamese()
-            today_schedule = [
-                item for item in schedule_data 
-                if item.get("day") == today_vietnamese and item.get("week") == current_week
-            ]
+            # Backend đã lọc theo ngày hôm nay
+            today_schedule = response.json()
             
             # Tạo tin nhắn trả về
+            await prefetch_room_info(today_schedule)
             message = self.format_schedule_message(today_schedule)
             dispatcher.utter_message(text=message)
             
@@ -449,54 +477,6 @@ class ActionGetScheduleWeek(Action):
     def name(self) -> Text:
         return "action_get_schedule_week"
     
-    def get_current_semester_info(self):
-        """Lấy thông tin học kỳ và năm học hiện tại"""
-        current_date = datetime.now()
-        current_month = current_date.month
-        current_year = current_date.year
-        
-        # Xác định học kỳ dựa trên tháng hiện tại
-        if current_month >= 9 or current_month <= 1:
-            # Tháng 9-12 và tháng 1: HK1
-            current_semester = "HK1"
-            if current_month >= 9:
-                academic_year = current_year
-            else:
-                academic_year = current_year - 1
-        elif current_month >= 2 and current_month <= 6:
-            # Tháng 2-6: HK2
-            current_semester = "HK2"
-            academic_year = current_year - 1
-        else:
-            # Tháng 7-8: HK3 (học hè)
-            current_semester = "HK3"
-            academic_year = current_year - 1
-            
-        return current_semester, academic_year
-    
-    def get_current_week(self, hoc_ky, nam_hoc):
-        """Lấy tuần học hiện tại"""
-        try:
-            response = requests.get(
-                "http://localhost:8000/weeks/",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc}
-            )
-            if response.status_code == 200:
-                weeks = response.json()
-                today = datetime.now().date()
-                
-                for week in weeks:
-                    start_date = datetime.strptime(week["start_date"], "%Y-%m-%d").date()
-                    end_date = datetime.strptime(week["end_date"], "%Y-%m-%d").date()
-                    
-                    if start_date <= today <= end_date:
-                        return week["week"], start_date, end_date
-                        
-            return None, None, None
-        except Exception as e:
-            print(f"Error getting current week: {e}")
-            return None, None, None
-    
     def get_vietnamese_day_name(self, date):
         """Chuyển đổi ngày thành tên thứ tiếng Việt"""
         day_index = date.weekday()  # 0 = Monday, 6 = Sunday
@@ -571,9 +551,9 @@ class ActionGetScheduleWeek(Action):
             elif room.get("room_number"):
                 return f"P.{room['room_number']}"
         
-        # Nếu có room_id, fetch thông tin từ API
+        # Nếu có room_id, lấy thông tin đã prefetch từ API
         if item.get("room_id"):
-            room_info = fetch_room_info(item["room_id"])
+            room_info = room_cache.get(item["room_id"])
             formatted = format_room_display(room_info)
             if formatted:
                 return formatted
@@ -582,7 +562,7 @@ class ActionGetScheduleWeek(Action):
         
         return None
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -597,19 +577,17 @@ class ActionGetScheduleWeek(Action):
         
         try:
             # Lấy thông tin học kỳ hiện tại
-            hoc_ky, nam_hoc = self.get_current_semester_info()
-            current_week, start_date, end_date = self.get_current_week(hoc_ky, nam_hoc)
+            hoc_ky, nam_hoc = get_current_semester_info()
+            
+            current_week, start_date, end_date = await get_week_for_date(datetime.now().date(), hoc_ky, nam_hoc)
             
             if not current_week:
                 dispatcher.utter_message(text="⚠️ Không thể xác định tuần học hiện tại. Có thể đang trong kỳ nghỉ.")
                 return []
             
-            # Gọi API lấy lịch học sinh viên
-            headers = {"Authorization": f"Bearer {token}"}
-            response = requests.get(
-                "http://localhost:8000/student/schedules",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc},
-                headers=headers
+            # Gọi API lấy lịch học sinh viên của tuần hiện tại
+            response = await schedule_cache.get_student_schedules(
+                token, hoc_ky, nam_hoc, week=current_week
             )
             
             if response.status_code == 403:
@@ -622,15 +600,11 @@ class ActionGetScheduleWeek(Action):
                 dispatcher.utter_message(text="⚠️ Không thể tải lịch học. Vui lòng thử lại sau.")
                 return []
             
-            schedule_data = response.json()
-            
-            # Lọc lịch học tuần hiện tại
-            week_schedule = [
-                item for item in schedule_data 
-                if item.get("week") == current_week
-            ]
+            # Backend đã lọc theo tuần hiện tại
+            week_schedule = response.json()
             
             # Tạo tin nhắn trả về
+            await prefetch_room_info(week_schedule)
             message = self.format_week_schedule_message(week_schedule, current_week, start_date, end_date)
             dispatcher.utter_message(text=message)
             
@@ -647,31 +621,6 @@ class ActionGetScheduleTomorrow(Action):
     def name(self) -> Text:
         return "action_get_schedule_tomorrow"
     
-    def get_current_semester_info(self):
-        """Lấy thông tin học kỳ và năm học hiện tại"""
-        current_date = datetime.now()
-        current_month = current_date.month
-        current_year = current_date.year
-        
-        # Xác định học kỳ dựa trên tháng hiện tại
-        if current_month >= 9 or current_month <= 1:
-            # Tháng 9-12 và tháng 1: HK1
-            current_semester = "HK1"
-            if current_month >= 9:
-                academic_year = current_year
-            else:
-                academic_year = current_year - 1
-        elif current_month >= 2 and current_month <= 6:
-            # Tháng 2-6: HK2
-            current_semester = "HK2"
-            academic_year = current_year - 1
-        else:
-            # Tháng 7-8: HK3 (học hè)
-            current_semester = "HK3"
-            academic_year = current_year - 1
-            
-        return current_semester, academic_year
-    
     def get_tomorrow_vietnamese(self):
         """Lấy tên thứ tiếng Việt của ngày mai"""
         tomorrow = datetime.now() + timedelta(days=1)
@@ -679,28 +628,6 @@ class ActionGetScheduleTomorrow(Action):
         day_names = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "CN"]
         return day_names[day_index]
     
-    def get_week_for_date(self, target_date, hoc_ky, nam_hoc):
-        """Lấy tuần học cho ngày cụ thể"""
-        try:
-            response = requests.get(
-                "http://localhost:8000/weeks/",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc}
-            )
-            if response.status_code == 200:
-                weeks = response.json()
-                
-                for week in weeks:
-                    start_date = datetime.strptime(week["start_date"], "%Y-%m-%d").date()
-                    end_date = datetime.strptime(week["end_date"], "%Y-%m-%d").date()
-                    
-                    if start_date <= target_date <= end_date:
-                        return week["week"]
-                        
-            return None
-        except Exception as e:
-            print(f"Error getting week for date: {e}")
-            return None
-    
     def format_schedule_message(self, schedule_items, tomorrow_date):
         """Định dạng tin nhắn lịch học ngày mai"""
         if not schedule_items:
@@ -747,9 +674,9 @@ class ActionGetScheduleTomorrow(Action):
             elif room.get("room_number"):
                 return f"P.{room['room_number']}"
         
-        # Nếu có room_id, fetch thông tin từ API
+        # Nếu có room_id, lấy thông tin đã prefetch từ API
         if item.get("room_id"):
-            room_info = fetch_room_info(item["room_id"])
+            room_info = room_cache.get(item["room_id"])
             formatted = format_room_display(room_info)
             if formatted:
                 return formatted
@@ -758,7 +685,7 @@ class ActionGetScheduleTomorrow(Action):
         
         return None
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -773,24 +700,23 @@ class ActionGetScheduleTomorrow(Action):
         
         try:
             # Lấy thông tin học kỳ hiện tại
-            hoc_ky, nam_hoc = self.get_current_semester_info()
+            hoc_ky, nam_hoc = get_current_semester_info()
             
             # Tính ngày mai
             tomorrow_date = (datetime.now() + timedelta(days=1)).date()
-            tomorrow_week = self.get_week_for_date(tomorrow_date, hoc_ky, nam_hoc)
+            
+            # Lấy tuần của ngày mai và lịch học sinh viên song song
+            (tomorrow_week, _, _), response = await asyncio.gather(
+                get_week_for_date(tomorrow_date, hoc_ky, nam_hoc),
+                schedule_cache.get_student_schedules(
+                    token, hoc_ky, nam_hoc, date=tomorrow_date.isoformat()
+                ),
+            )
             
             if not tomorrow_week:
                 dispatcher.utter_message(text="⚠️ Không thể xác định tuần học cho ngày mai. Có thể ngày mai là ngày nghỉ hoặc ngoài lịch học.")
                 return []
             
-            # Gọi API lấy lịch học sinh viên
-            headers = {"Authorization": f"Bearer {token}"}
-            response = requests.get(
-                "http://localhost:8000/student/schedules",
-                params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc},
-                headers=headers
-            )
-            
             if response.status_code == 403:
                 dispatcher.utter_message(text="🚫 Bạn không có quyền truy cập lịch học sinh viên.")
                 return []
@@ -801,16 +727,11 @@ class ActionGetScheduleTomorrow(Action):
                 dispatcher.utter_message(text="⚠️ Không thể tải lịch học. Vui lòng thử lại sau.")
                 return []
             
-            schedule_data = response.json()
-            
-            # Lọc lịch học ngày mai
-            tomorrow_vietnamese = self.get_tomorrow_vietnamese()
-            tomorrow_schedule = [
-                item for item in schedule_data 
-                if item.get("day") == tomorrow_vietnamese and item.get("week") == tomorrow_week
-            ]
+            # Backend đã lọc theo ngày mai
+            tomorrow_schedule = response.json()
             
             # Tạo tin nhắn trả về
+            await prefetch_room_info(tomorrow_schedule)
             message = self.format_schedule_message(tomorrow_schedule, tomorrow_date)
             dispatcher.utter_message(text=message)
             
@@ -827,12 +748,79 @@ class ActionGetNextClass(Action):
     def name(self) -> Text:
         return "action_get_next_class"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    def get_class_date(self, item):
+        """Ngày học của tiết (tuần, thứ) nếu có module lịch"""
+        if academic_calendar is None:
+            return None
+        return academic_calendar.date_of_slot(item.get("hoc_ky"), item.get("nam_hoc"), item.get("week"), item.get("day"))
+    
+    def format_next_class_message(self, item):
+        """Định dạng tin nhắn tiết học tiếp theo"""
+        subject_name = item.get("subject_name") or (item.get("subject", {}).get("name") if item.get("subject") else None) or item.get("subject_id", "Không rõ môn")
+        teacher_name = (item.get("teacher_profile", {}).get("name") if item.get("teacher_profile") else None) or item.get("teacher_name", "Không rõ GV")
+        room_info = format_room_display(room_cache.get(item["room_id"])) if item.get("room_id") else None
+        format_info = "🏫 Trực tiếp" if item.get("hinh_thuc") == "truc_tiep" else "💻 Trực tuyến"
+        
+        when = f"{item.get('period', 'Không rõ ca')}, {item.get('day', '')}"
+        class_date = self.get_class_date(item)
+        if class_date:
+            when += f" {class_date.strftime('%d/%m/%Y')}"
+        
+        message = f"⏰ **Tiết học tiếp theo:** {when} (tuần {item.get('week')})\n\n"
+        message += f"📚 {subject_name}\n"
+        message += f"👨‍🏫 GV: {teacher_name}\n"
+        if room_info:
+            message += f"🏠 {room_info}\n"
+        message += format_info
+        return message
+    
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
-        dispatcher.utter_message(text="⏰ Chức năng xem tiết học tiếp theo đang được phát triển. Hiện tại bạn có thể hỏi lịch học hôm nay.")
-        return []
+        # Lấy token từ metadata hoặc slot
+        latest_message = tracker.latest_message
+        metadata = latest_message.get('metadata', {}) if latest_message else {}
+        token = metadata.get('auth_token') or tracker.get_slot("auth_token")
+        
+        if not token:
+            dispatcher.utter_message(text="🔐 Để xem tiết học tiếp theo, bạn cần đăng nhập vào hệ thống trước. Vui lòng đăng nhập qua website hoặc app.")
+            return []
+        
+        try:
+            hoc_ky, nam_hoc = get_current_semester_info()
+            headers = {"Authorization": f"Bearer {token}"}
+            params = {"hoc_ky": hoc_ky, "nam_hoc": nam_hoc}
+            
+            # Backend tra tiết tiếp theo bằng một truy vấn LIMIT 1 theo slot_key
+            response = await async_backend_client.get("/student/schedules/next", params=params, headers=headers)
+            if response.status_code == 403:
+                # Không phải sinh viên: thử lịch giảng dạy của giáo viên
+                response = await async_backend_client.get("/teacher/schedules/next", params=params, headers=headers)
+            
+            if response.status_code == 403:
+                dispatcher.utter_message(text="🚫 Bạn không có quyền truy cập lịch học.")
+                return []
+            elif response.status_code == 404:
+                dispatcher.utter_message(text="❌ Không tìm thấy thông tin sinh viên hoặc chưa được phân lớp.")
+                return []
+            elif response.status_code != 200:
+                dispatcher.utter_message(text="⚠️ Không thể tải lịch học. Vui lòng thử lại sau.")
+                return []
+            
+            item = response.json()
+            if not item:
+                dispatcher.utter_message(text="🎉 Bạn không còn tiết học nào trong học kỳ này.")
+                return []
+            
+            await prefetch_room_info([item])
+            dispatcher.utter_message(text=self.format_next_class_message(item))
+            return []
+            
+        except Exception as e:
+            print(f"Error in ActionGetNextClass: {e}")
+            dispatcher.utter_message(text="⚠️ Có lỗi xảy ra khi lấy tiết học tiếp theo. Vui lòng thử lại sau.")
+            return []
 
 
 class ActionRAGQuery(Action):
@@ -841,7 +829,7 @@ class ActionRAGQuery(Action):
     def name(self) -> Text:
         return "action_rag_query"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -867,7 +855,9 @@ class ActionRAGQuery(Action):
             
             # Thực hiện truy vấn RAG qua bridge
             print("🚀 Calling rag_bridge.query()...")
-            response = rag_bridge.query(user_message)
+            # RAGBridge dùng requests (blocking) nên chạy trong thread pool, không chặn event loop
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, rag_bridge.query, user_message)
             print(f"📤 RAG response received: {response[:100]}...")
             
             # Gửi phản hồi
@@ -929,7 +919,7 @@ class ActionInitializeRAG(Action):
     def name(self) -> Text:
         return "action_initialize_rag"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -939,7 +929,8 @@ class ActionInitializeRAG(Action):
                 return []
             
             # Kiểm tra trạng thái
-            if rag_bridge.is_ready():
+            ready = await asyncio.get_running_loop().run_in_executor(None, rag_bridge.is_ready)
+            if ready:
                 dispatcher.utter_message(text="✅ RAG system đã sẵn sàng!")
             else:
                 dispatcher.utter_message(text="⚠️ RAG system chưa sẵn sàng. Vui lòng kiểm tra external API.")
@@ -0,0 +1,28 @@
+"""
+Nạp module lịch học kỳ của backend (backend/academic_calendar.py) để action server tra tuần học tại chỗ
+Nếu không tìm thấy file (chatbot chạy tách khỏi backend) thì academic_calendar = None và các action dùng HTTP /weeks/
+"""
+import importlib.util
+import os
+
+DEFAULT_CALENDAR_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend", "academic_calendar.py"
+)
+
+
+def load_academic_calendar(path: str = None):
+    path = path or os.getenv("ACADEMIC_CALENDAR_PATH", DEFAULT_CALENDAR_PATH)
+    try:
+        spec = importlib.util.spec_from_file_location("academic_calendar", path)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"cannot load {path}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        print(f"✅ Academic calendar loaded from {path}")
+        return module
+    except (OSError, ImportError) as e:
+        print(f"⚠️ Academic calendar not available, using /weeks/ API: {e}")
+        return None
+
+
+academic_calendar = load_academic_calendar()
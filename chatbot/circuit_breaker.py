@@ -0,0 +1,99 @@
+"""
+Circuit breaker cho các lời gọi tới RAG server
+Dùng chung một instance cho mọi action trong cùng process action server
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+
+
+class CircuitBreaker:
+    """Circuit breaker 3 trạng thái: closed -> open -> half_open -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, failure_window: float = 60.0,
+                 recovery_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold  # Số lỗi trong cửa sổ để mở mạch
+        self.failure_window = failure_window        # Cửa sổ đếm lỗi (giây)
+        self.recovery_timeout = recovery_timeout    # Thời gian mở mạch trước khi thử lại (giây)
+        self.clock = clock                          # Nguồn thời gian (giây), test truyền đồng hồ giả
+
+        self.state = self.CLOSED
+        self.failures = deque()
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_request(self) -> str:
+        """
+        Quyết định cho request sắp gửi:
+        - CLOSED: gửi bình thường
+        - HALF_OPEN: caller được chọn để probe health trước khi gửi
+        - OPEN: fail fast, không gọi server
+        """
+        with self.lock:
+            now = self.clock()
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.recovery_timeout:
+                    return self.OPEN
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # Chỉ một request được probe, các request khác vẫn fail fast
+                if self.probe_in_flight and now - self.probe_started_at < self.recovery_timeout:
+                    return self.OPEN
+                self.probe_in_flight = True
+                self.probe_started_at = now
+                return self.HALF_OPEN
+
+            return self.CLOSED
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures.clear()
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+
+            self.failures.append(now)
+            while self.failures and now - self.failures[0] > self.failure_window:
+                self.failures.popleft()
+            if len(self.failures) >= self.failure_threshold:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probe_in_flight = False
+        self.failures.clear()
+        print(f"🔴 Circuit breaker opened, fail fast for {self.recovery_timeout:.0f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "state": self.state,
+                "recent_failures": len(self.failures),
+                "failure_threshold": self.failure_threshold,
+                "opened_at": self.opened_at,
+            }
+
+
+# Global instance dùng chung cho mọi action trong process
+rag_circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("RAG_CB_FAILURE_THRESHOLD", "3")),
+    failure_window=float(os.getenv("RAG_CB_FAILURE_WINDOW", "60")),
+    recovery_timeout=float(os.getenv("RAG_CB_RECOVERY_TIMEOUT", "30")),
+)
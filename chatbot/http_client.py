@@ -0,0 +1,174 @@
+"""
+HTTP client dùng chung cho các action và RAGBridge
+Mỗi service có một requests.Session với connection pool keep-alive, timeout theo endpoint
+và retry có jitter cho các request idempotent (GET/HEAD).
+Các action async dùng AsyncServiceClient (aiohttp) với cùng chính sách timeout/retry
+"""
+import asyncio
+import json
+import os
+import random
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = Tuple[float, float]  # (connect, read)
+
+# Timeout mặc định và theo prefix endpoint (connect, read)
+DEFAULT_TIMEOUT: Timeout = (3.05, 10)
+ENDPOINT_TIMEOUTS: Dict[str, Timeout] = {
+    "/health": (2, 5),
+    "/weeks/": (2, 5),
+    "/manager/rooms/public": (2, 5),
+    "/rag/query": (3.05, 30),
+}
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD"})
+
+
+class JitterRetry(Retry):
+    """Retry với full jitter để các worker không retry cùng lúc"""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class ServiceClient:
+    """Session keep-alive tới một service"""
+
+    def __init__(self, base_url: str, pool_maxsize: int = 10, retries: int = 2,
+                 backoff_factor: float = 0.3, status_forcelist=(502, 503, 504)):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+        retry = JitterRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=IDEMPOTENT_METHODS,  # POST không được retry tự động
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @staticmethod
+    def timeout_for(path: str) -> Timeout:
+        for prefix, timeout in ENDPOINT_TIMEOUTS.items():
+            if path.startswith(prefix):
+                return timeout
+        return DEFAULT_TIMEOUT
+
+    def request(self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        return self.session.request(method, self.url(path), timeout=timeout or self.timeout_for(path), **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# Global clients - tạo sau khi .env đã được load
+backend_client = ServiceClient(
+    os.getenv("BACKEND_URL", "http://localhost:8000"),
+    pool_maxsize=int(os.getenv("BACKEND_POOL_SIZE", "20")),
+)
+# RAG server: chỉ retry lỗi kết nối, 503 (RAG chưa sẵn sàng) trả về ngay cho caller
+rag_client = ServiceClient(
+    os.getenv("RAG_SERVER_URL", "http://localhost:5001"),
+    pool_maxsize=int(os.getenv("RAG_POOL_SIZE", "10")),
+    retries=1,
+    status_forcelist=(),
+)
+
+
+class AsyncResponse:
+    """Response đã đọc xong body, dùng giống requests.Response"""
+
+    def __init__(self, status_code: int, content: bytes, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncServiceClient:
+    """
+    Client aiohttp dùng chung cho các action async
+    Session được tạo lazy trên event loop đang chạy và giữ kết nối keep-alive qua các lượt chat
+    """
+
+    def __init__(self, base_url: str, limit: int = 20, retries: int = 2,
+                 backoff_factor: float = 0.3, status_forcelist=(502, 503, 504),
+                 keepalive_timeout: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.limit = limit
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = frozenset(status_forcelist)
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._loop = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+
+    async def request(self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs) -> AsyncResponse:
+        connect, read = timeout or ServiceClient.timeout_for(path)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        # Chỉ retry request idempotent, giống ServiceClient
+        attempts = self.retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                async with self._get_session().request(method, url, timeout=client_timeout, **kwargs) as resp:
+                    content = await resp.read()
+                    if resp.status not in self.status_forcelist or last_attempt:
+                        return AsyncResponse(resp.status, content, resp.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def get(self, path: str, **kwargs) -> AsyncResponse:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> AsyncResponse:
+        return await self.request("POST", path, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+async_backend_client = AsyncServiceClient(
+    backend_client.base_url,
+    limit=int(os.getenv("BACKEND_POOL_SIZE", "20")),
+)
@@ -8,17 +8,25 @@ import requests
 import json
 from typing import Optional
 
+from circuit_breaker import CircuitBreaker, rag_circuit_breaker
+from http_client import ServiceClient, rag_client
+from tracing import bridge_tracer, REQUEST_ID_HEADER
+
 class RAGBridge:
-    def __init__(self):
-        # RAG server URL - configurable via environment
-        self.rag_server_url = os.getenv('RAG_SERVER_URL', 'http://localhost:5001')
-        self.timeout = 30
+    def __init__(self, circuit_breaker: Optional[CircuitBreaker] = None,
+                 client: Optional[ServiceClient] = None):
+        # Session keep-alive tới RAG server (URL lấy từ RAG_SERVER_URL)
+        self.client = client or rag_client
+        self.rag_server_url = self.client.base_url
+        # Mặc định dùng chung breaker của process để mọi action cùng thấy trạng thái server
+        self.circuit_breaker = circuit_breaker or rag_circuit_breaker
         print(f"🔗 RAG Bridge initialized with server: {self.rag_server_url}")
         
-    def _check_server_health(self) -> bool:
+    def _check_server_health(self, request_id: Optional[str] = None) -> bool:
         """Kiểm tra RAG server có hoạt động không"""
         try:
-            response = requests.get(f"{self.rag_server_url}/health", timeout=5)
+            headers = {REQUEST_ID_HEADER: request_id} if request_id else None
+            response = self.client.get("/health", headers=headers)
             if response.status_code == 200:
                 health_data = response.json()
                 print(f"✅ RAG server health: {health_data}")
@@ -32,23 +40,40 @@ class RAGBridge:
     
     def query(self, question: str) -> str:
         """Gửi query tới RAG server và nhận response"""
+        with bridge_tracer.trace() as trace:
+            return self._query(question, trace)
+    
+    def _query(self, question: str, trace) -> str:
+        request_id = trace.request_id
+        breaker = self.circuit_breaker
+        state = breaker.before_request()
+        
+        if state == CircuitBreaker.OPEN:
+            # Server vừa lỗi liên tục: trả lời dự phòng ngay, không tốn RTT
+            print(f"⚡ RAGBridge [{request_id}]: Circuit open, using fallback response")
+            return self._get_fallback_response(question)
+        
         try:
-            print(f"🔍 RAGBridge: Sending query to server: {question}")
+            print(f"🔍 RAGBridge [{request_id}]: Sending query to server: {question}")
             
-            # Kiểm tra server trước khi gửi query
-            if not self._check_server_health():
-                return "❌ RAG server không khả dụng. Vui lòng thử lại sau."
+            # Chỉ kiểm tra health khi mạch half-open (probe sau thời gian nghỉ)
+            if state == CircuitBreaker.HALF_OPEN:
+                with trace.span("health_check"):
+                    healthy = self._check_server_health(request_id)
+                if not healthy:
+                    breaker.record_failure()
+                    return self._get_fallback_response(question)
             
             # Gửi POST request tới RAG server
             payload = {"query": question}
-            response = requests.post(
-                f"{self.rag_server_url}/rag/query",
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=self.timeout
-            )
+            with trace.span("rag_request"):
+                response = self.client.post(
+                    "/rag/query",
+                    json=payload,
+                    headers={'Content-Type': 'application/json', REQUEST_ID_HEADER: request_id},
+                )
             
-            print(f"📡 RAGBridge: Server response status: {response.status_code}")
+            print(f"📡 RAGBridge [{request_id}]: Server response status: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -56,30 +81,36 @@ class RAGBridge:
                 source = data.get('source', 'unknown')
                 status = data.get('status', 'unknown')
                 
-                print(f"✅ RAGBridge: Response received from {source} (status: {status})")
+                print(f"✅ RAGBridge [{request_id}]: Response received from {source} (status: {status})")
+                breaker.record_success()
                 return rag_response
                 
             elif response.status_code == 503:
                 # Server hoạt động nhưng RAG system không sẵn sàng
+                breaker.record_success()
                 data = response.json()
                 fallback_response = data.get('response', self._get_fallback_response(question))
-                print(f"⚠️ RAGBridge: Using fallback response (RAG system not ready)")
+                print(f"⚠️ RAGBridge [{request_id}]: Using fallback response (RAG system not ready)")
                 return fallback_response
                 
             else:
-                print(f"❌ RAGBridge: Server error {response.status_code}: {response.text}")
+                print(f"❌ RAGBridge [{request_id}]: Server error {response.status_code}: {response.text}")
+                breaker.record_failure()
                 return self._get_fallback_response(question)
                 
         except requests.exceptions.Timeout:
-            print(f"⏱️ RAGBridge: Timeout connecting to RAG server")
+            print(f"⏱️ RAGBridge [{request_id}]: Timeout connecting to RAG server")
+            breaker.record_failure()
             return "⏱️ Timeout khi kết nối tới hệ thống RAG. Vui lòng thử lại."
             
         except requests.exceptions.ConnectionError:
-            print(f"🔌 RAGBridge: Cannot connect to RAG server at {self.rag_server_url}")
+            print(f"🔌 RAGBridge [{request_id}]: Cannot connect to RAG server at {self.rag_server_url}")
+            breaker.record_failure()
             return f"🔌 Không thể kết nối tới RAG server tại {self.rag_server_url}. Vui lòng kiểm tra server."
             
         except Exception as e:
-            print(f"❌ RAGBridge: Unexpected error: {e}")
+            print(f"❌ RAGBridge [{request_id}]: Unexpected error: {e}")
+            breaker.record_failure()
             return f"⚠️ Lỗi không mong muốn: {str(e)}"
     
     def _get_fallback_response(self, query: str) -> str:
@@ -110,7 +141,10 @@ class RAGBridge:
     
     def is_ready(self) -> bool:
         """Kiểm tra RAG system đã sẵn sàng"""
-        return self._check_server_health()
+        ready = self._check_server_health()
+        if ready:
+            self.circuit_breaker.record_success()
+        return ready
 
 # Global instance
 rag_bridge = RAGBridge()
@@ -0,0 +1,104 @@
+"""
+Cache lịch học trong action server
+- Lịch sinh viên: LRU + TTL theo (token, hoc_ky, nam_hoc), mỗi entry giữ response của từng phạm vi (ngày/tuần)
+  Trong thời gian fresh_ttl trả từ cache không gọi backend; sau đó revalidate bằng If-None-Match (304)
+  Khi X-Schedule-Version đổi (lịch của lớp vừa thay đổi) mọi phạm vi cũ của entry bị bỏ
+- Lịch tuần /weeks/: chỉ phụ thuộc (hoc_ky, nam_hoc) nên cache lâu
+"""
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from ttl_cache import TTLCache
+
+SCHEDULE_VERSION_HEADER = "X-Schedule-Version"
+
+
+def token_digest(token: str) -> str:
+    """Key cache theo hash của token - không dùng claim chưa xác thực trong JWT"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class ScheduleCache:
+    """Cache lịch học sinh viên và lịch tuần cho các action"""
+
+    def __init__(self, client, maxsize: int = 512, fresh_ttl: float = 60.0,
+                 max_age: float = 3600.0, weeks_ttl: float = 86400.0):
+        self.client = client
+        self.fresh_ttl = fresh_ttl  # Trong khoảng này không hỏi lại backend
+        self.entries = TTLCache(maxsize=maxsize, ttl=max_age)  # Giữ ETag để revalidate tới max_age
+        self.weeks = TTLCache(maxsize=64, ttl=weeks_ttl)
+        self.revalidated = 0
+
+    async def get_student_schedules(self, token: str, hoc_ky: str, nam_hoc: int, **scope):
+        """GET /student/schedules qua cache; trả về response (AsyncResponse) như khi gọi trực tiếp"""
+        key = (token_digest(token), hoc_ky, nam_hoc)
+        scope_key = tuple(sorted(scope.items()))
+        entry = self.entries.get(key)
+        cached = entry["scopes"].get(scope_key) if entry else None
+        now = time.monotonic()
+
+        if cached and now - cached[0] < self.fresh_ttl:
+            return cached[1]
+
+        headers = {"Authorization": f"Bearer {token}"}
+        if cached and cached[1].headers.get("ETag"):
+            headers["If-None-Match"] = cached[1].headers["ETag"]
+
+        response = await self.client.get(
+            "/student/schedules",
+            params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc, **scope},
+            headers=headers
+        )
+
+        if response.status_code == 304 and cached:
+            self.revalidated += 1
+            entry["scopes"][scope_key] = (now, cached[1])
+            self.entries.set(key, entry)
+            return cached[1]
+
+        if response.status_code == 200:
+            version = response.headers.get(SCHEDULE_VERSION_HEADER)
+            if entry is None or entry["version"] != version:
+                # Lịch của lớp đã thay đổi: bỏ mọi phạm vi cũ
+                entry = {"version": version, "scopes": {}}
+            entry["scopes"][scope_key] = (now, response)
+            self.entries.set(key, entry)
+        elif entry is not None:
+            # 401/403/404: token hết hạn hoặc sinh viên đổi lớp, không giữ dữ liệu cũ
+            self.entries.pop(key)
+
+        return response
+
+    async def get_weeks(self, hoc_ky: str, nam_hoc: int) -> Optional[List[Dict[str, Any]]]:
+        """Danh sách tuần của học kỳ từ /weeks/ (cache theo hoc_ky, nam_hoc)"""
+        key = (hoc_ky, nam_hoc)
+        weeks = self.weeks.get(key)
+        if weeks is not None:
+            return weeks
+
+        response = await self.client.get("/weeks/", params={"hoc_ky": hoc_ky, "nam_hoc": nam_hoc})
+        if response.status_code != 200:
+            return None
+        weeks = response.json()
+        if isinstance(weeks, list):
+            self.weeks.set(key, weeks)
+            return weeks
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "schedules": self.entries.get_stats(),
+            "weeks": self.weeks.get_stats(),
+            "revalidated": self.revalidated,
+        }
+
+
+def create_schedule_cache(client) -> ScheduleCache:
+    return ScheduleCache(
+        client,
+        maxsize=int(os.getenv("SCHEDULE_CACHE_SIZE", "512")),
+        fresh_ttl=float(os.getenv("SCHEDULE_CACHE_FRESH_TTL", "60")),
+        max_age=float(os.getenv("SCHEDULE_CACHE_MAX_AGE", "3600")),
+    )
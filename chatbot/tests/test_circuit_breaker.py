@@ -0,0 +1,76 @@
+"""
+Unit test cho circuit breaker của RAG server, dùng đồng hồ giả thay vì chờ thời gian thật
+    pytest tests/test_circuit_breaker.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def make_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, failure_window=60, recovery_timeout=30, clock=clock)
+    return breaker, clock
+
+
+def open_breaker(breaker, clock):
+    for _ in range(3):
+        assert breaker.before_request() == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        clock.advance(1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_closed_open_half_open_closed():
+    breaker, clock = make_breaker()
+    open_breaker(breaker, clock)
+
+    clock.advance(10)
+    assert breaker.before_request() == CircuitBreaker.OPEN  # Còn trong recovery_timeout: fail fast
+
+    clock.advance(30)
+    assert breaker.before_request() == CircuitBreaker.HALF_OPEN  # Caller này được probe
+    assert breaker.before_request() == CircuitBreaker.OPEN       # Các caller khác vẫn fail fast
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_request() == CircuitBreaker.CLOSED
+    assert breaker.get_stats()["recent_failures"] == 0
+
+
+def test_failure_in_half_open_reopens():
+    breaker, clock = make_breaker()
+    open_breaker(breaker, clock)
+
+    clock.advance(31)
+    assert breaker.before_request() == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()  # Một lỗi khi probe là đủ để mở lại
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()["opened_at"] == clock.now
+    clock.advance(29)
+    assert breaker.before_request() == CircuitBreaker.OPEN
+    clock.advance(1)
+    assert breaker.before_request() == CircuitBreaker.HALF_OPEN
+
+
+def test_failures_outside_window_do_not_open():
+    breaker, clock = make_breaker()
+    for _ in range(5):
+        breaker.record_failure()
+        clock.advance(40)  # Mỗi lần chỉ còn tối đa 2 lỗi trong cửa sổ 60 giây
+    assert breaker.state == CircuitBreaker.CLOSED
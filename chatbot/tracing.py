@@ -0,0 +1,86 @@
+"""
+Tracing phía chatbot: sinh request ID cho mỗi câu hỏi RAG và ghi span ra file JSON-lines
+Request ID được gửi sang RAG server qua header X-Request-ID (cả /health và /rag/query) để nối hai đầu trace
+Span ở đây (health_check, rag_request) đo từ phía chatbot, gồm cả mạng, và chỉ nằm trong file này
+(RAG_BRIDGE_TRACE_FILE); /rag/metrics của RAG server tổng hợp span phía server, trong đó có health_check
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class Trace:
+    """Các span của một lần gọi RAG"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            span = {"name": name, "duration_ms": round((time.perf_counter() - start) * 1000, 3)}
+            if attributes:
+                span["attributes"] = attributes
+            if error:
+                span["error"] = error
+            self.spans.append(span)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+
+class BridgeTracer:
+    """Ghi trace của RAGBridge ra file JSON-lines cục bộ"""
+
+    def __init__(self, sink_path: Optional[str] = None):
+        self.sink_path = sink_path or os.getenv("RAG_BRIDGE_TRACE_FILE", "traces/rag_bridge.jsonl")
+        self.enabled = os.getenv("RAG_TRACING", "1") != "0"
+        self.lock = threading.Lock()
+        self._sink = None
+
+    @contextmanager
+    def trace(self, request_id: Optional[str] = None):
+        trace = Trace(request_id or uuid.uuid4().hex)
+        try:
+            yield trace
+        finally:
+            self._write(trace)
+
+    def _write(self, trace: Trace):
+        if not self.enabled:
+            return
+        record = {
+            "request_id": trace.request_id,
+            "timestamp": trace.started_at,
+            "total_ms": round(trace.elapsed_ms(), 3),
+            "spans": trace.spans,
+        }
+        with self.lock:
+            try:
+                if self._sink is None:
+                    os.makedirs(os.path.dirname(self.sink_path) or ".", exist_ok=True)
+                    self._sink = open(self.sink_path, "a", encoding="utf-8", buffering=1)
+                self._sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️ Tracing disabled, cannot write {self.sink_path}: {e}")
+                self.enabled = False
+
+
+# Global tracer instance
+bridge_tracer = BridgeTracer()
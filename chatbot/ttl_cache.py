@@ -0,0 +1,63 @@
+"""
+Cache trong process cho action server: LRU có giới hạn số phần tử và TTL cho từng entry
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """LRU cache với thời gian sống cố định cho mỗi entry"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self.lock:
+            self.data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            entry = self.data.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.data.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def get_stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }